@@ -0,0 +1,103 @@
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+import os
+import random
+
+from module.db import DBController, calc_rule_amount
+from module.db.epoch import to_epoch
+from module.db.period import get_period_key
+
+
+PASSWORD = 'password'  # 生成するユーザー共通のパスワード
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """ベンチマーク用の合成データの規模を表すクラス"""
+    users: int = 100
+    shifts_per_user: int = 1000
+    invalid_ratio: float = 0.2  # 無効化(論理削除)されたシフトの割合
+    places_per_user: int = 3
+    start: datetime = datetime(2020, 1, 1)
+    seed: int = 0
+
+
+def get_username(index: int) -> str:
+    """生成したユーザーのユーザー名を取得します。"""
+    return f'user{index:06d}'
+
+
+def generate(database: str, spec: DatasetSpec = DatasetSpec(), *, overwrite: bool = True) -> DBController:
+    """合成データを作成したデータベースを作成し、そのDBControllerを返します。"""
+    if overwrite:
+        for path in (database, f'{database}-wal', f'{database}-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    db = DBController(database)
+    rng = random.Random(spec.seed)
+    conn = db.conn
+
+    conn.executemany('''
+        INSERT INTO users(username, password, closing_day, goal_amount)
+        VALUES (?, ?, ?, ?)
+    ''',
+    ((get_username(i), PASSWORD, rng.randint(1, 31), 100000) for i in range(spec.users)))
+    closing_days = {row['id']: row['closing_day'] for row in conn.execute('SELECT id, closing_day FROM users ORDER BY id')}
+    user_ids = list(closing_days)
+
+    conn.executemany('''
+        INSERT INTO places(user_id, name)
+        VALUES (?, ?)
+    ''',
+    ((user_id, f'勤務先{j}') for user_id in user_ids for j in range(spec.places_per_user)))
+
+    for user_id in user_ids:
+        conn.executemany('''
+            INSERT INTO shifts (
+                user_id,
+                place,
+                title,
+                start_datetime,
+                end_datetime,
+                break_time,
+                hourly_wage,
+                amount,
+                period_key,
+                is_valid
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        _generate_shifts(rng, user_id, closing_days[user_id], spec))
+    conn.commit()
+
+    return db
+
+
+def _generate_shifts(rng: random.Random, user_id: int, closing_day: int, spec: DatasetSpec):
+    """1人分のシフトを開始日時順に重ならないように生成します。"""
+    current = spec.start
+    for _ in range(spec.shifts_per_user):
+        day = datetime.combine(current.date(), time()) + timedelta(days=rng.randint(0, 2))
+        start_datetime = day.replace(hour=rng.randint(6, 18), minute=rng.choice((0, 15, 30, 45)))
+        if start_datetime < current:
+            start_datetime += timedelta(days=1)
+        end_datetime = start_datetime + timedelta(hours=rng.randint(2, 9))
+        current = end_datetime
+
+        start_at = to_epoch(start_datetime)
+        end_at = to_epoch(end_datetime)
+        break_seconds = rng.choice((0, 1800, 3600))
+        hourly_wage = rng.randint(1000, 1500)
+        yield (
+            user_id,
+            f'勤務先{rng.randrange(spec.places_per_user)}',
+            'シフト',
+            start_at,
+            end_at,
+            break_seconds,
+            hourly_wage,
+            calc_rule_amount(None, start_at, end_at, break_seconds, hourly_wage),
+            get_period_key(end_datetime, closing_day),
+            0 if rng.random() < spec.invalid_ratio else 1,
+        )
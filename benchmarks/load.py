@@ -0,0 +1,269 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import json
+import multiprocessing
+import os
+import platform
+import sqlite3
+import tempfile
+import time as time_module
+
+from .datagen import DatasetSpec, PASSWORD, generate, get_username
+
+
+DEFAULT_OUTPUT = 'load.json'  # 結果を書き出すJSONファイル
+
+STEPS = ('open', 'login', 'home', 'shift', 'add_weekly', 'delete')  # 1セッションで実行する操作の順序
+
+WEEKS = 4  # add_weeklyで登録する週数
+
+LOCK_MESSAGES = ('database is locked', 'database table is locked', 'database is busy')  # ロックによるエラーの判定に使うメッセージ
+
+LOAD_SCRIPT = '''
+import os
+
+import streamlit as st
+
+from module.page import home
+
+if home.PIE_FONTPATH is not None and not os.path.exists(home.PIE_FONTPATH):
+    home.PIE_FONTPATH = None
+
+# ダイアログ内のフォーム送信はAppTestから操作できないため、送信時と同じ書き込みを再実行の前に行う
+action = st.session_state.pop('load_action', None)
+if action is not None:
+    from datetime import time, timedelta
+
+    from module.db import Recurrence, WEEKLY, get_db_controller
+
+    db = get_db_controller()
+    user_id = st.session_state['user_id']
+    start_datetime = action['start_datetime']
+    if action['type'] == 'add_weekly':
+        results = db.add_shifts_bulk(
+            user_id,
+            action['place'],
+            '負荷試験',
+            start_datetime,
+            start_datetime + timedelta(hours=8),
+            time(1, 0),
+            1000,
+            Recurrence(WEEKLY, (start_datetime + timedelta(weeks=action['weeks'] - 1)).date()),
+        )
+        if st.session_state['shifts'] is not None:
+            st.session_state['shifts'].refresh_range(db, results[0].start_datetime, results[-1].end_datetime)
+    else:
+        shifts = db.get_shifts(user_id, start_datetime, start_datetime + timedelta(days=1))
+        if shifts:
+            db.delete_shift(shifts[0].id)
+            if st.session_state['shifts'] is not None:
+                st.session_state['shifts'].remove(shifts[0].id)
+
+import main
+
+main.main()
+'''  # AppTestで実行するアプリのスクリプト
+
+
+@dataclass
+class StepStats:
+    """1種類の操作の実行時間とエラー件数を集計するクラス"""
+    timings: list[float] = field(default_factory=list)
+    errors: int = 0
+    lock_errors: int = 0
+
+    def record(self, milliseconds: float, messages: list[str]) -> None:
+        """操作の実行時間と、発生した例外のメッセージを記録します。"""
+        self.timings.append(milliseconds)
+        if messages:
+            self.errors += 1
+            if any(lock_message in message for message in messages for lock_message in LOCK_MESSAGES):
+                self.lock_errors += 1
+
+    def merge(self, other: 'StepStats') -> None:
+        """他のセッションの集計を足し合わせます。"""
+        self.timings.extend(other.timings)
+        self.errors += other.errors
+        self.lock_errors += other.lock_errors
+
+    def summary(self) -> dict[str, float]:
+        """実行時間(ミリ秒)のパーセンタイルとエラー件数を取得します。"""
+        timings = sorted(self.timings)
+        return {
+            'runs': len(timings),
+            'p50_ms': _percentile(timings, 0.50),
+            'p95_ms': _percentile(timings, 0.95),
+            'p99_ms': _percentile(timings, 0.99),
+            'max_ms': timings[-1] if timings else 0.0,
+            'errors': self.errors,
+            'lock_errors': self.lock_errors,
+        }
+
+
+def run_session(session: int, iterations: int, warmup: int, users: int, timeout: float, barrier) -> dict[str, StepStats]:
+    """1つのセッションとして、ログインから週ごとのシフトの追加と削除までをiterations回繰り返し、操作ごとの集計を返します。
+
+    最初のwarmup回はモジュールの読み込みやフォントのキャッシュ作成を済ませるためのもので、集計に含めません。
+    """
+    from streamlit.testing.v1 import AppTest
+
+    def run_flow(index: int, steps: dict[str, StepStats]) -> None:
+        # 既存のシフトや他のセッションと重ならない未来の期間に書き込む
+        start_datetime = datetime(2100, 1, 1, 9) + timedelta(days=(session * (warmup + iterations) + index) * 7 * (WEEKS + 1))
+        at = AppTest.from_string(LOAD_SCRIPT, default_timeout=timeout)
+
+        def step(name: str, prepare=None) -> bool:
+            start = time_module.perf_counter()
+            try:
+                if prepare is not None:
+                    prepare()
+                at.run()
+                messages = [exception.message for exception in at.exception]
+            except Exception as e:
+                messages = [str(e)]
+            steps[name].record((time_module.perf_counter() - start) * 1000, messages)
+            return not messages
+
+        def login() -> None:
+            at.text_input(key='login_username').input(get_username((session + index) % users))
+            at.text_input(key='login_password').input(PASSWORD)
+            at.button[0].click()
+
+        def open_shift_page() -> None:
+            at.sidebar.selectbox[0].set_value('シフト')
+
+        def add_weekly() -> None:
+            at.session_state['load_action'] = {
+                'type': 'add_weekly',
+                'place': '勤務先0',
+                'start_datetime': start_datetime,
+                'weeks': WEEKS,
+            }
+
+        def delete() -> None:
+            at.session_state['load_action'] = {'type': 'delete', 'start_datetime': start_datetime}
+
+        # 失敗した操作の後は、そのセッションの残りの操作を行わない
+        if not step('open'):
+            return
+        if not step('login', login) or 'user_id' not in at.session_state:
+            return
+        if not step('home'):
+            return
+        if not step('shift', open_shift_page):
+            return
+        if not step('add_weekly', add_weekly):
+            return
+        step('delete', delete)
+
+    for index in range(warmup):
+        run_flow(index, {step: StepStats() for step in STEPS})
+
+    # 全セッションの準備ができてから同時に開始する
+    barrier.wait()
+
+    steps = {step: StepStats() for step in STEPS}
+    for index in range(warmup, warmup + iterations):
+        run_flow(index, steps)
+    return steps
+
+
+def run_load(sessions: int, iterations: int, warmup: int, users: int, timeout: float) -> tuple[dict[str, StepStats], float]:
+    """sessions個のセッションをそれぞれ別のプロセスで同時に実行し、操作ごとの集計と全体の経過時間(秒)を返します。
+
+    AppTestは同じプロセスの複数のスレッドから同時に実行できないため、セッションごとにプロセスを分けます。
+    そのため計測できるのはプロセス間のロック待ちを含む応答時間で、書き込みキューによるセッションをまたいだまとめてのコミットの効果は計測できません。
+    """
+    context = multiprocessing.get_context('spawn')
+    steps = {step: StepStats() for step in STEPS}
+    with context.Manager() as manager, ProcessPoolExecutor(max_workers=sessions, mp_context=context) as executor:
+        barrier = manager.Barrier(sessions + 1)
+        futures = [executor.submit(run_session, session, iterations, warmup, users, timeout, barrier) for session in range(sessions)]
+
+        barrier.wait()
+        start = time_module.perf_counter()
+        for future in futures:
+            for step, stats in future.result().items():
+                steps[step].merge(stats)
+        elapsed = time_module.perf_counter() - start
+    return steps, elapsed
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """昇順に並んだ値のパーセンタイルを最近順位法で取得します。"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(len(values) * q + 0.5) - 1))]
+
+
+def main() -> None:
+    """複数セッションの負荷試験を実行し、結果をJSONファイルに書き出します。"""
+    parser = argparse.ArgumentParser(description='AppTestで複数のセッションを同時に実行し、ページごとの応答時間を計測します。')
+    parser.add_argument('--sessions', type=int, default=8, help='同時に実行するセッション数')
+    parser.add_argument('--iterations', type=int, default=3, help='1セッションあたりの繰り返し回数')
+    parser.add_argument('--warmup', type=int, default=1, help='計測前に各セッションで行う準備の回数')
+    parser.add_argument('--users', type=int, default=DatasetSpec.users, help='ユーザー数')
+    parser.add_argument('--shifts', type=int, default=DatasetSpec.shifts_per_user, help='1人あたりのシフト数')
+    parser.add_argument('--seed', type=int, default=DatasetSpec.seed, help='乱数のシード')
+    parser.add_argument('--database', default=None, help='データを生成するデータベースファイル(省略時は一時ファイル)')
+    parser.add_argument('--reuse', action='store_true', help='--databaseの既存のデータをそのまま使う')
+    parser.add_argument('--timeout', type=float, default=120, help='1回の再実行のタイムアウト(秒)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='結果を書き出すJSONファイル')
+    args = parser.parse_args()
+
+    spec = DatasetSpec(users=args.users, shifts_per_user=args.shifts, seed=args.seed)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = args.database or os.path.join(tmpdir, 'load.db')
+
+        generate_seconds = 0.0
+        if not (args.reuse and args.database and os.path.exists(database)):
+            start = time_module.perf_counter()
+            generate(database, spec).pool.close()
+            generate_seconds = time_module.perf_counter() - start
+
+        # アプリのスクリプトはget_db_controller()で共有のコントローラを取得するため、環境変数で設定を渡す
+        os.environ['SHIFT_DB_PATH'] = database
+        # 書き込みキューはプロセスごとに作られ、セッションをまたいでまとめてコミットできないため使わない
+        os.environ['SHIFT_WRITE_QUEUE'] = '0'
+
+        steps, elapsed = run_load(args.sessions, args.iterations, args.warmup, args.users, args.timeout)
+
+    results = {step: stats.summary() for step, stats in steps.items()}
+    runs = sum(result['runs'] for result in results.values())
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'dataset': {
+                'users': spec.users,
+                'shifts_per_user': spec.shifts_per_user,
+                'seed': spec.seed,
+            },
+            'generate_seconds': generate_seconds,
+            'sessions': args.sessions,
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'elapsed_seconds': elapsed,
+            'throughput_rps': runs / elapsed if elapsed > 0 else 0.0,
+        },
+        'results': results,
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, result in results.items():
+        print(
+            f'{name:<12} runs {result["runs"]:5d}  p50 {result["p50_ms"]:9.1f} ms  p95 {result["p95_ms"]:9.1f} ms  '
+            f'p99 {result["p99_ms"]:9.1f} ms  errors {result["errors"]:4d}  lock errors {result["lock_errors"]:4d}'
+        )
+    print(f'{runs} runs in {elapsed:.1f} s ({report["meta"]["throughput_rps"]:.1f} runs/s)')
+
+
+if __name__ == '__main__':
+    main()
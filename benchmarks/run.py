@@ -0,0 +1,243 @@
+import argparse
+from datetime import datetime, time, timedelta
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import time as time_module
+from typing import Callable
+
+from module.chart import clear_cache
+from module.db import CachedDBController, DBController, Recurrence, WEEKLY, get_db_controller
+
+from .datagen import DatasetSpec, PASSWORD, generate, get_username
+
+
+DEFAULT_OUTPUT = 'benchmark.json'  # 結果を書き出すJSONファイル
+
+PAGE_SCRIPT = '''
+import os
+
+from module.db import get_db_controller
+from module.page import home, {function}
+
+if home.PIE_FONTPATH is not None and not os.path.exists(home.PIE_FONTPATH):
+    home.PIE_FONTPATH = None
+
+{function}(get_db_controller({database!r}))
+'''  # AppTestで実行するページ表示用スクリプト
+
+
+def measure(func: Callable[[int], object], repeat: int) -> dict[str, float]:
+    """関数をrepeat回実行し、実行時間(ミリ秒)の統計を返します。関数には実行回数の番号を渡します。"""
+    timings = []
+    for i in range(repeat):
+        start = time_module.perf_counter()
+        func(i)
+        timings.append((time_module.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        'runs': repeat,
+        'min_ms': timings[0],
+        'median_ms': statistics.median(timings),
+        'mean_ms': statistics.fmean(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'max_ms': timings[-1],
+    }
+
+
+def bench_db(db: DBController, spec: DatasetSpec, repeat: int) -> dict[str, dict[str, float]]:
+    """DBControllerの各メソッドの実行時間を計測します。"""
+    rng = random.Random(spec.seed)
+    user_ids = [row['id'] for row in db.conn.execute('SELECT id FROM users ORDER BY id')]
+    # 合成データの期間の中ほどを「今日」とする
+    today = spec.start + timedelta(days=spec.shifts_per_user)
+    # 書き込みの計測は既存データと重ならない未来の期間に行う
+    future = datetime(2100, 1, 1)
+
+    results = {}
+    results['login'] = measure(lambda i: db.login(get_username(rng.randrange(len(user_ids))), PASSWORD), repeat)
+    results['get_user'] = measure(lambda i: db.get_user(rng.choice(user_ids)), repeat)
+    results['get_shifts'] = measure(lambda i: db.get_shifts(rng.choice(user_ids)), repeat)
+    results['get_shifts_month'] = measure(
+        lambda i: db.get_shifts(rng.choice(user_ids), today - timedelta(days=7), today + timedelta(days=35)),
+        repeat,
+    )
+    results['get_amount_month'] = measure(
+        lambda i: db.get_amount(rng.choice(user_ids), today - timedelta(days=30), today),
+        repeat,
+    )
+    results['get_amount_year'] = measure(
+        lambda i: db.get_amount(rng.choice(user_ids), datetime(today.year, 1, 1), today),
+        repeat,
+    )
+    results['get_next_shift'] = measure(lambda i: db.get_next_shift(rng.choice(user_ids), today), repeat)
+    results['find_conflicts'] = measure(
+        lambda i: db.find_conflicts(rng.choice(user_ids), today, today + timedelta(hours=8)),
+        repeat,
+    )
+    results['add_shift'] = measure(
+        lambda i: db.add_shift(
+            rng.choice(user_ids),
+            '勤務先0',
+            'ベンチマーク',
+            future + timedelta(days=i, hours=9),
+            future + timedelta(days=i, hours=17),
+            time(1, 0),
+            1000,
+        ),
+        repeat,
+    )
+
+    weekly_start = future + timedelta(days=repeat + 1)
+
+    def add_weekly_loop(i):
+        user_id = rng.choice(user_ids)
+        start_datetime = weekly_start + timedelta(days=i * 400, hours=9)
+        for week in range(52):
+            db.add_shift(
+                user_id,
+                '勤務先0',
+                'ベンチマーク',
+                start_datetime + timedelta(weeks=week),
+                start_datetime + timedelta(weeks=week, hours=8),
+                time(1, 0),
+                1000,
+                is_upadate=True,
+            )
+
+    def add_weekly_bulk(i):
+        start_datetime = weekly_start + timedelta(days=i * 400, hours=9)
+        db.add_shifts_bulk(
+            rng.choice(user_ids),
+            '勤務先0',
+            'ベンチマーク',
+            start_datetime,
+            start_datetime + timedelta(hours=8),
+            time(1, 0),
+            1000,
+            Recurrence(WEEKLY, (start_datetime + timedelta(weeks=51)).date()),
+        )
+
+    weekly_repeat = max(1, repeat // 10)
+    results['add_shift_weekly_loop_52'] = measure(add_weekly_loop, weekly_repeat)
+    weekly_start += timedelta(days=weekly_repeat * 400)
+    results['add_shifts_bulk_weekly_52'] = measure(add_weekly_bulk, weekly_repeat)
+
+    return results
+
+
+def bench_pages(database: str, repeat: int) -> dict[str, dict[str, float]]:
+    """AppTestでホームページとシフトページを表示する時間を計測します。Streamlitがない場合は空の結果を返します。
+
+    キャッシュをすべて消去してから表示する場合(名前の末尾が_cold)と、キャッシュが効いた状態で表示する場合を分けて計測します。
+    """
+    try:
+        import streamlit as st
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {}
+
+    def clear_caches():
+        st.cache_data.clear()
+        clear_cache()
+        db = get_db_controller(database)
+        for controller in (db, getattr(db, 'directory', None), *getattr(db, 'shards', ())):
+            if isinstance(controller, CachedDBController):
+                controller.cache.clear()
+
+    results = {}
+    for function in ('show_home_page', 'show_shift_page'):
+        script = PAGE_SCRIPT.format(function=function, database=database)
+
+        def run_page(i):
+            at = AppTest.from_string(script, default_timeout=60)
+            at.session_state['is_login'] = True
+            at.session_state['user_id'] = 1 + i % 10
+            at.session_state['shifts'] = None
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+
+        def run_page_cold(i):
+            clear_caches()
+            run_page(i)
+
+        results[f'{function}_cold'] = measure(run_page_cold, repeat)
+        # 計測前に一度表示し、すべてのユーザーのキャッシュを作っておく
+        for i in range(min(repeat, 10)):
+            run_page(i)
+        results[function] = measure(run_page, repeat)
+
+    return results
+
+
+def main() -> None:
+    """ベンチマークを実行し、結果をJSONファイルに書き出します。"""
+    parser = argparse.ArgumentParser(description='DBControllerとページ表示のベンチマークを実行します。')
+    parser.add_argument('--users', type=int, default=DatasetSpec.users, help='ユーザー数')
+    parser.add_argument('--shifts', type=int, default=DatasetSpec.shifts_per_user, help='1人あたりのシフト数')
+    parser.add_argument('--invalid-ratio', type=float, default=DatasetSpec.invalid_ratio, help='無効なシフトの割合')
+    parser.add_argument('--places', type=int, default=DatasetSpec.places_per_user, help='1人あたりの勤務先数')
+    parser.add_argument('--seed', type=int, default=DatasetSpec.seed, help='乱数のシード')
+    parser.add_argument('--repeat', type=int, default=100, help='各計測の実行回数')
+    parser.add_argument('--database', default=None, help='データを生成するデータベースファイル(省略時は一時ファイル)')
+    parser.add_argument('--overwrite', action='store_true', help='--databaseのファイルが既にある場合に削除して作り直す')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='結果を書き出すJSONファイル')
+    parser.add_argument('--skip-pages', action='store_true', help='ページ表示の計測を行わない')
+    args = parser.parse_args()
+    if args.database and os.path.exists(args.database) and not args.overwrite:
+        parser.error(f'{args.database}は既に存在します。削除して作り直す場合は--overwriteを指定してください')
+
+    spec = DatasetSpec(
+        users=args.users,
+        shifts_per_user=args.shifts,
+        invalid_ratio=args.invalid_ratio,
+        places_per_user=args.places,
+        seed=args.seed,
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = args.database or os.path.join(tmpdir, 'benchmark.db')
+
+        start = time_module.perf_counter()
+        db = generate(database, spec)
+        generate_seconds = time_module.perf_counter() - start
+
+        results = bench_db(db, spec, args.repeat)
+        if not args.skip_pages:
+            results.update(bench_pages(database, max(1, args.repeat // 10)))
+        db.pool.close()
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'dataset': {
+                'users': spec.users,
+                'shifts_per_user': spec.shifts_per_user,
+                'invalid_ratio': spec.invalid_ratio,
+                'places_per_user': spec.places_per_user,
+                'seed': spec.seed,
+            },
+            'generate_seconds': generate_seconds,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for name, result in results.items():
+        print(f'{name:<32} median {result["median_ms"]:9.3f} ms  p95 {result["p95_ms"]:9.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
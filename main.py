@@ -1,45 +1,43 @@
 import streamlit as st
 
-from module.db import DBController
-from module.page import show_home_page, show_add_place_page, show_login_page, show_create_account_page, show_setting_page, show_shift_page
+from module.db import get_db_controller
+from module.instrument import get_instrumentation, span
+from module.page import get_page
+from module.page.instrumentation import is_admin, show_instrumentation_panel
 
 
 def main():
     """
     メイン関数。シフト管理アプリケーションのエントリーポイント。
-    この関数は、データベースコントローラを初期化し、ユーザーのログイン状態に応じて
+    この関数は、プロセス共有のデータベースコントローラを取得し、ユーザーのログイン状態に応じて
     適切なメニューを表示します。選択されたメニューに基づいて、対応するページを表示します。
     メニューオプション:
     - ホーム: ホームページを表示
     - 勤務先追加: 勤務先追加ページを表示
     - シフト: シフトページを表示
+    - 分析: 分析ページを表示
+    - 職場: 職場ページを表示
     - 設定: 設定ページを表示
     - ログイン: ログインページを表示
     - アカウント作成: アカウント作成ページを表示
     """
-    db = DBController()
+    db = get_db_controller()
 
     st.title('シフト管理')
 
     if 'is_login' in st.session_state:
-        menu = ['ホーム', '勤務先追加', 'シフト', '設定']
+        menu = ['ホーム', '勤務先追加', 'シフト', '分析', '職場', '設定']
     else:
         menu = ['ログイン', 'アカウント作成']
 
     choice = st.sidebar.selectbox('メニュー', menu)
 
-    if choice == 'ホーム':
-        show_home_page(db)
-    elif choice == '勤務先追加':
-        show_add_place_page(db)
-    elif choice == 'シフト':
-        show_shift_page(db)
-    elif choice == '設定':
-        show_setting_page(db)
-    elif choice == 'ログイン':
-        show_login_page(db)
-    elif choice == 'アカウント作成':
-        show_create_account_page(db)
+    # 選択されたページのモジュールだけを読み込む
+    with span(f'page.{choice}'):
+        get_page(choice)(db)
+
+    if get_instrumentation().enabled and is_admin():
+        show_instrumentation_panel()
 
 
 if __name__ == '__main__':
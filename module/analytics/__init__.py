@@ -0,0 +1,24 @@
+from importlib import import_module
+
+
+_EXPORTS = {
+    'EarningsSummary': '.earnings',
+    'ShiftArrays': '.earnings',
+    'load_shift_arrays': '.earnings',
+    'summarize': '.earnings',
+    'WEEKDAY_LABELS': '.earnings',
+    'IncomeForecast': '.forecast',
+    'IncomeLimit': '.forecast',
+    'LimitForecast': '.forecast',
+    'forecast_income': '.forecast',
+    'get_income_limits': '.forecast',
+    'DEFAULT_INCOME_LIMITS': '.forecast',
+}  # 公開する名前と定義しているモジュール(numpy・pandasを使う集計は分析ページを開くまで読み込まない)
+
+
+def __getattr__(name: str):
+    """公開する名前を、最初に使われた時点でモジュールを読み込んで取得します。"""
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(import_module(module_name, __name__), name)
@@ -0,0 +1,131 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from module.db import DBController
+from module.db.period import get_period_month
+from module.db.wage import DAY_SECONDS, EPOCH_WEEKDAY, HOUR_SECONDS, WEEKDAY_LABELS
+
+
+@dataclass
+class ShiftArrays:
+    """ユーザーの有効なシフトを列ごとの配列として保持するクラス"""
+    place: np.ndarray
+    start_at: np.ndarray
+    end_at: np.ndarray
+    break_seconds: np.ndarray
+    hourly_wage: np.ndarray
+    amount: np.ndarray
+    period_key: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.start_at)
+
+    @property
+    def work_hours(self) -> np.ndarray:
+        """休憩時間を除いた勤務時間(時間)を取得します。"""
+        return (self.end_at - self.start_at - self.break_seconds) / HOUR_SECONDS
+
+
+@dataclass
+class EarningsSummary:
+    """給料の集計結果を表すクラス"""
+    total_amount: int
+    total_hours: float
+    effective_hourly_wage: float
+    by_place: pd.DataFrame
+    by_month: pd.DataFrame
+    by_period: pd.DataFrame
+    by_weekday: pd.DataFrame
+    heatmap: pd.DataFrame
+
+
+def load_shift_arrays(db: DBController, user_id: int) -> ShiftArrays:
+    """ユーザーの有効なシフトを1回の検索で取得し、列ごとの配列に変換します。"""
+    columns = db.get_shift_columns(user_id)
+
+    def to_int64(values: tuple) -> np.ndarray:
+        return np.fromiter(values, dtype=np.int64, count=len(values))
+
+    return ShiftArrays(
+        place=np.array(columns['place'], dtype=object),
+        start_at=to_int64(columns['start_datetime']),
+        end_at=to_int64(columns['end_datetime']),
+        break_seconds=to_int64(columns['break_time']),
+        hourly_wage=to_int64(columns['hourly_wage']),
+        amount=to_int64(columns['amount']),
+        period_key=to_int64(columns['period_key']),
+    )
+
+
+def summarize(shifts: ShiftArrays) -> EarningsSummary:
+    """勤務先・月・給料期間ごとの給料、曜日ごとの勤務時間、時間帯ごとの勤務時間を集計します。"""
+    hours = shifts.work_hours
+    total_amount = int(shifts.amount.sum())
+    total_hours = float(hours.sum())
+
+    frame = pd.DataFrame({
+        'place': shifts.place,
+        'amount': shifts.amount,
+        'hours': hours,
+    })
+
+    # 給料は終了日時の日に計上する(get_amountと同じ)
+    end_datetime = pd.to_datetime(shifts.end_at, unit='s')
+
+    by_place = _sum_by(frame, frame['place'], '勤務先')
+    by_month = _sum_by(frame, end_datetime.to_period('M').strftime('%Y/%m'), '月')
+    by_period = _sum_by(frame, _get_period_labels(shifts.period_key), '締め月')
+
+    weekdays = (shifts.start_at // DAY_SECONDS + EPOCH_WEEKDAY) % 7
+    weekday_hours = np.bincount(weekdays, weights=hours, minlength=7)
+    by_weekday = pd.DataFrame({'曜日': WEEKDAY_LABELS, '勤務時間': weekday_hours}).set_index('曜日')
+
+    return EarningsSummary(
+        total_amount=total_amount,
+        total_hours=total_hours,
+        effective_hourly_wage=total_amount / total_hours if total_hours > 0 else 0.0,
+        by_place=by_place,
+        by_month=by_month,
+        by_period=by_period,
+        by_weekday=by_weekday,
+        heatmap=_get_hour_heatmap(shifts.start_at, shifts.end_at),
+    )
+
+
+def _sum_by(frame: pd.DataFrame, keys, label: str) -> pd.DataFrame:
+    """キーごとに給料と勤務時間を合計し、実質時給を計算します。"""
+    result = frame[['amount', 'hours']].groupby(np.asarray(keys), sort=True).sum()
+    result.index.name = label
+    result['hourly_wage'] = (result['amount'] / result['hours'].where(result['hours'] > 0)).fillna(0).round()
+    return result.rename(columns={'amount': '給料', 'hours': '勤務時間', 'hourly_wage': '実質時給'})
+
+
+def _get_period_labels(period_key: np.ndarray) -> np.ndarray:
+    """給料期間のキーを、締め日のある月('YYYY/MM')のラベルに変換します。"""
+    # 期間の数はシフトの数より少ないため、重複のないキーだけを変換する
+    keys, inverse = np.unique(period_key, return_inverse=True)
+    labels = np.array([f'{year}/{month:02d}' for year, month in map(get_period_month, keys.tolist())], dtype=object)
+    return labels[inverse]
+
+
+def _get_hour_heatmap(start_at: np.ndarray, end_at: np.ndarray) -> pd.DataFrame:
+    """曜日と時刻(0〜23時)ごとに、勤務している時間(時間)を集計します。"""
+    # 各シフトを1時間ごとの区間に展開し、区間と重なる秒数を足し合わせる
+    first_hour = start_at // HOUR_SECONDS
+    last_hour = -(-end_at // HOUR_SECONDS)
+    counts = np.maximum(last_hour - first_hour, 0)
+
+    index = np.repeat(np.arange(len(start_at)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    slot_hours = first_hour[index] + offsets
+    seconds = (
+        np.minimum(end_at[index], (slot_hours + 1) * HOUR_SECONDS)
+        - np.maximum(start_at[index], slot_hours * HOUR_SECONDS)
+    )
+
+    weekdays = (slot_hours // 24 + EPOCH_WEEKDAY) % 7
+    hours_of_day = slot_hours % 24
+    heatmap = np.bincount(weekdays * 24 + hours_of_day, weights=seconds / HOUR_SECONDS, minlength=7 * 24)
+    return pd.DataFrame(heatmap.reshape(7, 24), index=pd.Index(WEEKDAY_LABELS, name='曜日'), columns=range(24))
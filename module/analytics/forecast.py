@@ -0,0 +1,117 @@
+from dataclasses import dataclass
+from datetime import date, datetime
+import os
+
+from module.db import DBController, Recurrence, WageRule, calc_rule_amount
+from module.db.epoch import time_to_seconds, to_epoch
+
+
+@dataclass(frozen=True)
+class IncomeLimit:
+    """年収の上限(いわゆる年収の壁)を表すクラス"""
+    name: str
+    amount: int
+
+
+DEFAULT_INCOME_LIMITS = (
+    IncomeLimit('103万円の壁', 1_030_000),
+    IncomeLimit('106万円の壁', 1_060_000),
+    IncomeLimit('130万円の壁', 1_300_000),
+)
+
+
+@dataclass
+class LimitForecast:
+    """年収の上限を超える見込みを表すクラス"""
+    limit: IncomeLimit
+    crossing_date: date | None  # 超える見込みの日(超えない場合はNone)
+    is_projected: bool  # 繰り返しが続いた場合の見込みを含めて初めて超える場合はTrue
+
+
+@dataclass
+class IncomeForecast:
+    """年末までの給料の見込みを表すクラス"""
+    year: int
+    actual_amount: int  # 現在までの給料
+    scheduled_amount: int  # 登録済みの今後のシフトの給料
+    projected_amount: int  # 繰り返しが最終日付以降も年末まで続いた場合の給料
+    limits: list[LimitForecast]
+
+    @property
+    def total_amount(self) -> int:
+        """年末までの給料の見込みの合計を取得します。"""
+        return self.actual_amount + self.scheduled_amount + self.projected_amount
+
+
+def get_income_limits() -> tuple[IncomeLimit, ...]:
+    """年収の上限を取得します。環境変数SHIFT_INCOME_LIMITSに金額をカンマ区切りで指定すると置き換えられます。"""
+    value = os.environ.get('SHIFT_INCOME_LIMITS', '')
+    amounts = [int(amount) for amount in value.split(',') if amount.strip()]
+    if not amounts:
+        return DEFAULT_INCOME_LIMITS
+    return tuple(IncomeLimit(f'{amount:,}円', amount) for amount in sorted(amounts))
+
+
+def forecast_income(
+    db: DBController,
+    user_id: int,
+    now: datetime,
+    limits: tuple[IncomeLimit, ...] | None = None,
+) -> IncomeForecast:
+    """登録済みのシフトと繰り返し規則から年末までの給料を見込み、各上限を超える日を求めます。
+
+    登録済みのシフトはトリガーで更新される日別集計から読み込むため、シフトを1年分読み直すことはありません。
+    """
+    if limits is None:
+        limits = get_income_limits()
+    year_start = date(now.year, 1, 1)
+    next_year_start = date(now.year + 1, 1, 1)
+
+    confirmed = db.get_daily_amounts(user_id, year_start, next_year_start)
+    actual_amount = db.get_amount(user_id, datetime(now.year, 1, 1), now)
+    scheduled_amount = sum(amount for _, amount in confirmed) - actual_amount
+    projected = _project_recurrences(db.get_recurrences(user_id, now.date()), now.year, db.get_wage_rules(user_id))
+
+    # 日付順に累計し、登録済みの分だけの累計と延長分を含めた累計がそれぞれ上限に達する日を求める
+    events = sorted([(day, amount, False) for day, amount in confirmed] + [(day, amount, True) for day, amount in projected])
+    pending = sorted(limits, key=lambda limit: limit.amount)
+    forecasts = {}
+    total = 0
+    confirmed_total = 0
+    for day, amount, is_projected in events:
+        total += amount
+        if not is_projected:
+            confirmed_total += amount
+        while pending and total >= pending[0].amount:
+            limit = pending.pop(0)
+            forecasts[limit] = LimitForecast(limit, day, confirmed_total < limit.amount)
+        if not pending:
+            break
+
+    return IncomeForecast(
+        year=now.year,
+        actual_amount=actual_amount,
+        scheduled_amount=scheduled_amount,
+        projected_amount=sum(amount for _, amount in projected),
+        limits=[forecasts.get(limit, LimitForecast(limit, None, False)) for limit in limits],
+    )
+
+
+def _project_recurrences(recurrences: list[dict], year: int, wage_rules: dict[str, WageRule]) -> list[tuple[date, int]]:
+    """繰り返し規則が最終日付の翌日から年末まで続いた場合の、各回の終了日と金額(勤務先の割増賃金ルールを適用)を取得します。"""
+    year_end = date(year, 12, 31)
+    projected = []
+    for rule in recurrences:
+        until = rule['recurrence'].until
+        if until >= year_end:
+            continue
+
+        break_seconds = time_to_seconds(rule['break_time'])
+        wage_rule = wage_rules.get(rule['place'])
+        extended = Recurrence(rule['recurrence'].freq, year_end)
+        for start_datetime, end_datetime in extended.occurrences(rule['start_datetime'], rule['end_datetime']):
+            if start_datetime.date() <= until or end_datetime.year != year:
+                continue
+            amount = calc_rule_amount(wage_rule, to_epoch(start_datetime), to_epoch(end_datetime), break_seconds, rule['hourly_wage'])
+            projected.append((end_datetime.date(), amount))
+    return projected
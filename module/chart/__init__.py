@@ -0,0 +1 @@
+from .progress import render_progress_chart, clear_cache, BACKENDS, MATPLOTLIB, SVG
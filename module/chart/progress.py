@@ -0,0 +1,135 @@
+from functools import lru_cache
+from html import escape
+import io
+import math
+
+
+MATPLOTLIB = 'matplotlib'  # matplotlibでPNG画像を描画する
+SVG = 'svg'  # matplotlibを使わずSVGを生成する
+
+BACKENDS = (MATPLOTLIB, SVG)
+
+CACHE_SIZE = 256  # 描画結果を保持する件数
+
+ACHIEVED_COLOR = '#52b338'
+REMAINING_COLOR = '#e2e9d9'
+
+
+def render_progress_chart(
+    current_amount: int,
+    estimated_amount: int,
+    goal_amount: int,
+    start_date: str,
+    end_date: str,
+    *,
+    backend: str = MATPLOTLIB,
+    fontpath: str | None = None,
+) -> bytes | str:
+    """目標金額に対する達成率の円グラフを描画し、PNG画像(bytes)またはSVG(str)を返します。"""
+    if backend == MATPLOTLIB:
+        return _render_png(current_amount, estimated_amount, goal_amount, start_date, end_date, fontpath)
+    if backend == SVG:
+        return _render_svg(current_amount, estimated_amount, goal_amount, start_date, end_date)
+    raise ValueError(f'未対応の描画方式です: {backend}')
+
+
+def clear_cache() -> None:
+    """描画結果のキャッシュを消去します。"""
+    _render_png.cache_clear()
+    _render_svg.cache_clear()
+
+
+def _get_achievement_rate(current_amount: int, goal_amount: int) -> float:
+    """目標金額に対する達成率(0〜100)を取得します。"""
+    if goal_amount <= 0:
+        return 100
+    return min((current_amount / goal_amount) * 100, 100)
+
+
+def _get_labels(
+    current_amount: int,
+    estimated_amount: int,
+    goal_amount: int,
+    start_date: str,
+    end_date: str,
+) -> list[tuple[float, str, int]]:
+    """円グラフ中央に表示する(y座標, 文字列, 文字サイズ)のリストを取得します。"""
+    return [
+        (0.5, f'{start_date} - {end_date}', 10),
+        (0.35, f'目標金額 {goal_amount:,}円', 10),
+        (0.15, '今日までの給料', 10),
+        (-0.05, f'{current_amount:,}円', 20),
+        (-0.3, '見込み額', 10),
+        (-0.5, f'{estimated_amount:,}円', 20),
+    ]
+
+
+@lru_cache(maxsize=None)
+def _load_font(fontpath: str):
+    """フォントを読み込みます。読み込みはプロセスごとに1回だけ行います。"""
+    import matplotlib.font_manager as fm
+
+    return fm.FontProperties(fname=fontpath)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _render_png(
+    current_amount: int,
+    estimated_amount: int,
+    goal_amount: int,
+    start_date: str,
+    end_date: str,
+    fontpath: str | None,
+) -> bytes:
+    """matplotlibで円グラフを描画します。pyplotの共有状態を使わず呼び出しごとにFigureを作成します。"""
+    from matplotlib.figure import Figure
+
+    achievement_rate = _get_achievement_rate(current_amount, goal_amount)
+    font_prop = _load_font(fontpath) if fontpath is not None else None
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.pie(
+        [achievement_rate, 100 - achievement_rate],
+        colors=[ACHIEVED_COLOR, REMAINING_COLOR],
+        wedgeprops={'width': 0.1},
+        startangle=90,
+        counterclock=False,
+    )
+
+    for y, text, fontsize in _get_labels(current_amount, estimated_amount, goal_amount, start_date, end_date):
+        ax.text(0, y, text, fontproperties=font_prop, horizontalalignment='center', verticalalignment='center', fontsize=fontsize)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _render_svg(
+    current_amount: int,
+    estimated_amount: int,
+    goal_amount: int,
+    start_date: str,
+    end_date: str,
+) -> str:
+    """円グラフをSVGとして生成します。"""
+    achievement_rate = _get_achievement_rate(current_amount, goal_amount)
+    radius = 0.95
+    circumference = 2 * math.pi * radius
+    achieved_length = circumference * achievement_rate / 100
+
+    texts = ''.join(
+        f'<text x="0" y="{-y}" font-size="{fontsize * 0.007:.3f}" text-anchor="middle" dominant-baseline="central">{escape(text)}</text>'
+        for y, text, fontsize in _get_labels(current_amount, estimated_amount, goal_amount, start_date, end_date)
+    )
+
+    # 円の上端から時計回りに達成率の長さだけ線を引く
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="-1.1 -1.1 2.2 2.2" style="width: 100%; max-width: 480px; display: block; margin: auto;">'
+        f'<circle r="{radius}" fill="none" stroke="{REMAINING_COLOR}" stroke-width="0.1"/>'
+        f'<circle r="{radius}" fill="none" stroke="{ACHIEVED_COLOR}" stroke-width="0.1" '
+        f'stroke-dasharray="{achieved_length:.4f} {circumference:.4f}" transform="rotate(-90)"/>'
+        f'{texts}'
+        '</svg>'
+    )
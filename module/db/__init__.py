@@ -1 +1,9 @@
-from .db_controller import DBController
\ No newline at end of file
+from .cache import CachedDBController, LRUCache
+from .db_controller import BulkShiftResult, DBController, ShiftRecord, StaffingSlot, INSERTED, REPLACED, SKIPPED
+from .factory import get_db_controller
+from .period import get_period_bounds, get_period_key, get_period_table
+from .recurrence import Recurrence, DAILY, WEEKLY, BIWEEKLY, MONTHLY_NTH_WEEKDAY
+from .shift import Shift
+from .shard import RebalanceReport, ShardedDBController, get_shard_paths, rebalance
+from .wage import WageRule, calc_rule_amount, WEEKDAY_LABELS
+from .writer import WriteQueue
\ No newline at end of file
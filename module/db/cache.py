@@ -0,0 +1,293 @@
+from collections import OrderedDict
+from datetime import date, datetime, time
+import sqlite3
+import threading
+import time as time_module
+
+from .db_controller import DBController, DEFAULT_DATABASE, BulkShiftResult, ShiftRecord
+from .recurrence import Recurrence
+from .shift import Shift
+from .wage import WageRule
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """件数の上限と有効期限を持ち、ユーザー単位で無効化できるLRUキャッシュクラス"""
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        """キャッシュを初期化します。ttlは秒単位の有効期限です。"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[float, object]] = OrderedDict()
+        self._user_keys: dict[int, set[tuple]] = {}
+        self._generations: dict[int, int] = {}
+        self._epoch = 0  # すべてのエントリを削除するたびに増える番号
+        self._lock = threading.Lock()
+
+    def generation(self, user_id: int) -> tuple[int, int]:
+        """指定されたユーザーの世代番号を取得します。無効化やすべての削除のたびに変わります。"""
+        with self._lock:
+            return self._epoch, self._generations.get(user_id, 0)
+
+    def get(self, key: tuple) -> object:
+        """キーに対応する値を取得します。ない場合や期限切れの場合は_MISSINGを返します。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time_module.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return _MISSING
+
+    def set(self, key: tuple, value: object, generation: tuple[int, int] | None = None) -> None:
+        """値を保存します。キーの先頭要素をユーザーIDとして扱います。読み取り中に無効化された値は保存しません。"""
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key[0], 0)):
+                return
+            self._entries[key] = (time_module.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._user_keys.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        """指定されたユーザーのエントリをすべて削除します。"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in list(self._user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self) -> None:
+        """すべてのエントリを削除します。"""
+        with self._lock:
+            self._entries.clear()
+            self._user_keys.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def stats(self) -> dict[str, int]:
+        """ヒット数、ミス数、保持件数を取得します。"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def _remove(self, key: tuple) -> None:
+        """エントリを削除します。ロックを取得した状態で呼び出します。"""
+        del self._entries[key]
+        user_keys = self._user_keys.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._user_keys[key[0]]
+
+
+class CachedDBController(DBController):
+    """ユーザー情報・勤務先・シフトの読み取り結果をキャッシュするデータベースコントローラクラス
+
+    ほかのプロセス(またはほかの接続)からの書き込みは、読み取りの前にPRAGMA data_versionを確認して検知し、キャッシュをすべて削除します。
+    """
+    def __init__(
+        self,
+        database: str = DEFAULT_DATABASE,
+        *,
+        maxsize: int = 1024,
+        ttl: float = 300.0,
+        connection_factory: type[sqlite3.Connection] = sqlite3.Connection,
+        write_queue: bool = False,
+    ):
+        """DBControllerを初期化し、読み取りキャッシュを作成します。"""
+        super().__init__(database, connection_factory=connection_factory, write_queue=write_queue)
+        self.cache = LRUCache(maxsize, ttl)
+        self._data_versions = threading.local()  # スレッドごとに最後に確認したPRAGMA data_version
+
+    def get_user(self, user_id: int) -> list[str]:
+        """指定されたユーザーの情報を取得します。"""
+        return self._read_through((user_id, 'user'), super().get_user, user_id)
+
+    def get_places(self, user_id: int) -> list[str]:
+        """指定されたユーザーに登録されている勤務先のリストを取得します。"""
+        return list(self._read_through((user_id, 'places'), super().get_places, user_id))
+
+    def get_shifts(
+        self,
+        user_id: int,
+        start_datetime: datetime | None = None,
+        end_datetime: datetime | None = None,
+    ) -> list[Shift]:
+        """指定されたユーザーに登録されているシフトのリストを取得します。"""
+        # Shiftは変更できないため、キャッシュとセッションで同じオブジェクトを共有する
+        return list(self._read_through(
+            (user_id, 'shifts', start_datetime, end_datetime),
+            super().get_shifts,
+            user_id,
+            start_datetime,
+            end_datetime,
+        ))
+
+    def get_period_amounts(
+        self,
+        user_id: int,
+        today: date,
+        count: int,
+    ) -> list[tuple[date, date, int]]:
+        """指定されたユーザーの直近count期間の給料期間ごとの合計金額を取得します。"""
+        return list(self._read_through(
+            (user_id, 'period_amounts', today, count),
+            super().get_period_amounts,
+            user_id,
+            today,
+            count,
+        ))
+
+    def update_user(
+        self,
+        user_id: int,
+        username: str,
+        password: str,
+        closing_day: int,
+        goal_amount: int
+    ) -> bool:
+        """ユーザー情報を更新します。"""
+        try:
+            return super().update_user(user_id, username, password, closing_day, goal_amount)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    def add_place(self, user_id: int, name: str) -> bool:
+        """新しい勤務先を追加します。"""
+        try:
+            return super().add_place(user_id, name)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    def add_shift(
+        self,
+        user_id: int,
+        place: str,
+        title: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        break_time: time,
+        hourly_wage: int,
+        *,
+        is_upadate: bool = False,
+    ) -> bool:
+        """新しいシフトを追加します。"""
+        try:
+            return super().add_shift(
+                user_id,
+                place,
+                title,
+                start_datetime,
+                end_datetime,
+                break_time,
+                hourly_wage,
+                is_upadate=is_upadate,
+            )
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    def add_shifts_bulk(
+        self,
+        user_id: int,
+        place: str,
+        title: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        break_time: time,
+        hourly_wage: int,
+        recurrence: Recurrence,
+        *,
+        is_upadate: bool = True,
+    ) -> list[BulkShiftResult]:
+        """繰り返し規則に従ってシフトを1つのトランザクションで一括登録します。"""
+        try:
+            return super().add_shifts_bulk(
+                user_id,
+                place,
+                title,
+                start_datetime,
+                end_datetime,
+                break_time,
+                hourly_wage,
+                recurrence,
+                is_upadate=is_upadate,
+            )
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    def add_shifts(
+        self,
+        user_id: int,
+        shifts: list[ShiftRecord],
+        *,
+        is_upadate: bool = False,
+    ) -> list[BulkShiftResult]:
+        """複数のシフトを1つのトランザクションで登録します。"""
+        try:
+            return super().add_shifts(user_id, shifts, is_upadate=is_upadate)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    def set_wage_rule(self, user_id: int, rule: WageRule) -> int:
+        """勤務先の割増賃金ルールを保存し、その勤務先のシフトの金額を計算し直します。"""
+        try:
+            return super().set_wage_rule(user_id, rule)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    def recompute_amounts(
+        self,
+        user_id: int,
+        place: str | None = None,
+        start_datetime: datetime | None = None,
+        *,
+        hourly_wage: int | None = None,
+    ) -> int:
+        """指定されたユーザーの有効なシフトの金額をまとめて計算し直します。"""
+        try:
+            return super().recompute_amounts(user_id, place, start_datetime, hourly_wage=hourly_wage)
+        finally:
+            self.cache.invalidate_user(user_id)
+
+    def delete_shift(
+        self,
+        id: int,
+    ) -> None:
+        """シフトを削除します。"""
+        self.cur.execute('''
+            SELECT user_id FROM shifts
+            WHERE id = :id
+        ''',
+        {'id': id})
+        result = self.cur.fetchone()
+
+        try:
+            super().delete_shift(id)
+        finally:
+            if result is not None:
+                self.cache.invalidate_user(result['user_id'])
+
+    def _read_through(self, key: tuple, read, *args) -> object:
+        """キャッシュにあればその値を、なければ読み取った値を保存して返します。"""
+        self._check_data_version()
+        value = self.cache.get(key)
+        if value is _MISSING:
+            generation = self.cache.generation(key[0])
+            value = read(*args)
+            self.cache.set(key, value, generation)
+        return value
+
+    def _check_data_version(self) -> None:
+        """ほかの接続がコミットしていた場合は、キャッシュをすべて削除します。"""
+        # data_versionは接続ごとの値で、自分の接続以外のコミットがあったときだけ変わる
+        data_version = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if getattr(self._data_versions, 'value', data_version) != data_version:
+            self.cache.clear()
+        self._data_versions.value = data_version
@@ -0,0 +1,82 @@
+import sqlite3
+import threading
+import weakref
+
+
+DEFAULT_PRAGMAS = (
+    ('journal_mode', 'WAL'),  # 読み取りと書き込みを並行させる
+    ('synchronous', 'NORMAL'),  # WALではNORMALでも整合性が保たれる
+    ('foreign_keys', 'ON'),
+    ('busy_timeout', 5000),  # ロック待ち(ミリ秒)
+    ('temp_store', 'MEMORY'),
+    ('cache_size', -16000),  # ページキャッシュ(KiB)
+    ('mmap_size', 268435456),
+)
+
+
+class ConnectionPool:
+    """スレッドごとに接続とカーソルを割り当てるSQLite接続プールクラス"""
+    def __init__(
+        self,
+        database: str,
+        *,
+        max_idle: int = 8,
+        pragmas: tuple[tuple[str, object], ...] = DEFAULT_PRAGMAS,
+        factory: type[sqlite3.Connection] = sqlite3.Connection,
+    ):
+        """接続プールを初期化します。接続は最初に使われた時点で作成されます。"""
+        self.database = database
+        self.max_idle = max_idle
+        self.pragmas = pragmas
+        self.factory = factory
+        self._local = threading.local()
+        self._idle: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        """PRAGMAを設定した新しい接続を作成します。"""
+        conn = sqlite3.connect(self.database, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """現在のスレッドに割り当てられた接続を取得します。"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._acquire()
+            self._local.conn = conn
+            self._local.cur = conn.cursor()
+            # スレッド終了時に接続をプールへ返却する
+            weakref.finalize(threading.current_thread(), self._release, conn)
+        return conn
+
+    def cursor(self) -> sqlite3.Cursor:
+        """現在のスレッドに割り当てられたカーソルを取得します。"""
+        self.connection()
+        return self._local.cur
+
+    def close(self) -> None:
+        """待機中の接続をすべて閉じます。"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def _acquire(self) -> sqlite3.Connection:
+        """待機中の接続を再利用し、なければ新しく作成します。"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self.connect()
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        """接続をプールへ返却します。上限を超えた接続は閉じます。"""
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
@@ -1,64 +1,100 @@
-from datetime import datetime, time, timedelta
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from functools import wraps
+import json
 import sqlite3
+from typing import Iterator
+
+from .connection import ConnectionPool
+from .epoch import EPOCH, SECOND, from_epoch, seconds_to_time, time_to_seconds, to_epoch
+from .migrations import migrate
+from .period import PERIOD_KEY_SQL, get_period_key, get_period_table
+from .recurrence import Recurrence
+from .shift import Shift
+from .wage import WageRule, calc_amount_changes, calc_rule_amount
+from .writer import WriteQueue
+
+
+DEFAULT_DATABASE = 'shift.db'  # データベースファイルのパス
+
+INSERTED = 'inserted'  # 重複なしで追加
+REPLACED = 'replaced'  # 重複する既存シフトを無効化して追加
+SKIPPED = 'skipped'  # 重複のため追加しなかった
+
+DAY_SECONDS = 86400  # 1日の秒数
+
+MIN_EPOCH = -(1 << 53)  # 期間の下限を指定しない場合の値
+MAX_EPOCH = 1 << 53  # 期間の上限を指定しない場合の値
+
+SHIFT_COLUMNS = ('place', 'start_datetime', 'end_datetime', 'break_time', 'hourly_wage', 'amount', 'period_key')  # get_shift_columnsで取得する列
+
+WAGE_RULE_COLUMNS = ('place', 'night_percent', 'overtime_percent', 'overtime_after', 'holiday_percent', 'holiday_weekdays')  # wage_rulesの列
+
+
+@dataclass
+class ShiftRecord:
+    """登録するシフト1件分の内容を表すクラス"""
+    place: str
+    title: str
+    start_datetime: datetime
+    end_datetime: datetime
+    break_time: time
+    hourly_wage: int
+
+
+@dataclass
+class BulkShiftResult:
+    """一括登録したシフト1回分の結果を表すクラス"""
+    start_datetime: datetime
+    end_datetime: datetime
+    status: str
+    replaced_ids: list[int] = field(default_factory=list)
+
+
+@dataclass
+class StaffingSlot:
+    """勤務先の時間帯1つ分の、勤務している人数と人件費を表すクラス"""
+    start_datetime: datetime
+    end_datetime: datetime
+    staff_count: int
+    labor_cost: int
+
+
+def _write_method(method):
+    """書き込みメソッドを、実行後にコミットする(書き込みキューがある場合はキューで実行する)メソッドにします。"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._write(method, self, *args, **kwargs)
+    return wrapper
 
 
 class DBController:
     """データベースコントローラクラス"""
-    def __init__(self):
-        """DBControllerの初期化を行い、データベース接続を確立し、必要なテーブルを作成します。"""
-        self.conn = sqlite3.connect('shift.db', check_same_thread=False)
-        self.conn.execute('PRAGMA foreign_keys = ON')
-        self.conn.row_factory = sqlite3.Row
-        self.cur = self.conn.cursor()
-        self.create_users_table()
-        self.create_places_table()
-        self.create_shifts_table()
-
-    def create_users_table(self):
-        """ユーザーテーブルを作成します。"""
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                password TEXT NOT NULL,
-                closing_day INTEGER NOT NULL,
-                goal_amount INTEGER NOT NULL,
-                is_valid INTEGER DEFAULT 1
-            )
-        ''')
-        self.conn.commit()
+    def __init__(
+        self,
+        database: str = DEFAULT_DATABASE,
+        *,
+        connection_factory: type[sqlite3.Connection] = sqlite3.Connection,
+        write_queue: bool = False,
+    ):
+        """DBControllerの初期化を行い、接続プールを作成し、スキーマを最新にします。write_queueがTrueの場合は書き込みを専用スレッドでまとめてコミットします。"""
+        self.pool = ConnectionPool(database, factory=connection_factory)
+        self.setup_schema()
+        self.write_queue = WriteQueue(self.pool) if write_queue else None
 
-    def create_places_table(self):
-        """勤務先テーブルを作成します。"""
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS places (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                is_valid INTEGER NOT NULL DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-        ''')
-        self.conn.commit()
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """現在のスレッドの接続を取得します。"""
+        return self.pool.connection()
 
-    def create_shifts_table(self):
-        """シフトテーブルを作成します。"""
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS shifts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                place TEXT NOT NULL,
-                title TEXT NOT NULL,
-                start_datetime TEXT NOT NULL,
-                end_datetime TEXT NOT NULL,
-                break_time TEXT NOT NULL,
-                hourly_wage INTEGER NOT NULL,
-                amount INTEGER NOT NULL,
-                is_valid INTEGER NOT NULL DEFAULT 1,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-            )
-        ''')
-        self.conn.commit()
+    @property
+    def cur(self) -> sqlite3.Cursor:
+        """現在のスレッドのカーソルを取得します。"""
+        return self.pool.cursor()
+
+    def setup_schema(self) -> None:
+        """未適用のスキーママイグレーションを適用します。"""
+        migrate(self.conn)
 
     def login(self, username: str, password: str) -> int | None:
         """ユーザーのログインを行います。"""
@@ -85,6 +121,7 @@ class DBController:
         user = self.cur.fetchone()
         return user
 
+    @_write_method
     def add_user(
         self,
         username: str,
@@ -102,9 +139,9 @@ class DBController:
         ''',
         {'username': username, 'password': password, 'closing_day': closing_day, 'goal_amount': goal_amount})
 
-        self.conn.commit()
         return True
 
+    @_write_method
     def update_user(
         self,
         user_id: int,
@@ -117,6 +154,8 @@ class DBController:
         if self.is_exist_user(username, user_id):
             return False
 
+        old_closing_day = self._get_closing_day(user_id)
+
         self.cur.execute('''
             UPDATE users
             SET username = :username,
@@ -127,14 +166,17 @@ class DBController:
         ''',
         {'user_id': user_id, 'username': username, 'password': password, 'closing_day': closing_day, 'goal_amount': goal_amount})
 
-        self.conn.commit()
+        # 締め日が変わった場合はシフトの給料期間キーをまとめて計算し直す
+        if old_closing_day != closing_day:
+            self._update_period_keys(user_id)
+
         return True
 
     def is_exist_user(self, username: str, exclude_user_id: int | None = None) -> bool:
         """ユーザー名の重複を確認します。"""
         self.cur.execute('''
             SELECT * FROM users
-            WHERE id != :exclude_user_id
+            WHERE id IS NOT :exclude_user_id
             AND username = :username
             AND is_valid = 1
             LIMIT 1
@@ -145,6 +187,7 @@ class DBController:
             return True
         return False
 
+    @_write_method
     def add_place(self, user_id: int, name: str) -> bool:
         """新しい勤務先を追加します。"""
         self.cur.execute('''
@@ -165,7 +208,6 @@ class DBController:
         ''',
         {'user_id': user_id, 'name': name})
 
-        self.conn.commit()
         return True
 
     def get_places(self, user_id: int) -> list[str]:
@@ -181,6 +223,7 @@ class DBController:
         places = [row['name'] for row in self.cur.fetchall()]
         return places
 
+    @_write_method
     def add_shift(
         self,
         user_id: int,
@@ -194,40 +237,27 @@ class DBController:
         is_upadate: bool = False,
     ) -> bool:
         """新しいシフトを追加します。"""
-        start_datetime_str = datetime.strftime(start_datetime, '%Y-%m-%d %H:%M:%S')
-        end_datetime_str = datetime.strftime(end_datetime, '%Y-%m-%d %H:%M:%S')
-
-        self.cur.execute('''
-            SELECT id FROM shifts
-            WHERE user_id = :user_id
-            AND (
-                (start_datetime < :end_datetime_str AND end_datetime > :start_datetime_str) OR
-                (start_datetime >= :start_datetime_str AND start_datetime < :end_datetime_str) OR
-                (end_datetime > :start_datetime_str AND end_datetime <= :end_datetime_str)
-            )
-            AND is_valid = 1
-            LIMIT 1
-        ''',
-        {'user_id': user_id, 'start_datetime_str': start_datetime_str, 'end_datetime_str': end_datetime_str})
+        start_at = to_epoch(start_datetime)
+        end_at = to_epoch(end_datetime)
 
-        result = self.cur.fetchone()
+        conflict_ids = self._find_conflict_ids(user_id, start_at, end_at)
 
-        if result is not None:
+        if conflict_ids:
             if is_upadate:
-                shift_id = result['id']
-                self.cur.execute('''
+                self.cur.executemany('''
                     UPDATE shifts
                     SET is_valid = 0
-                    WHERE id = :shift_id
+                    WHERE id = ?
                 ''',
-                {'shift_id': shift_id})
+                [(shift_id,) for shift_id in conflict_ids])
             else:
                 return False
 
-        break_time_str = time.strftime(break_time, '%M:%S')
+        break_seconds = time_to_seconds(break_time)
 
-        total_duration = end_datetime - start_datetime - timedelta(hours=break_time.hour, minutes=break_time.minute, seconds=break_time.second)
-        amount = round(total_duration.total_seconds() / 3600 * hourly_wage)
+        amount = calc_rule_amount(self._get_wage_rules(user_id, place).get(place), start_at, end_at, break_seconds, hourly_wage)
+        closing_day = self._get_closing_day(user_id)
+        period_key = get_period_key(end_datetime, closing_day) if closing_day is not None else None
 
         self.cur.execute('''
             INSERT INTO shifts (
@@ -238,15 +268,164 @@ class DBController:
                 end_datetime,
                 break_time,
                 hourly_wage,
-                amount
+                amount,
+                period_key
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''',
-        (user_id, place, title, start_datetime_str, end_datetime_str, break_time_str, hourly_wage, amount))
-        self.conn.commit()
+        (user_id, place, title, start_at, end_at, break_seconds, hourly_wage, amount, period_key))
 
         return True
 
+    @_write_method
+    def add_shifts_bulk(
+        self,
+        user_id: int,
+        place: str,
+        title: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        break_time: time,
+        hourly_wage: int,
+        recurrence: Recurrence,
+        *,
+        is_upadate: bool = True,
+    ) -> list[BulkShiftResult]:
+        """繰り返し規則に従ってシフトを1つのトランザクションで一括登録します。"""
+        results = []
+        occurrences = []
+        last_end_at = None
+        for occurrence_start, occurrence_end in recurrence.occurrences(start_datetime, end_datetime):
+            start_at = to_epoch(occurrence_start)
+            end_at = to_epoch(occurrence_end)
+            # 規則自体から生じる回同士の重複は後の回を登録しない
+            if last_end_at is not None and start_at < last_end_at:
+                results.append(BulkShiftResult(occurrence_start, occurrence_end, SKIPPED))
+                continue
+            last_end_at = end_at
+            results.append(BulkShiftResult(occurrence_start, occurrence_end, INSERTED))
+            occurrences.append((len(results) - 1, start_at, end_at))
+
+        break_seconds = time_to_seconds(break_time)
+        candidates = [
+            (seq, start_at, end_at, place, title, break_seconds, hourly_wage)
+            for seq, start_at, end_at in occurrences
+        ]
+        self._insert_shifts(user_id, results, candidates, is_upadate)
+
+        self.cur.execute('''
+            INSERT INTO recurrences (
+                user_id,
+                place,
+                title,
+                start_datetime,
+                end_datetime,
+                break_time,
+                hourly_wage,
+                freq,
+                until_day
+            )
+            VALUES (
+                :user_id,
+                :place,
+                :title,
+                :start_at,
+                :end_at,
+                :break_time,
+                :hourly_wage,
+                :freq,
+                :until_day
+            )
+        ''',
+        {
+            'user_id': user_id,
+            'place': place,
+            'title': title,
+            'start_at': to_epoch(start_datetime),
+            'end_at': to_epoch(end_datetime),
+            'break_time': break_seconds,
+            'hourly_wage': hourly_wage,
+            'freq': recurrence.freq,
+            'until_day': to_epoch(datetime.combine(recurrence.until, time())) // DAY_SECONDS,
+        })
+
+        return results
+
+    @_write_method
+    def add_shifts(
+        self,
+        user_id: int,
+        shifts: list[ShiftRecord],
+        *,
+        is_upadate: bool = False,
+    ) -> list[BulkShiftResult]:
+        """複数のシフトを1つのトランザクションで登録します。重なるシフト同士は開始日時が早いものを登録します。"""
+        results = [BulkShiftResult(shift.start_datetime, shift.end_datetime, INSERTED) for shift in shifts]
+        candidates = []
+        last_end_at = None
+        for seq in sorted(range(len(shifts)), key=lambda seq: shifts[seq].start_datetime):
+            shift = shifts[seq]
+            start_at = to_epoch(shift.start_datetime)
+            end_at = to_epoch(shift.end_datetime)
+            if last_end_at is not None and start_at < last_end_at:
+                results[seq].status = SKIPPED
+                continue
+            last_end_at = end_at
+            candidates.append(
+                (seq, start_at, end_at, shift.place, shift.title, time_to_seconds(shift.break_time), shift.hourly_wage)
+            )
+
+        self._insert_shifts(user_id, results, candidates, is_upadate)
+
+        return results
+
+    def get_wage_rules(self, user_id: int) -> dict[str, WageRule]:
+        """指定されたユーザーの勤務先ごとの割増賃金ルールを取得します。"""
+        return self._get_wage_rules(user_id)
+
+    @_write_method
+    def set_wage_rule(self, user_id: int, rule: WageRule) -> int:
+        """勤務先の割増賃金ルールを保存し、その勤務先のシフトの金額を計算し直します。金額が変わったシフトの件数を返します。"""
+        self.cur.execute(f'''
+            INSERT INTO wage_rules (user_id, {', '.join(WAGE_RULE_COLUMNS)})
+            VALUES (:user_id, {', '.join(f':{column}' for column in WAGE_RULE_COLUMNS)})
+            ON CONFLICT (user_id, place) DO UPDATE SET
+                night_percent = excluded.night_percent,
+                overtime_percent = excluded.overtime_percent,
+                overtime_after = excluded.overtime_after,
+                holiday_percent = excluded.holiday_percent,
+                holiday_weekdays = excluded.holiday_weekdays
+        ''',
+        {'user_id': user_id, **{column: getattr(rule, column) for column in WAGE_RULE_COLUMNS}})
+
+        return self._recompute_amounts(user_id, rule.place, None, None)
+
+    @_write_method
+    def recompute_amounts(
+        self,
+        user_id: int,
+        place: str | None = None,
+        start_datetime: datetime | None = None,
+        *,
+        hourly_wage: int | None = None,
+    ) -> int:
+        """指定されたユーザーの有効なシフトの金額を、勤務先ごとのルールでまとめて計算し直します。金額が変わったシフトの件数を返します。
+
+        勤務先や開始日時を指定した場合は、その勤務先や開始日時以降のシフトだけを対象にします。
+        hourly_wageを指定した場合は、対象のシフトの時給をその金額に変更してから計算します。
+        """
+        return self._recompute_amounts(user_id, place, start_datetime, hourly_wage)
+
+    def find_conflicts(
+        self,
+        user_id: int,
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> list[Shift]:
+        """指定されたユーザーの、指定期間と重なる有効なシフトのリストを開始日時順に取得します。"""
+        return self.get_shifts(user_id, start_datetime, end_datetime)
+
+    @_write_method
     def delete_shift(
         self,
         id: int,
@@ -258,27 +437,48 @@ class DBController:
             WHERE id = :id
         ''',
         {'id': id})
-        self.conn.commit()
 
     def get_shifts(
         self,
         user_id: int,
-    ) -> list[dict]:
-        """指定されたユーザーに登録されているシフトのリストを取得します。"""
-        self.cur.execute('''
-            SELECT id, place, title, start_datetime, end_datetime, break_time, hourly_wage FROM shifts
-            WHERE user_id = :user_id
-            AND is_valid = 1
-        ''',
-        {'user_id': user_id})
+        start_datetime: datetime | None = None,
+        end_datetime: datetime | None = None,
+    ) -> list[Shift]:
+        """指定されたユーザーに登録されているシフトのリストを取得します。期間を指定した場合はその期間と重なるシフトのみ取得します。"""
+        return [Shift.from_row(row) for row in self._select_shifts(user_id, start_datetime, end_datetime)]
 
-        shifts = [dict(row) for row in self.cur.fetchall()]
-        for shift in shifts:
-            shift['start_datetime'] = datetime.strptime(shift['start_datetime'], '%Y-%m-%d %H:%M:%S')
-            shift['end_datetime'] = datetime.strptime(shift['end_datetime'], '%Y-%m-%d %H:%M:%S')
-            shift['break_time'] = datetime.strptime(shift['break_time'], '%M:%S').time()
+    def iter_shifts(
+        self,
+        user_id: int,
+        *,
+        batch_size: int = 1000,
+    ) -> Iterator[Shift]:
+        """指定されたユーザーのシフトを開始日時順に少しずつ取得します。全件をメモリに読み込みません。"""
+        last_start_at = MIN_EPOCH
+        last_id = 0
+        while True:
+            # 前回の最後の行より後ろを取得し、途中で他の検索が行われてもカーソルの状態に依存しない
+            cursor = self.conn.cursor()
+            cursor.row_factory = None
+            try:
+                rows = cursor.execute('''
+                    SELECT id, place, title, start_datetime, end_datetime, break_time, hourly_wage FROM shifts
+                    WHERE user_id = :user_id
+                    AND is_valid = 1
+                    AND (start_datetime, id) > (:last_start_at, :last_id)
+                    ORDER BY start_datetime, id
+                    LIMIT :batch_size
+                ''',
+                {'user_id': user_id, 'last_start_at': last_start_at, 'last_id': last_id, 'batch_size': batch_size}).fetchall()
+            finally:
+                cursor.close()
 
-        return shifts
+            for row in rows:
+                yield Shift.from_row(row)
+
+            if len(rows) < batch_size:
+                return
+            last_id, _, _, last_start_at = rows[-1][:4]
 
     def get_amount(
         self,
@@ -287,21 +487,47 @@ class DBController:
         end_datetime: datetime,
     ) -> int:
         """指定されたユーザーの指定期間内の合計金額を取得します。"""
-        start_datetime_str = datetime.strftime(start_datetime, '%Y-%m-%d %H:%M:%S')
-        end_datetime_str = datetime.strftime(end_datetime, '%Y-%m-%d %H:%M:%S')
+        start_at = to_epoch(start_datetime)
+        end_at = to_epoch(end_datetime)
+        # 期間内に完全に含まれる日は日別集計から、前後の端数の日はシフトから合計する
+        first_day = -(-start_at // DAY_SECONDS)
+        last_day = (end_at + 1) // DAY_SECONDS
 
-        self.cur.execute('''
-            SELECT SUM(amount) AS amount FROM shifts
-            WHERE user_id = :user_id
-            AND end_datetime >= :start_datetime_str
-            AND end_datetime <= :end_datetime_str
-            AND is_valid = 1
-            LIMIT 1
-        ''',
-        {'user_id': user_id, 'start_datetime_str': start_datetime_str, 'end_datetime_str': end_datetime_str})
+        if first_day >= last_day:
+            self.cur.execute('''
+                SELECT SUM(amount) AS amount FROM shifts
+                WHERE user_id = :user_id
+                AND end_datetime >= :start_at
+                AND end_datetime <= :end_at
+                AND is_valid = 1
+                LIMIT 1
+            ''',
+            {'user_id': user_id, 'start_at': start_at, 'end_at': end_at})
+        else:
+            self.cur.execute('''
+                SELECT (
+                    SELECT TOTAL(amount) FROM daily_earnings
+                    WHERE user_id = :user_id
+                    AND day >= :first_day
+                    AND day < :last_day
+                ) + (
+                    SELECT TOTAL(amount) FROM shifts
+                    WHERE user_id = :user_id
+                    AND end_datetime >= :start_at
+                    AND end_datetime < :first_day * 86400
+                    AND is_valid = 1
+                ) + (
+                    SELECT TOTAL(amount) FROM shifts
+                    WHERE user_id = :user_id
+                    AND end_datetime >= :last_day * 86400
+                    AND end_datetime <= :end_at
+                    AND is_valid = 1
+                ) AS amount
+            ''',
+            {'user_id': user_id, 'start_at': start_at, 'end_at': end_at, 'first_day': first_day, 'last_day': last_day})
 
         result = self.cur.fetchone()
-        return result['amount'] if result['amount'] is not None else 0
+        return int(result['amount']) if result['amount'] is not None else 0
 
     def get_next_shift(
         self,
@@ -309,21 +535,548 @@ class DBController:
         start_datetime: datetime,
     ) -> datetime | None:
         """指定されたユーザーの次のシフトを取得します。"""
-        start_datetime_str = datetime.strftime(start_datetime, '%Y-%m-%d %H:%M:%S')
-
         self.cur.execute('''
             SELECT start_datetime FROM shifts
             WHERE user_id = :user_id
-            AND start_datetime >= :start_datetime_str
+            AND start_datetime >= :start_at
             AND is_valid = 1
             ORDER BY start_datetime
             LIMIT 1
         ''',
-        {'user_id': user_id, 'start_datetime_str': start_datetime_str})
+        {'user_id': user_id, 'start_at': to_epoch(start_datetime)})
 
         result = self.cur.fetchone()
         if result is None:
             return None
 
-        next_shift = datetime.strptime(result['start_datetime'], '%Y-%m-%d %H:%M:%S')
+        next_shift = from_epoch(result['start_datetime'])
         return next_shift
+
+    def get_shift_columns(self, user_id: int) -> dict[str, tuple]:
+        """指定されたユーザーの有効なシフトを、列名ごとの値のタプルとして1回の検索で取得します。日時と休憩時間は整数秒のままです。"""
+        # 行ごとの辞書を作らないよう、タプルを返すカーソルで取得して列ごとにまとめる
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        try:
+            rows = cursor.execute('''
+                SELECT place, start_datetime, end_datetime, break_time, hourly_wage, amount, period_key FROM shifts
+                WHERE user_id = :user_id
+                AND is_valid = 1
+            ''',
+            {'user_id': user_id}).fetchall()
+        finally:
+            cursor.close()
+
+        columns = zip(*rows) if rows else ((),) * len(SHIFT_COLUMNS)
+        return dict(zip(SHIFT_COLUMNS, columns))
+
+    def get_daily_amounts(
+        self,
+        user_id: int,
+        start_date: date,
+        end_date: date,
+    ) -> list[tuple[date, int]]:
+        """指定されたユーザーの、開始日から終了日の前日までの日ごとの合計金額を日付順に取得します。金額が0の日は含みません。"""
+        self.cur.execute('''
+            SELECT day, amount FROM daily_earnings
+            WHERE user_id = :user_id
+            AND day >= :start_day
+            AND day < :end_day
+            AND amount != 0
+            ORDER BY day
+        ''',
+        {
+            'user_id': user_id,
+            'start_day': (start_date - EPOCH.date()).days,
+            'end_day': (end_date - EPOCH.date()).days,
+        })
+
+        return [(EPOCH.date() + timedelta(days=row['day']), row['amount']) for row in self.cur.fetchall()]
+
+    def get_period_amounts(
+        self,
+        user_id: int,
+        today: date,
+        count: int,
+    ) -> list[tuple[date, date, int]]:
+        """指定されたユーザーの、指定日が属する給料期間までの直近count期間の(開始日, 終了日, 合計金額)を古い順に取得します。"""
+        user = self.get_user(user_id)
+        if user is None or count <= 0:
+            return []
+
+        table = get_period_table(get_period_key(today, user['closing_day']), count, user['closing_day'])
+        self.cur.execute('''
+            SELECT period_key, SUM(amount) AS amount FROM shifts
+            WHERE user_id = :user_id
+            AND period_key >= :first_period_key
+            AND period_key <= :last_period_key
+            AND is_valid = 1
+            GROUP BY period_key
+        ''',
+        {'user_id': user_id, 'first_period_key': table[0][0], 'last_period_key': table[-1][0]})
+
+        amounts = {row['period_key']: row['amount'] for row in self.cur.fetchall()}
+        return [(start_date, end_date, amounts.get(period_key, 0)) for period_key, start_date, end_date in table]
+
+    def get_recurrences(self, user_id: int, active_on: date) -> list[dict]:
+        """指定されたユーザーの、最終日付が指定日以降の繰り返し規則のリストを取得します。
+
+        最後の回のシフトが削除・置き換えされた繰り返しは、終了または編集されたものとして含めません。
+        """
+        self.cur.execute('''
+            SELECT id, place, title, start_datetime, end_datetime, break_time, hourly_wage, freq, until_day FROM recurrences
+            WHERE user_id = :user_id
+            AND until_day >= :active_day
+            AND is_valid = 1
+            ORDER BY id DESC
+        ''',
+        {'user_id': user_id, 'active_day': (active_on - EPOCH.date()).days})
+
+        rows = self.cur.fetchall()
+        recurrences = []
+        last_occurrences = []
+        for row in rows:
+            recurrence = Recurrence(row['freq'], EPOCH.date() + timedelta(days=row['until_day']))
+            start_datetime = from_epoch(row['start_datetime'])
+            end_datetime = from_epoch(row['end_datetime'])
+            last = recurrence.last_occurrence(start_datetime, end_datetime)
+            if last is None:
+                continue
+            recurrences.append({
+                'id': row['id'],
+                'place': row['place'],
+                'title': row['title'],
+                'start_datetime': start_datetime,
+                'end_datetime': end_datetime,
+                'break_time': seconds_to_time(row['break_time']),
+                'hourly_wage': row['hourly_wage'],
+                'recurrence': recurrence,
+            })
+            last_occurrences.append((row['place'], row['title'], to_epoch(last[0]), to_epoch(last[1])))
+
+        self.cur.execute('''
+            SELECT place, title, start_datetime, end_datetime FROM shifts
+            WHERE user_id = :user_id
+            AND start_datetime IN (SELECT value ->> 2 FROM json_each(:occurrences))
+            AND is_valid = 1
+        ''',
+        {'user_id': user_id, 'occurrences': json.dumps(last_occurrences)})
+
+        # 同じ最後の回を持つ繰り返しが複数ある場合は、後から登録したものだけを残す
+        remaining = {tuple(row) for row in self.cur.fetchall()}
+        active = []
+        for recurrence, last_occurrence in zip(recurrences, last_occurrences):
+            if last_occurrence in remaining:
+                remaining.discard(last_occurrence)
+                active.append(recurrence)
+        return active[::-1]
+
+    def get_data_version(self, user_id: int) -> int:
+        """指定されたユーザーのデータバージョンを取得します。シフト・繰り返し規則・割増賃金ルールが変更されるたびに増えます。"""
+        self.cur.execute('''
+            SELECT version FROM user_versions
+            WHERE user_id = :user_id
+        ''',
+        {'user_id': user_id})
+
+        result = self.cur.fetchone()
+        return result['version'] if result is not None else 0
+
+    def get_place_schedule(
+        self,
+        user_id: int,
+        place: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        *,
+        include_details: bool = False,
+    ) -> list[dict]:
+        """指定されたユーザーが登録している勤務先の、指定期間と重なる全ユーザーのシフトのリストを開始日時順に取得します。
+
+        include_detailsがFalseの場合、他のユーザーのユーザー名と金額はNoneにし、ユーザーIDはリスト内でだけ通用するラベルにします。登録していない勤務先の場合は空のリストを返します。
+        """
+        if place not in self.get_places(user_id):
+            return []
+        return _hide_other_users(self._get_place_schedule(place, start_datetime, end_datetime), user_id, include_details)
+
+    def get_place_staffing(
+        self,
+        user_id: int,
+        place: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        slot: timedelta,
+    ) -> list[StaffingSlot]:
+        """指定されたユーザーが登録している勤務先の、時間帯ごとの全ユーザーの勤務人数と人件費を取得します。登録していない勤務先の場合は空のリストを返します。"""
+        if place not in self.get_places(user_id):
+            return []
+        return self._get_place_staffing(place, start_datetime, end_datetime, slot)
+
+    def _write(self, method, *args, **kwargs):
+        """書き込み処理を実行してコミットします。書き込みキューがある場合は書き込みスレッドでの実行結果を待ちます。"""
+        if self.write_queue is not None:
+            if self.write_queue.is_writer_thread():
+                return method(*args, **kwargs)
+            return self.write_queue.submit(method, *args, **kwargs).result()
+
+        try:
+            result = method(*args, **kwargs)
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return result
+
+    def _insert_shifts(
+        self,
+        user_id: int,
+        results: list[BulkShiftResult],
+        candidates: list[tuple[int, int, int, str, str, int, int]],
+        is_upadate: bool,
+    ) -> None:
+        """既存のシフトとの重なりをまとめて確認してからシフトを追加し、resultsの状態を更新します。
+
+        candidatesは(resultsの添字, 開始(整数秒), 終了(整数秒), 勤務先, タイトル, 休憩(秒), 時給)のリストです。
+        """
+        if not candidates:
+            return
+
+        # CROSS JOINで結合順を固定し、各回ごとにR*Treeを検索させる
+        self.cur.execute('''
+            WITH occurrences (seq, start_at, end_at) AS (
+                SELECT value ->> 0, value ->> 1, value ->> 2 FROM json_each(:occurrences)
+            )
+            SELECT occurrences.seq, shifts.id FROM occurrences
+            CROSS JOIN shift_intervals
+            ON shift_intervals.min_user_id <= :user_id
+            AND shift_intervals.max_user_id >= :user_id
+            AND shift_intervals.start_at < occurrences.end_at
+            AND shift_intervals.end_at > occurrences.start_at
+            CROSS JOIN shifts
+            ON shifts.id = shift_intervals.id
+            AND shifts.user_id = :user_id
+            AND shifts.start_datetime < occurrences.end_at
+            AND shifts.end_datetime > occurrences.start_at
+            AND shifts.is_valid = 1
+        ''',
+        {'user_id': user_id, 'occurrences': json.dumps([candidate[:3] for candidate in candidates])})
+
+        for row in self.cur.fetchall():
+            result = results[row['seq']]
+            result.status = REPLACED if is_upadate else SKIPPED
+            result.replaced_ids.append(row['id'])
+
+        closing_day = self._get_closing_day(user_id)
+        rules = self._get_wage_rules(user_id)
+        rows = []
+        replaced_ids = set()
+        for seq, start_at, end_at, place, title, break_seconds, hourly_wage in candidates:
+            result = results[seq]
+            if result.status == SKIPPED:
+                result.replaced_ids.clear()
+                continue
+            replaced_ids.update(result.replaced_ids)
+            amount = calc_rule_amount(rules.get(place), start_at, end_at, break_seconds, hourly_wage)
+            period_key = get_period_key(from_epoch(end_at), closing_day) if closing_day is not None else None
+            rows.append((user_id, place, title, start_at, end_at, break_seconds, hourly_wage, amount, period_key))
+
+        self.cur.executemany('''
+            UPDATE shifts
+            SET is_valid = 0
+            WHERE id = ?
+        ''',
+        [(shift_id,) for shift_id in replaced_ids])
+
+        self.cur.executemany('''
+            INSERT INTO shifts (
+                user_id,
+                place,
+                title,
+                start_datetime,
+                end_datetime,
+                break_time,
+                hourly_wage,
+                amount,
+                period_key
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        rows)
+
+    def _get_closing_day(self, user_id: int) -> int | None:
+        """指定されたユーザーの締め日を取得します。ユーザーが存在しない場合はNoneを返します。"""
+        self.cur.execute('''
+            SELECT closing_day FROM users
+            WHERE id = :user_id
+        ''',
+        {'user_id': user_id})
+
+        result = self.cur.fetchone()
+        return result['closing_day'] if result is not None else None
+
+    def _get_place_schedule(
+        self,
+        place: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> list[dict]:
+        """指定された勤務先の、指定期間と重なる全ユーザーのシフトのリストを開始日時順に取得します。アクセスの確認はしません。"""
+        start_at = to_epoch(start_datetime)
+        end_at = to_epoch(end_datetime)
+
+        # 勤務先のシフトの最大の長さで開始日時の下限を決め、インデックスの範囲検索だけで重なるシフトを取得する
+        self.cur.execute('''
+            SELECT
+                shifts.id,
+                shifts.user_id,
+                users.username,
+                shifts.start_datetime,
+                shifts.end_datetime,
+                shifts.amount
+            FROM shifts
+            JOIN users
+            ON users.id = shifts.user_id
+            WHERE shifts.place = :place
+            AND shifts.start_datetime >= :start_at - :max_span
+            AND shifts.start_datetime < :end_at
+            AND shifts.end_datetime > :start_at
+            AND shifts.is_valid = 1
+            ORDER BY shifts.start_datetime, shifts.id
+        ''',
+        {'place': place, 'start_at': start_at, 'end_at': end_at, 'max_span': self._get_max_span(place)})
+
+        schedule = []
+        for row in self.cur.fetchall():
+            shift = dict(row)
+            shift['start_datetime'] = from_epoch(shift['start_datetime'])
+            shift['end_datetime'] = from_epoch(shift['end_datetime'])
+            schedule.append(shift)
+        return schedule
+
+    def _get_place_staffing(
+        self,
+        place: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        slot: timedelta,
+    ) -> list[StaffingSlot]:
+        """指定された勤務先の指定期間を時間帯に区切り、時間帯ごとの全ユーザーの勤務人数と人件費を1回の集計で取得します。アクセスの確認はしません。
+
+        人件費は各シフトの金額を、時間帯と重なる時間の割合で按分して合計します。
+        """
+        start_at = to_epoch(start_datetime)
+        end_at = to_epoch(end_datetime)
+        slot_seconds = slot // SECOND
+        if slot_seconds <= 0:
+            raise ValueError('時間帯の長さは1秒以上にしてください')
+        if start_at >= end_at:
+            return []
+
+        # 時間帯を再帰CTEで生成し、時間帯ごとに勤務先と開始日時のインデックスを範囲検索する
+        self.cur.execute('''
+            WITH RECURSIVE slots (slot_start, slot_end) AS (
+                SELECT :start_at, MIN(:start_at + :slot_seconds, :end_at)
+                UNION ALL
+                SELECT slot_end, MIN(slot_end + :slot_seconds, :end_at) FROM slots
+                WHERE slot_end < :end_at
+            )
+            SELECT
+                slots.slot_start,
+                slots.slot_end,
+                COUNT(DISTINCT shifts.user_id) AS staff_count,
+                TOTAL(
+                    shifts.amount * 1.0
+                    * (MIN(shifts.end_datetime, slots.slot_end) - MAX(shifts.start_datetime, slots.slot_start))
+                    / (shifts.end_datetime - shifts.start_datetime)
+                ) AS labor_cost
+            FROM slots
+            LEFT JOIN shifts
+            ON shifts.place = :place
+            AND shifts.start_datetime >= slots.slot_start - :max_span
+            AND shifts.start_datetime < slots.slot_end
+            AND shifts.end_datetime > slots.slot_start
+            AND shifts.is_valid = 1
+            GROUP BY slots.slot_start
+            ORDER BY slots.slot_start
+        ''',
+        {
+            'place': place,
+            'start_at': start_at,
+            'end_at': end_at,
+            'slot_seconds': slot_seconds,
+            'max_span': self._get_max_span(place),
+        })
+
+        staffing = [
+            StaffingSlot(
+                start_datetime=from_epoch(row['slot_start']),
+                end_datetime=from_epoch(row['slot_end']),
+                staff_count=row['staff_count'],
+                labor_cost=round(row['labor_cost']),
+            )
+            for row in self.cur.fetchall()
+        ]
+        return staffing
+
+    def _get_max_span(self, place: str) -> int:
+        """指定された勤務先のシフトの最大の長さ(秒)を取得します。シフトがない場合は0を返します。"""
+        self.cur.execute('''
+            SELECT max_span FROM place_spans
+            WHERE place = :place
+        ''',
+        {'place': place})
+
+        result = self.cur.fetchone()
+        return result['max_span'] if result is not None else 0
+
+    def _get_wage_rules(self, user_id: int, place: str | None = None) -> dict[str, WageRule]:
+        """指定されたユーザーの割増賃金ルールを取得します。勤務先を指定した場合はその勤務先のルールだけを取得します。"""
+        self.cur.execute(f'''
+            SELECT {', '.join(WAGE_RULE_COLUMNS)} FROM wage_rules
+            WHERE user_id = :user_id
+            AND (:place IS NULL OR place = :place)
+        ''',
+        {'user_id': user_id, 'place': place})
+
+        return {row['place']: WageRule(*row) for row in self.cur.fetchall()}
+
+    def _recompute_amounts(
+        self,
+        user_id: int,
+        place: str | None,
+        start_datetime: datetime | None,
+        hourly_wage: int | None,
+    ) -> int:
+        """シフトの金額を配列でまとめて計算し直し、変わったシフトだけを1回のUPDATEで書き戻します。"""
+        if hourly_wage is not None and place is None:
+            raise ValueError('時給を変更する場合は勤務先を指定してください')
+
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        try:
+            rows = cursor.execute('''
+                SELECT id, place, start_datetime, end_datetime, break_time, hourly_wage, amount FROM shifts
+                WHERE user_id = :user_id
+                AND start_datetime >= :start_at
+                AND (:place IS NULL OR place = :place)
+                AND is_valid = 1
+            ''',
+            {
+                'user_id': user_id,
+                'place': place,
+                'start_at': to_epoch(start_datetime) if start_datetime is not None else MIN_EPOCH,
+            }).fetchall()
+        finally:
+            cursor.close()
+
+        changes = calc_amount_changes(self._get_wage_rules(user_id, place), rows, hourly_wage)
+        if not changes:
+            return 0
+
+        self.cur.execute('''
+            UPDATE shifts
+            SET hourly_wage = changes.hourly_wage,
+                amount = changes.amount
+            FROM (
+                SELECT value ->> 0 AS id, value ->> 1 AS hourly_wage, value ->> 2 AS amount FROM json_each(:changes)
+            ) AS changes
+            WHERE shifts.id = changes.id
+        ''',
+        {'changes': json.dumps(changes)})
+
+        return len(changes)
+
+    def _update_period_keys(self, user_id: int) -> None:
+        """指定されたユーザーのシフトの給料期間キーを、現在の締め日で計算し直します。"""
+        self.cur.execute(f'''
+            UPDATE shifts
+            SET period_key = {PERIOD_KEY_SQL.format(closing_day=':closing_day')}
+            WHERE user_id = :user_id
+        ''',
+        {'user_id': user_id, 'closing_day': self._get_closing_day(user_id)})
+
+    def _find_conflict_ids(self, user_id: int, start_at: int, end_at: int) -> list[int]:
+        """指定されたユーザーの、指定期間(整数秒)と重なる有効なシフトのIDを取得します。"""
+        # CROSS JOINで結合順を固定し、R*Treeで候補を絞り込んでから厳密に比較する
+        self.cur.execute('''
+            SELECT shifts.id FROM shift_intervals
+            CROSS JOIN shifts
+            ON shifts.id = shift_intervals.id
+            WHERE shift_intervals.min_user_id <= :user_id
+            AND shift_intervals.max_user_id >= :user_id
+            AND shift_intervals.start_at < :end_at
+            AND shift_intervals.end_at > :start_at
+            AND shifts.user_id = :user_id
+            AND shifts.start_datetime < :end_at
+            AND shifts.end_datetime > :start_at
+            AND shifts.is_valid = 1
+        ''',
+        {'user_id': user_id, 'start_at': start_at, 'end_at': end_at})
+
+        return [row['id'] for row in self.cur.fetchall()]
+
+    def _select_shifts(
+        self,
+        user_id: int,
+        start_datetime: datetime | None,
+        end_datetime: datetime | None,
+    ) -> list[tuple[int, str, str, int, int, int, int]]:
+        """指定されたユーザーの有効なシフトを(ID, 勤務先, タイトル, 開始, 終了, 休憩, 時給)のタプルで取得します。"""
+        # 行ごとのsqlite3.Rowを作らないよう、タプルを返すカーソルで取得する
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        try:
+            if start_datetime is None and end_datetime is None:
+                return cursor.execute('''
+                    SELECT id, place, title, start_datetime, end_datetime, break_time, hourly_wage FROM shifts
+                    WHERE user_id = :user_id
+                    AND is_valid = 1
+                ''',
+                {'user_id': user_id}).fetchall()
+
+            # CROSS JOINで結合順を固定し、R*Treeで候補を絞り込んでから厳密に比較する
+            return cursor.execute('''
+                SELECT
+                    shifts.id,
+                    shifts.place,
+                    shifts.title,
+                    shifts.start_datetime,
+                    shifts.end_datetime,
+                    shifts.break_time,
+                    shifts.hourly_wage
+                FROM shift_intervals
+                CROSS JOIN shifts
+                ON shifts.id = shift_intervals.id
+                WHERE shift_intervals.min_user_id <= :user_id
+                AND shift_intervals.max_user_id >= :user_id
+                AND shift_intervals.start_at < :end_at
+                AND shift_intervals.end_at > :start_at
+                AND shifts.user_id = :user_id
+                AND shifts.start_datetime < :end_at
+                AND shifts.end_datetime > :start_at
+                AND shifts.is_valid = 1
+                ORDER BY shifts.start_datetime
+            ''',
+            {
+                'user_id': user_id,
+                'start_at': MIN_EPOCH if start_datetime is None else to_epoch(start_datetime),
+                'end_at': MAX_EPOCH if end_datetime is None else to_epoch(end_datetime),
+            }).fetchall()
+        finally:
+            cursor.close()
+
+
+def _hide_other_users(schedule: list[dict], user_id: int, include_details: bool) -> list[dict]:
+    """勤務先のシフトのリストから、指定されたユーザー以外のユーザーID・ユーザー名・金額を取り除きます。include_detailsがTrueの場合はそのまま返します。
+
+    他のユーザーのユーザーIDは、このリストの中でだけ同じユーザーを区別できるラベル('other1'など)に置き換えます。
+    """
+    if include_details:
+        return schedule
+    labels = {}
+    for shift in schedule:
+        if shift['user_id'] != user_id:
+            shift['user_id'] = labels.setdefault(shift['user_id'], f'other{len(labels) + 1}')
+            shift['username'] = None
+            shift['amount'] = None
+    return schedule
@@ -0,0 +1,26 @@
+from datetime import datetime, time, timedelta
+
+
+# タイムゾーンを持たない日時を、そのまま1970-01-01 00:00:00からの秒数として保存する
+EPOCH = datetime(1970, 1, 1)
+SECOND = timedelta(seconds=1)
+
+
+def to_epoch(value: datetime) -> int:
+    """日時を整数秒に変換します。秒未満は切り捨てます。"""
+    return (value - EPOCH) // SECOND
+
+
+def from_epoch(seconds: int) -> datetime:
+    """整数秒を日時に変換します。"""
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def time_to_seconds(value: time) -> int:
+    """時刻(時間の長さとして扱う)を整数秒に変換します。"""
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def seconds_to_time(seconds: int) -> time:
+    """整数秒を時刻(時間の長さとして扱う)に変換します。"""
+    return time(seconds // 3600, seconds // 60 % 60, seconds % 60)
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+
+from module.instrument import get_instrumentation, instrument_controller, InstrumentedConnection
+
+from .cache import CachedDBController
+from .db_controller import DBController, DEFAULT_DATABASE
+from .shard import get_shard_paths, ShardedDBController
+
+
+_controllers: dict[tuple, DBController | ShardedDBController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_db_controller(
+    database: str | None = None,
+    *,
+    cached: bool = True,
+    write_queue: bool | None = None,
+    shards: int | None = None,
+) -> DBController | ShardedDBController:
+    """プロセス全体で共有するDBControllerを取得します。初回のみ生成とスキーマの更新を行います。
+
+    databaseを省略した場合は、環境変数SHIFT_DB_PATHに指定されたデータベースファイル(未指定の場合はshift.db)を使います。
+    write_queueを省略した場合は、環境変数SHIFT_WRITE_QUEUE=1のときに書き込みキューを使います。
+    shardsを省略した場合は、環境変数SHIFT_SHARDSにシャードの数が指定されていればユーザーごとにデータベースファイルを振り分けます。
+    """
+    if database is None:
+        database = os.environ.get('SHIFT_DB_PATH', DEFAULT_DATABASE)
+    if write_queue is None:
+        write_queue = os.environ.get('SHIFT_WRITE_QUEUE') == '1'
+    if shards is None:
+        shards = int(os.environ.get('SHIFT_SHARDS', '0'))
+    key = (database, cached, write_queue, shards)
+    with _controllers_lock:
+        db = _controllers.get(key)
+        if db is None:
+            # 計測が有効な場合はSQLとメソッドの実行時間を記録する
+            instrumented = get_instrumentation().enabled
+            connection_factory = InstrumentedConnection if instrumented else sqlite3.Connection
+            if shards:
+                db = ShardedDBController(
+                    database,
+                    get_shard_paths(database, shards),
+                    cached=cached,
+                    connection_factory=connection_factory,
+                    write_queue=write_queue,
+                )
+            elif cached:
+                db = CachedDBController(database, connection_factory=connection_factory, write_queue=write_queue)
+            else:
+                db = DBController(database, connection_factory=connection_factory, write_queue=write_queue)
+            if instrumented:
+                instrument_controller(db)
+            _controllers[key] = db
+        return db
@@ -0,0 +1,260 @@
+import argparse
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import heapq
+import json
+import os
+import sqlite3
+
+from .db_controller import DEFAULT_DATABASE
+from .shard import get_shard_paths
+
+
+DEFAULT_CHUNK_USERS = 200  # 1つのプロセスでまとめて検査するユーザー数
+DEFAULT_BATCH_SIZE = 1000  # 修復時に1つのトランザクションで無効化するシフト数
+MAX_SAMPLES = 20  # 報告に含める重なりの例の数
+
+
+@dataclass(frozen=True)
+class Conflict:
+    """同じユーザーの有効なシフト同士の重なりを表すクラス"""
+    user_id: int
+    shift_id: int
+    other_id: int
+    overlap_seconds: int
+
+
+@dataclass
+class ScanResult:
+    """ユーザーの範囲1つ分の検査結果を表すクラス"""
+    scanned_users: int = 0
+    scanned_shifts: int = 0
+    conflict_pairs: int = 0
+    conflicting_shifts: int = 0
+    invalid_ids: list[int] = field(default_factory=list)
+    duplicated_amount: int = 0
+    samples: list[Conflict] = field(default_factory=list)
+
+
+@dataclass
+class IntegrityReport:
+    """データベース全体の重なりの検査と修復の結果を表すクラス"""
+    scanned_users: int = 0
+    scanned_shifts: int = 0
+    conflict_pairs: int = 0
+    conflicting_shifts: int = 0
+    invalid_ids: list[int] = field(default_factory=list)
+    duplicated_amount: int = 0
+    repaired_shifts: int = 0
+    samples: list[Conflict] = field(default_factory=list)
+
+    def merge(self, result: ScanResult) -> None:
+        """ユーザーの範囲1つ分の検査結果を足し合わせます。"""
+        self.scanned_users += result.scanned_users
+        self.scanned_shifts += result.scanned_shifts
+        self.conflict_pairs += result.conflict_pairs
+        self.conflicting_shifts += result.conflicting_shifts
+        self.invalid_ids.extend(result.invalid_ids)
+        self.duplicated_amount += result.duplicated_amount
+        self.samples.extend(result.samples[:MAX_SAMPLES - len(self.samples)])
+
+    def __str__(self) -> str:
+        lines = [
+            f'検査したユーザー: {self.scanned_users:,}人',
+            f'検査したシフト: {self.scanned_shifts:,}件',
+            f'重なっている組: {self.conflict_pairs:,}組',
+            f'重なりのあるシフト: {self.conflicting_shifts:,}件',
+            f'無効化が必要なシフト: {len(self.invalid_ids):,}件 (二重に計上されている金額 {self.duplicated_amount:,}円)',
+            f'無効化したシフト: {self.repaired_shifts:,}件',
+        ]
+        for conflict in self.samples:
+            lines.append(
+                f'  ユーザー{conflict.user_id}: シフト{conflict.shift_id}とシフト{conflict.other_id}が{conflict.overlap_seconds // 60:,}分重なっています'
+            )
+        return '\n'.join(lines)
+
+
+def find_overlaps(shifts: list[tuple[int, int, int]]) -> list[tuple[int, int, int]]:
+    """(ID, 開始(整数秒), 終了(整数秒))のリストから、重なっているすべての組を(ID, ID, 重なる秒数)で取得します。
+
+    開始日時順に並べて走査し、まだ終わっていないシフトを終了日時のヒープで保持するため、O(n log n + 組の数)で求められます。
+    """
+    overlaps = []
+    active = []  # (終了, ID, 開始)のヒープ
+    for shift_id, start_at, end_at in sorted(shifts, key=lambda shift: (shift[1], shift[0])):
+        while active and active[0][0] <= start_at:
+            heapq.heappop(active)
+        for other_end_at, other_id, _ in active:
+            overlaps.append((other_id, shift_id, min(end_at, other_end_at) - start_at))
+        heapq.heappush(active, (end_at, shift_id, start_at))
+    return overlaps
+
+
+def select_invalid_ids(shifts: list[tuple[int, int, int]]) -> list[int]:
+    """重なりを解消するために無効化するシフトのIDを取得します。IDが大きい(後から登録した)シフトを優先して残します。"""
+    invalid_ids = []
+    for cluster in _get_clusters(shifts):
+        # 残すシフトを開始日時順に保持し、前後のシフトとだけ重なりを確認する
+        kept_starts = []
+        kept_ends = []
+        for shift_id, start_at, end_at in sorted(cluster, key=lambda shift: -shift[0]):
+            index = bisect_left(kept_starts, start_at)
+            if (index > 0 and kept_ends[index - 1] > start_at) or (index < len(kept_starts) and kept_starts[index] < end_at):
+                invalid_ids.append(shift_id)
+                continue
+            kept_starts.insert(index, start_at)
+            kept_ends.insert(index, end_at)
+    return invalid_ids
+
+
+def scan(
+    database: str = DEFAULT_DATABASE,
+    *,
+    repair: bool = False,
+    workers: int | None = None,
+    chunk_users: int = DEFAULT_CHUNK_USERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> IntegrityReport:
+    """データベース全体の有効なシフトの重なりを、ユーザーの範囲ごとにプロセスを分けて検査します。
+
+    repairがTrueの場合は、後から登録したシフトを残すように選んだシフトをbatch_size件ずつのトランザクションで無効化します。
+    """
+    conn = sqlite3.connect(database)
+    try:
+        user_ids = [row[0] for row in conn.execute('SELECT DISTINCT user_id FROM shifts WHERE is_valid = 1 ORDER BY user_id')]
+    finally:
+        conn.close()
+
+    ranges = [
+        (user_ids[index], user_ids[min(index + chunk_users, len(user_ids)) - 1])
+        for index in range(0, len(user_ids), chunk_users)
+    ]
+
+    report = IntegrityReport()
+    if len(ranges) <= 1 or workers == 1:
+        for first_user_id, last_user_id in ranges:
+            report.merge(_scan_users(database, first_user_id, last_user_id))
+    else:
+        with ProcessPoolExecutor(max_workers=workers or min(len(ranges), os.cpu_count() or 1)) as executor:
+            for result in executor.map(_scan_users, [database] * len(ranges), *zip(*ranges)):
+                report.merge(result)
+
+    if repair:
+        report.repaired_shifts = _invalidate(database, report.invalid_ids, batch_size)
+    return report
+
+
+def _get_clusters(shifts: list[tuple[int, int, int]]) -> list[list[tuple[int, int, int]]]:
+    """開始日時順に走査し、互いに重なりでつながっている2件以上のシフトのまとまりを取得します。"""
+    clusters = []
+    cluster = []
+    cluster_end_at = None
+    for shift in sorted(shifts, key=lambda shift: (shift[1], shift[0])):
+        if cluster_end_at is not None and shift[1] < cluster_end_at:
+            cluster.append(shift)
+            cluster_end_at = max(cluster_end_at, shift[2])
+            continue
+        if len(cluster) > 1:
+            clusters.append(cluster)
+        cluster = [shift]
+        cluster_end_at = shift[2]
+    if len(cluster) > 1:
+        clusters.append(cluster)
+    return clusters
+
+
+def _scan_users(database: str, first_user_id: int, last_user_id: int) -> ScanResult:
+    """指定された範囲のユーザーの有効なシフトを読み取り専用の接続で読み込み、ユーザーごとに重なりを検査します。"""
+    result = ScanResult()
+    conn = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    try:
+        rows = conn.execute('''
+            SELECT user_id, id, start_datetime, end_datetime, amount FROM shifts
+            WHERE user_id >= :first_user_id
+            AND user_id <= :last_user_id
+            AND is_valid = 1
+            ORDER BY user_id, start_datetime
+        ''',
+        {'first_user_id': first_user_id, 'last_user_id': last_user_id}).fetchall()
+    finally:
+        conn.close()
+
+    amounts = {row[1]: row[4] for row in rows}
+    user_shifts = []
+    for index, (user_id, shift_id, start_at, end_at, _) in enumerate(rows):
+        user_shifts.append((shift_id, start_at, end_at))
+        if index + 1 < len(rows) and rows[index + 1][0] == user_id:
+            continue
+
+        result.scanned_users += 1
+        result.scanned_shifts += len(user_shifts)
+        overlaps = find_overlaps(user_shifts)
+        if overlaps:
+            invalid_ids = select_invalid_ids(user_shifts)
+            result.conflict_pairs += len(overlaps)
+            result.conflicting_shifts += len({shift_id for pair in overlaps for shift_id in pair[:2]})
+            result.invalid_ids.extend(invalid_ids)
+            result.duplicated_amount += sum(amounts[shift_id] for shift_id in invalid_ids)
+            result.samples.extend(
+                Conflict(user_id, shift_id, other_id, seconds)
+                for shift_id, other_id, seconds in overlaps[:MAX_SAMPLES - len(result.samples)]
+            )
+        user_shifts = []
+
+    return result
+
+
+def _invalidate(database: str, shift_ids: list[int], batch_size: int) -> int:
+    """シフトをbatch_size件ずつのトランザクションで無効化し、無効化した件数を返します。"""
+    invalidated = 0
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        conn.execute('PRAGMA busy_timeout = 5000')
+        for index in range(0, len(shift_ids), batch_size):
+            # アプリの書き込みを長く止めないよう、小さいトランザクションに分ける
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                invalidated += conn.execute('''
+                    UPDATE shifts
+                    SET is_valid = 0
+                    WHERE id IN (SELECT value FROM json_each(:ids))
+                    AND is_valid = 1
+                ''',
+                {'ids': json.dumps(shift_ids[index:index + batch_size])}).rowcount
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+    finally:
+        conn.close()
+    return invalidated
+
+
+def main() -> None:
+    """コマンドラインからscanを実行します。"""
+    parser = argparse.ArgumentParser(description='同じユーザーの有効なシフト同士の重なりを検査し、必要に応じて修復します。')
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='データベースファイルのパス')
+    parser.add_argument('--shards', type=int, default=0, help='シャードの数(指定した場合はシャードのファイルも検査する)')
+    parser.add_argument('--repair', action='store_true', help='重なっているシフトのうち先に登録したものを無効化する')
+    parser.add_argument('--workers', type=int, default=None, help='検査に使うプロセス数(省略時はCPU数)')
+    parser.add_argument('--chunk-users', type=int, default=DEFAULT_CHUNK_USERS, help='1つのプロセスでまとめて検査するユーザー数')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='修復時に1つのトランザクションで無効化するシフト数')
+    args = parser.parse_args()
+
+    databases = [args.database, *(get_shard_paths(args.database, args.shards) if args.shards else ())]
+    for database in databases:
+        if not os.path.exists(database):
+            continue
+        print(f'[{database}]')
+        print(scan(
+            database,
+            repair=args.repair,
+            workers=args.workers,
+            chunk_users=args.chunk_users,
+            batch_size=args.batch_size,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import logging
+import os
+import sqlite3
+import threading
+
+from .db_controller import DEFAULT_DATABASE
+from .epoch import to_epoch
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 90  # 無効化されたシフトを残しておく日数
+
+TABLES = ('users', 'places', 'shifts')
+
+
+@dataclass
+class CompactionReport:
+    """無効データの退避と再編成の結果を表すクラス"""
+    archived_shifts: int = 0
+    archived_places: int = 0
+    row_counts_before: dict[str, int] = field(default_factory=dict)
+    row_counts_after: dict[str, int] = field(default_factory=dict)
+    file_size_before: int = 0
+    file_size_after: int = 0
+
+    @property
+    def reclaimed_bytes(self) -> int:
+        """削減されたファイルサイズ(バイト)を取得します。"""
+        return self.file_size_before - self.file_size_after
+
+    def __str__(self) -> str:
+        lines = [
+            f'退避したシフト: {self.archived_shifts:,}件',
+            f'退避した勤務先: {self.archived_places:,}件',
+        ]
+        for table in TABLES:
+            lines.append(f'{table}: {self.row_counts_before.get(table, 0):,}件 -> {self.row_counts_after.get(table, 0):,}件')
+        lines.append(f'ファイルサイズ: {self.file_size_before:,}バイト -> {self.file_size_after:,}バイト (削減 {self.reclaimed_bytes:,}バイト)')
+        return '\n'.join(lines)
+
+
+def compact(
+    database: str = DEFAULT_DATABASE,
+    *,
+    retention_days: int = DEFAULT_RETENTION_DAYS,
+    archive_database: str | None = None,
+    now: datetime | None = None,
+) -> CompactionReport:
+    """保持期間を過ぎた無効なシフトと無効な勤務先をアーカイブファイルへ移し、空き領域を解放します。"""
+    if archive_database is None:
+        archive_database = _get_archive_path(database)
+    if now is None:
+        now = datetime.now()
+    cutoff_at = to_epoch(now - timedelta(days=retention_days))
+
+    report = CompactionReport()
+    # VACUUMはトランザクション外でしか実行できないため、自動コミットの接続を使う
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        conn.execute('PRAGMA busy_timeout = 5000')
+        report.file_size_before = _get_file_size(database)
+        report.row_counts_before = _count_rows(conn)
+
+        conn.execute('ATTACH DATABASE ? AS archive', (archive_database,))
+        _create_archive_tables(conn)
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            report.archived_shifts = conn.execute('''
+                INSERT INTO archive.shifts (
+                    id,
+                    user_id,
+                    place,
+                    title,
+                    start_datetime,
+                    end_datetime,
+                    break_time,
+                    hourly_wage,
+                    amount,
+                    is_valid,
+                    period_key,
+                    archived_at
+                )
+                SELECT
+                    id,
+                    user_id,
+                    place,
+                    title,
+                    start_datetime,
+                    end_datetime,
+                    break_time,
+                    hourly_wage,
+                    amount,
+                    is_valid,
+                    period_key,
+                    :archived_at
+                FROM main.shifts
+                WHERE is_valid = 0
+                AND end_datetime < :cutoff_at
+            ''',
+            {'cutoff_at': cutoff_at, 'archived_at': to_epoch(now)}).rowcount
+            conn.execute('''
+                DELETE FROM main.shifts
+                WHERE is_valid = 0
+                AND end_datetime < :cutoff_at
+            ''',
+            {'cutoff_at': cutoff_at})
+
+            # 勤務先には日時がないため、無効なものはすべて退避する
+            report.archived_places = conn.execute('''
+                INSERT INTO archive.places (id, user_id, name, is_valid, archived_at)
+                SELECT id, user_id, name, is_valid, :archived_at FROM main.places
+                WHERE is_valid = 0
+            ''',
+            {'archived_at': to_epoch(now)}).rowcount
+            conn.execute('''
+                DELETE FROM main.places
+                WHERE is_valid = 0
+            ''')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.execute('DETACH DATABASE archive')
+
+        _vacuum(conn)
+        conn.execute('PRAGMA analysis_limit = 1000')
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+        report.row_counts_after = _count_rows(conn)
+        report.file_size_after = _get_file_size(database)
+    finally:
+        conn.close()
+
+    return report
+
+
+class MaintenanceThread(threading.Thread):
+    """一定間隔でcompactを実行するバックグラウンドスレッドクラス"""
+    def __init__(
+        self,
+        database: str = DEFAULT_DATABASE,
+        *,
+        interval: float = 24 * 60 * 60,
+        retention_days: int = DEFAULT_RETENTION_DAYS,
+        archive_database: str | None = None,
+    ):
+        """スレッドを初期化します。intervalは秒単位の実行間隔です。"""
+        super().__init__(name='shift-db-maintenance', daemon=True)
+        self.database = database
+        self.interval = interval
+        self.retention_days = retention_days
+        self.archive_database = archive_database
+        self.last_report: CompactionReport | None = None
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.last_report = compact(
+                    self.database,
+                    retention_days=self.retention_days,
+                    archive_database=self.archive_database,
+                )
+                logger.info('データベースを再編成しました\n%s', self.last_report)
+            except sqlite3.Error:
+                logger.exception('データベースの再編成に失敗しました')
+
+    def stop(self) -> None:
+        """スレッドを停止します。"""
+        self._stop_event.set()
+
+
+def _get_archive_path(database: str) -> str:
+    """データベースファイルに対応するアーカイブファイルのパスを取得します。"""
+    root, ext = os.path.splitext(database)
+    return f'{root}_archive{ext or ".db"}'
+
+
+def _get_file_size(database: str) -> int:
+    """データベースファイルとWALファイルの合計サイズを取得します。"""
+    return sum(
+        os.path.getsize(path)
+        for path in (database, f'{database}-wal')
+        if os.path.exists(path)
+    )
+
+
+def _count_rows(conn: sqlite3.Connection) -> dict[str, int]:
+    """各テーブルの行数を取得します。"""
+    return {table: conn.execute(f'SELECT COUNT(*) FROM main.{table}').fetchone()[0] for table in TABLES}
+
+
+def _create_archive_tables(conn: sqlite3.Connection) -> None:
+    """アーカイブ用のテーブルを作成します。"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive.shifts (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            place TEXT NOT NULL,
+            title TEXT NOT NULL,
+            start_datetime INTEGER NOT NULL,
+            end_datetime INTEGER NOT NULL,
+            break_time INTEGER NOT NULL,
+            hourly_wage INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            is_valid INTEGER NOT NULL,
+            period_key INTEGER,
+            archived_at INTEGER NOT NULL
+        )
+    ''')
+    # 給料期間のキーを追加する前に作成したアーカイブには列を追加する
+    columns = {row[1] for row in conn.execute('PRAGMA archive.table_info(shifts)')}
+    if 'period_key' not in columns:
+        conn.execute('ALTER TABLE archive.shifts ADD COLUMN period_key INTEGER')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive.places (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            is_valid INTEGER NOT NULL,
+            archived_at INTEGER NOT NULL
+        )
+    ''')
+
+
+def _vacuum(conn: sqlite3.Connection) -> None:
+    """空きページを解放します。初回のみ増分VACUUMを有効にするため全体をVACUUMします。"""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        # incremental_vacuumは1ステップごとに1ページずつ解放するが、execute()は列のない文を1ステップで終えるため、最後まで実行するexecutescript()を使う
+        conn.executescript('PRAGMA incremental_vacuum;')
+    else:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+
+
+def main() -> None:
+    """コマンドラインからcompactを実行します。"""
+    parser = argparse.ArgumentParser(description='無効なシフトと勤務先をアーカイブへ移し、データベースを再編成します。')
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='データベースファイルのパス')
+    parser.add_argument('--retention-days', type=int, default=DEFAULT_RETENTION_DAYS, help='無効なシフトを残しておく日数')
+    parser.add_argument('--archive', default=None, help='アーカイブファイルのパス(省略時は<データベース名>_archive.db)')
+    args = parser.parse_args()
+
+    print(compact(args.database, retention_days=args.retention_days, archive_database=args.archive))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+from dataclasses import dataclass
+import sqlite3
+from typing import Callable
+
+from .period import PERIOD_KEY_SQL
+
+
+@dataclass(frozen=True)
+class Migration:
+    """スキーマのマイグレーションを表すクラス"""
+    version: int
+    description: str
+    statements: tuple[str | Callable[[sqlite3.Connection], None], ...]
+
+    def apply(self, conn: sqlite3.Connection) -> None:
+        """マイグレーションのSQL(または関数)を順に実行します。"""
+        for statement in self.statements:
+            if callable(statement):
+                statement(conn)
+            else:
+                conn.execute(statement)
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(1, '基本テーブルの作成', (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            password TEXT NOT NULL,
+            closing_day INTEGER NOT NULL,
+            goal_amount INTEGER NOT NULL,
+            is_valid INTEGER DEFAULT 1
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS places (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            is_valid INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shifts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            place TEXT NOT NULL,
+            title TEXT NOT NULL,
+            start_datetime TEXT NOT NULL,
+            end_datetime TEXT NOT NULL,
+            break_time TEXT NOT NULL,
+            hourly_wage INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            is_valid INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        ''',
+    )),
+    Migration(2, 'ユーザー名・勤務先・シフト検索用インデックスの追加', (
+        # login, is_exist_user
+        '''
+        CREATE INDEX IF NOT EXISTS idx_users_username
+        ON users (username) WHERE is_valid = 1
+        ''',
+        # add_place, get_places
+        '''
+        CREATE INDEX IF NOT EXISTS idx_places_user_name
+        ON places (user_id, name) WHERE is_valid = 1
+        ''',
+        # get_shifts, get_next_shift, add_shiftの重複確認
+        '''
+        CREATE INDEX IF NOT EXISTS idx_shifts_user_start
+        ON shifts (user_id, start_datetime) WHERE is_valid = 1
+        ''',
+        # get_amount
+        '''
+        CREATE INDEX IF NOT EXISTS idx_shifts_user_end
+        ON shifts (user_id, end_datetime, amount) WHERE is_valid = 1
+        ''',
+    )),
+    Migration(3, 'シフトの日時と休憩時間を整数秒で保存する', (
+        '''
+        CREATE TABLE shifts_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            place TEXT NOT NULL,
+            title TEXT NOT NULL,
+            start_datetime INTEGER NOT NULL,
+            end_datetime INTEGER NOT NULL,
+            break_time INTEGER NOT NULL,
+            hourly_wage INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            is_valid INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        ''',
+        # 旧形式のbreak_timeは'%M:%S'で保存されており時間の桁が失われているため、
+        # 時給が分かる場合は金額から休憩時間を逆算し、分単位に丸める
+        '''
+        INSERT INTO shifts_new (
+            id,
+            user_id,
+            place,
+            title,
+            start_datetime,
+            end_datetime,
+            break_time,
+            hourly_wage,
+            amount,
+            is_valid
+        )
+        SELECT
+            id,
+            user_id,
+            place,
+            title,
+            start_at,
+            end_at,
+            CASE
+                WHEN hourly_wage > 0 THEN
+                    MAX(0, CAST(ROUND((end_at - start_at - amount * 3600.0 / hourly_wage) / 60) AS INTEGER) * 60)
+                ELSE
+                    CAST(substr(break_time, 1, 2) AS INTEGER) * 60 + CAST(substr(break_time, 4, 2) AS INTEGER)
+            END,
+            hourly_wage,
+            amount,
+            is_valid
+        FROM (
+            SELECT
+                *,
+                CAST(strftime('%s', start_datetime) AS INTEGER) AS start_at,
+                CAST(strftime('%s', end_datetime) AS INTEGER) AS end_at
+            FROM shifts
+        )
+        ''',
+        'DROP TABLE shifts',
+        'ALTER TABLE shifts_new RENAME TO shifts',
+        '''
+        CREATE INDEX idx_shifts_user_start
+        ON shifts (user_id, start_datetime) WHERE is_valid = 1
+        ''',
+        '''
+        CREATE INDEX idx_shifts_user_end
+        ON shifts (user_id, end_datetime, amount) WHERE is_valid = 1
+        ''',
+    )),
+    Migration(4, 'シフト重複検出用R*Treeインデックスの追加', (
+        # 有効なシフトだけを(ユーザーID, 勤務時間)の2次元の矩形として保持する
+        # 座標は32bit浮動小数点で外側に丸められるため、検索結果はshiftsで厳密に再確認する
+        '''
+        CREATE VIRTUAL TABLE shift_intervals USING rtree(
+            id,
+            min_user_id, max_user_id,
+            start_at, end_at
+        )
+        ''',
+        '''
+        INSERT INTO shift_intervals (id, min_user_id, max_user_id, start_at, end_at)
+        SELECT id, user_id, user_id, start_datetime, end_datetime FROM shifts
+        WHERE is_valid = 1
+        ''',
+        '''
+        CREATE TRIGGER shift_intervals_insert AFTER INSERT ON shifts
+        WHEN NEW.is_valid = 1
+        BEGIN
+            INSERT INTO shift_intervals (id, min_user_id, max_user_id, start_at, end_at)
+            VALUES (NEW.id, NEW.user_id, NEW.user_id, NEW.start_datetime, NEW.end_datetime);
+        END
+        ''',
+        '''
+        CREATE TRIGGER shift_intervals_update
+        AFTER UPDATE OF user_id, start_datetime, end_datetime, is_valid ON shifts
+        BEGIN
+            DELETE FROM shift_intervals WHERE id = OLD.id;
+            INSERT INTO shift_intervals (id, min_user_id, max_user_id, start_at, end_at)
+            SELECT NEW.id, NEW.user_id, NEW.user_id, NEW.start_datetime, NEW.end_datetime
+            WHERE NEW.is_valid = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER shift_intervals_delete AFTER DELETE ON shifts
+        BEGIN
+            DELETE FROM shift_intervals WHERE id = OLD.id;
+        END
+        ''',
+    )),
+    Migration(5, '日別の給料集計テーブルの追加', (
+        # 有効なシフトの金額を、終了日時の日(1970-01-01からの日数)ごとに集計する
+        '''
+        CREATE TABLE daily_earnings (
+            user_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT INTO daily_earnings (user_id, day, amount)
+        SELECT user_id, end_datetime / 86400, SUM(amount) FROM shifts
+        WHERE is_valid = 1
+        GROUP BY user_id, end_datetime / 86400
+        ''',
+        '''
+        CREATE TRIGGER daily_earnings_insert AFTER INSERT ON shifts
+        WHEN NEW.is_valid = 1
+        BEGIN
+            INSERT INTO daily_earnings (user_id, day, amount)
+            VALUES (NEW.user_id, NEW.end_datetime / 86400, NEW.amount)
+            ON CONFLICT (user_id, day) DO UPDATE SET amount = amount + excluded.amount;
+        END
+        ''',
+        '''
+        CREATE TRIGGER daily_earnings_update
+        AFTER UPDATE OF user_id, end_datetime, amount, is_valid ON shifts
+        BEGIN
+            UPDATE daily_earnings
+            SET amount = amount - OLD.amount
+            WHERE OLD.is_valid = 1
+            AND user_id = OLD.user_id
+            AND day = OLD.end_datetime / 86400;
+
+            INSERT INTO daily_earnings (user_id, day, amount)
+            SELECT NEW.user_id, NEW.end_datetime / 86400, NEW.amount
+            WHERE NEW.is_valid = 1
+            ON CONFLICT (user_id, day) DO UPDATE SET amount = amount + excluded.amount;
+        END
+        ''',
+        '''
+        CREATE TRIGGER daily_earnings_delete AFTER DELETE ON shifts
+        WHEN OLD.is_valid = 1
+        BEGIN
+            UPDATE daily_earnings
+            SET amount = amount - OLD.amount
+            WHERE user_id = OLD.user_id
+            AND day = OLD.end_datetime / 86400;
+        END
+        ''',
+    )),
+    Migration(6, 'ユーザーごとのシフトのデータバージョンの追加', (
+        # シフトが変更されるたびに増やし、集計結果のキャッシュのキーに使う
+        '''
+        CREATE TABLE user_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TRIGGER user_versions_insert AFTER INSERT ON shifts
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER user_versions_update AFTER UPDATE ON shifts
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+
+            INSERT INTO user_versions (user_id, version)
+            SELECT OLD.user_id, 1
+            WHERE OLD.user_id IS NOT NEW.user_id
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER user_versions_delete AFTER DELETE ON shifts
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (OLD.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+    )),
+    Migration(7, '繰り返し規則テーブルの追加', (
+        # 最初の回の日時と規則を保存し、最終日付以降も続いた場合の見込みに使う
+        '''
+        CREATE TABLE recurrences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            place TEXT NOT NULL,
+            title TEXT NOT NULL,
+            start_datetime INTEGER NOT NULL,
+            end_datetime INTEGER NOT NULL,
+            break_time INTEGER NOT NULL,
+            hourly_wage INTEGER NOT NULL,
+            freq TEXT NOT NULL,
+            until_day INTEGER NOT NULL,
+            is_valid INTEGER NOT NULL DEFAULT 1,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE INDEX idx_recurrences_user_until ON recurrences (user_id, until_day)
+        WHERE is_valid = 1
+        ''',
+    )),
+    Migration(8, 'シフトの給料期間キーの追加', (
+        # 終了日時が属する給料期間(締め日のある月)を保存し、期間ごとの集計を1回のGROUP BYで行う
+        'ALTER TABLE shifts ADD COLUMN period_key INTEGER',
+        f'''
+        UPDATE shifts
+        SET period_key = {PERIOD_KEY_SQL.format(closing_day='(SELECT closing_day FROM users WHERE users.id = shifts.user_id)')}
+        ''',
+        # get_period_amounts
+        '''
+        CREATE INDEX idx_shifts_user_period ON shifts (user_id, period_key, amount)
+        WHERE is_valid = 1
+        ''',
+    )),
+    Migration(9, '勤務先ごとの割増賃金ルールテーブルの追加', (
+        # 割増率は百分率、超過時間は秒、休日の曜日は月曜日を1ビット目とするビットの組み合わせで保存する
+        '''
+        CREATE TABLE wage_rules (
+            user_id INTEGER NOT NULL,
+            place TEXT NOT NULL,
+            night_percent INTEGER NOT NULL,
+            overtime_percent INTEGER NOT NULL,
+            overtime_after INTEGER NOT NULL,
+            holiday_percent INTEGER NOT NULL,
+            holiday_weekdays INTEGER NOT NULL,
+            PRIMARY KEY (user_id, place),
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+        ''',
+    )),
+    Migration(10, '勤務先ごとの全ユーザーのシフト検索用インデックスの追加', (
+        # get_place_schedule, get_place_staffing
+        '''
+        CREATE INDEX idx_shifts_place_start
+        ON shifts (place, start_datetime, end_datetime, user_id, amount) WHERE is_valid = 1
+        ''',
+        # 勤務先ごとのシフトの最大の長さを保持し、開始日時の範囲だけで重なるシフトを検索できるようにする
+        # 長さは減らさないため、常に実際の最大以上の値になる
+        '''
+        CREATE TABLE place_spans (
+            place TEXT PRIMARY KEY,
+            max_span INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        INSERT INTO place_spans (place, max_span)
+        SELECT place, MAX(end_datetime - start_datetime) FROM shifts
+        GROUP BY place
+        ''',
+        '''
+        CREATE TRIGGER place_spans_insert AFTER INSERT ON shifts
+        BEGIN
+            INSERT INTO place_spans (place, max_span)
+            VALUES (NEW.place, NEW.end_datetime - NEW.start_datetime)
+            ON CONFLICT (place) DO UPDATE SET max_span = MAX(max_span, excluded.max_span);
+        END
+        ''',
+        '''
+        CREATE TRIGGER place_spans_update AFTER UPDATE OF place, start_datetime, end_datetime ON shifts
+        BEGIN
+            INSERT INTO place_spans (place, max_span)
+            VALUES (NEW.place, NEW.end_datetime - NEW.start_datetime)
+            ON CONFLICT (place) DO UPDATE SET max_span = MAX(max_span, excluded.max_span);
+        END
+        ''',
+    )),
+    Migration(11, '繰り返し規則と割増賃金ルールの変更時のデータバージョンの更新', (
+        # 見込みの計算に使う繰り返し規則と割増賃金ルールが変わった場合も、集計結果のキャッシュを無効にする
+        '''
+        CREATE TRIGGER recurrences_version_insert AFTER INSERT ON recurrences
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER recurrences_version_update AFTER UPDATE ON recurrences
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER recurrences_version_delete AFTER DELETE ON recurrences
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (OLD.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER wage_rules_version_insert AFTER INSERT ON wage_rules
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER wage_rules_version_update AFTER UPDATE ON wage_rules
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (NEW.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER wage_rules_version_delete AFTER DELETE ON wage_rules
+        BEGIN
+            INSERT INTO user_versions (user_id, version)
+            VALUES (OLD.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+    )),
+]
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """データベースに記録されているスキーマバージョンを取得します。"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, migrations: list[Migration] = MIGRATIONS) -> int:
+    """未適用のマイグレーションを順に適用し、適用後のスキーマバージョンを返します。"""
+    version = get_version(conn)
+    for migration in migrations:
+        if migration.version <= version:
+            continue
+
+        # 複数プロセスが同時に起動した場合に備え、書き込みロックを取得してから再確認する
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = get_version(conn)
+            if migration.version <= version:
+                conn.rollback()
+                continue
+            migration.apply(conn)
+            conn.execute(f'PRAGMA user_version = {migration.version}')
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        version = migration.version
+
+    return version
@@ -0,0 +1,46 @@
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+
+# 給料期間は締め日のある月で表し、period_key = 年 * 12 + (月 - 1) とする
+# 締め日が月の日数を超える場合は月末を締め日とする
+# シフトの給料期間のキーを終了日時(整数秒)から計算するSQL式(get_period_keyと同じ計算)
+PERIOD_KEY_SQL = '''(
+    CAST(strftime('%Y', end_datetime, 'unixepoch') AS INTEGER) * 12
+    + CAST(strftime('%m', end_datetime, 'unixepoch') AS INTEGER) - 1
+    + (CAST(strftime('%d', end_datetime, 'unixepoch') AS INTEGER) > {closing_day})
+)'''
+
+
+def get_period_key(value: date | datetime, closing_day: int) -> int:
+    """指定された日付が属する給料期間のキーを取得します。"""
+    # 日付は月の日数以下なので、締め日を月末に丸めなくても締め日より後かどうかは変わらない
+    return value.year * 12 + value.month - 1 + (value.day > closing_day)
+
+
+def get_period_month(period_key: int) -> tuple[int, int]:
+    """給料期間のキーから、締め日のある年と月を取得します。"""
+    year, month = divmod(period_key, 12)
+    return year, month + 1
+
+
+@lru_cache(maxsize=4096)
+def get_period_bounds(period_key: int, closing_day: int) -> tuple[date, date]:
+    """給料期間の開始日と終了日(締め日)を取得します。"""
+    return _get_closing_date(period_key - 1, closing_day) + timedelta(days=1), _get_closing_date(period_key, closing_day)
+
+
+@lru_cache(maxsize=256)
+def get_period_table(last_period_key: int, count: int, closing_day: int) -> tuple[tuple[int, date, date], ...]:
+    """指定された給料期間までの直近count期間の(キー, 開始日, 終了日)を古い順に取得します。"""
+    return tuple(
+        (period_key, *get_period_bounds(period_key, closing_day))
+        for period_key in range(last_period_key - count + 1, last_period_key + 1)
+    )
+
+
+def _get_closing_date(period_key: int, closing_day: int) -> date:
+    """給料期間の締め日を取得します。"""
+    year, month = get_period_month(period_key)
+    return date(year, month, min(closing_day, monthrange(year, month)[1]))
@@ -0,0 +1,84 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Iterator
+
+
+DAILY = 'daily'
+WEEKLY = 'weekly'
+BIWEEKLY = 'biweekly'
+MONTHLY_NTH_WEEKDAY = 'monthly_nth_weekday'  # 毎月第n週の同じ曜日
+
+FREQUENCIES = (DAILY, WEEKLY, BIWEEKLY, MONTHLY_NTH_WEEKDAY)
+
+_INTERVALS = {
+    DAILY: timedelta(days=1),
+    WEEKLY: timedelta(weeks=1),
+    BIWEEKLY: timedelta(weeks=2),
+}
+
+
+@dataclass(frozen=True)
+class Recurrence:
+    """シフトの繰り返し規則を表すクラス。開始日がuntil以前の回をすべて対象とします。"""
+    freq: str
+    until: date
+
+    def __post_init__(self):
+        if self.freq not in FREQUENCIES:
+            raise ValueError(f'未対応の繰り返し規則です: {self.freq}')
+
+    def occurrences(
+        self,
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> Iterator[tuple[datetime, datetime]]:
+        """最初の回の開始・終了日時から、各回の開始・終了日時を順に生成します。"""
+        duration = end_datetime - start_datetime
+
+        if self.freq == MONTHLY_NTH_WEEKDAY:
+            starts = _nth_weekday_starts(start_datetime)
+        else:
+            starts = _interval_starts(start_datetime, _INTERVALS[self.freq])
+
+        for start in starts:
+            if start.date() > self.until:
+                return
+            yield start, start + duration
+
+    def last_occurrence(
+        self,
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> tuple[datetime, datetime] | None:
+        """最後の回の開始・終了日時を取得します。1回もない場合はNoneを返します。"""
+        last = None
+        for last in self.occurrences(start_datetime, end_datetime):
+            pass
+        return last
+
+
+def _interval_starts(start_datetime: datetime, interval: timedelta) -> Iterator[datetime]:
+    """一定間隔の開始日時を生成します。"""
+    while True:
+        yield start_datetime
+        start_datetime += interval
+
+
+def _nth_weekday_starts(start_datetime: datetime) -> Iterator[datetime]:
+    """開始日と同じ「第n週のX曜日」の開始日時を毎月生成します。該当日がない月は飛ばします。"""
+    nth = (start_datetime.day - 1) // 7
+    weekday = start_datetime.weekday()
+    year, month = start_datetime.year, start_datetime.month
+
+    while True:
+        first = date(year, month, 1)
+        day = 1 + (weekday - first.weekday()) % 7 + nth * 7
+        try:
+            start = start_datetime.replace(year=year, month=month, day=day)
+        except ValueError:
+            start = None
+
+        if start is not None:
+            yield start
+
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
@@ -0,0 +1,567 @@
+import argparse
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+import os
+import sqlite3
+import threading
+from typing import Iterator
+
+from .cache import CachedDBController
+from .db_controller import BulkShiftResult, DBController, DEFAULT_DATABASE, ShiftRecord, StaffingSlot, WAGE_RULE_COLUMNS, _hide_other_users
+from .recurrence import Recurrence
+from .shift import Shift
+from .wage import WageRule
+
+
+DEFAULT_SHARD_COUNT = 4  # シャードの数
+
+SHARD_ID_BITS = 40  # シャードごとに割り当てるシフトIDの幅(ビット)
+
+USER_COLUMNS = ('id', 'username', 'password', 'closing_day', 'goal_amount', 'is_valid')
+RECURRENCE_COLUMNS = (
+    'user_id', 'place', 'title', 'start_datetime', 'end_datetime', 'break_time', 'hourly_wage', 'freq', 'until_day', 'is_valid',
+)
+
+
+def get_shard_paths(database: str = DEFAULT_DATABASE, count: int = DEFAULT_SHARD_COUNT) -> list[str]:
+    """ディレクトリのデータベースファイルに対応するシャードファイルのパスを取得します。"""
+    root, ext = os.path.splitext(database)
+    return [f'{root}_shard{index}{ext or ".db"}' for index in range(count)]
+
+
+def get_shard_index(user_id: int, count: int) -> int:
+    """ユーザーを割り当てるシャードの番号を取得します。"""
+    return user_id % count
+
+
+class ShardedDBController:
+    """ユーザーごとにシフトと勤務先を複数のデータベースファイルへ振り分けるデータベースコントローラクラス
+
+    ユーザー情報とシャードの割り当てはディレクトリのデータベースに、勤務先とシフトは割り当てられたシャードに保存します。
+    シャードへ移していない既存のユーザーはディレクトリのデータベースをそのまま使います。
+    """
+    def __init__(
+        self,
+        directory: str = DEFAULT_DATABASE,
+        shards: list[str] | None = None,
+        *,
+        cached: bool = True,
+        connection_factory: type[sqlite3.Connection] = sqlite3.Connection,
+        write_queue: bool = False,
+    ):
+        """ディレクトリと各シャードのDBControllerを作成し、シャードの割り当てを読み込みます。"""
+        if shards is None:
+            shards = get_shard_paths(directory)
+        if not shards:
+            raise ValueError('シャードを1つ以上指定してください')
+
+        controller_class = CachedDBController if cached else DBController
+        self.directory = controller_class(directory, connection_factory=connection_factory, write_queue=write_queue)
+        self.shards = [
+            controller_class(path, connection_factory=connection_factory, write_queue=write_queue)
+            for path in shards
+        ]
+
+        _setup_directory(self.directory.conn)
+        for index, shard in enumerate(self.shards):
+            _reserve_shift_ids(shard.conn, index)
+
+        self._assignments = dict(self.directory.conn.execute('SELECT user_id, shard FROM user_shards').fetchall())
+        self._lock = threading.Lock()
+
+    def login(self, username: str, password: str) -> int | None:
+        """ユーザーのログインを行います。"""
+        return self.directory.login(username, password)
+
+    def get_user(self, user_id: int) -> list[str]:
+        """指定されたユーザーの情報を取得します。"""
+        return self.directory.get_user(user_id)
+
+    def add_user(
+        self,
+        username: str,
+        password: str,
+        closing_day: int,
+        goal_amount: int
+    ) -> bool:
+        """新しいユーザーを追加し、シャードへ割り当てます。"""
+        if not self.directory.add_user(username, password, closing_day, goal_amount):
+            return False
+
+        user = self.directory.conn.execute('''
+            SELECT id, username, password, closing_day, goal_amount, is_valid FROM users
+            WHERE username = :username
+            AND is_valid = 1
+            LIMIT 1
+        ''',
+        {'username': username}).fetchone()
+
+        index = get_shard_index(user['id'], len(self.shards))
+        shard = self.shards[index]
+        # シフトの外部キーを満たすため、シャードにもユーザーを複製する
+        shard._write(_copy_user, shard, tuple(user))
+        self.directory._write(_assign_shard, self.directory, user['id'], index)
+        with self._lock:
+            self._assignments[user['id']] = index
+
+        return True
+
+    def update_user(
+        self,
+        user_id: int,
+        username: str,
+        password: str,
+        closing_day: int,
+        goal_amount: int
+    ) -> bool:
+        """ユーザー情報を更新し、シャードの複製にも反映します。"""
+        if not self.directory.update_user(user_id, username, password, closing_day, goal_amount):
+            return False
+
+        shard = self._get_shard(user_id)
+        if shard is not self.directory:
+            user = self.directory.conn.execute('''
+                SELECT id, username, password, closing_day, goal_amount, is_valid FROM users
+                WHERE id = :user_id
+            ''',
+            {'user_id': user_id}).fetchone()
+            shard._write(_copy_user_settings, shard, tuple(user))
+            if isinstance(shard, CachedDBController):
+                shard.cache.invalidate_user(user_id)
+
+        return True
+
+    def is_exist_user(self, username: str, exclude_user_id: int | None = None) -> bool:
+        """ユーザー名の重複を確認します。"""
+        return self.directory.is_exist_user(username, exclude_user_id)
+
+    def add_place(self, user_id: int, name: str) -> bool:
+        """新しい勤務先を追加します。"""
+        return self._get_shard(user_id).add_place(user_id, name)
+
+    def get_places(self, user_id: int) -> list[str]:
+        """指定されたユーザーに登録されている勤務先のリストを取得します。"""
+        return self._get_shard(user_id).get_places(user_id)
+
+    def add_shift(
+        self,
+        user_id: int,
+        place: str,
+        title: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        break_time: time,
+        hourly_wage: int,
+        *,
+        is_upadate: bool = False,
+    ) -> bool:
+        """新しいシフトを追加します。"""
+        return self._get_shard(user_id).add_shift(
+            user_id, place, title, start_datetime, end_datetime, break_time, hourly_wage, is_upadate=is_upadate,
+        )
+
+    def add_shifts_bulk(
+        self,
+        user_id: int,
+        place: str,
+        title: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        break_time: time,
+        hourly_wage: int,
+        recurrence: Recurrence,
+        *,
+        is_upadate: bool = True,
+    ) -> list[BulkShiftResult]:
+        """繰り返し規則に従ってシフトを一括登録します。"""
+        return self._get_shard(user_id).add_shifts_bulk(
+            user_id, place, title, start_datetime, end_datetime, break_time, hourly_wage, recurrence,
+            is_upadate=is_upadate,
+        )
+
+    def add_shifts(
+        self,
+        user_id: int,
+        shifts: list[ShiftRecord],
+        *,
+        is_upadate: bool = False,
+    ) -> list[BulkShiftResult]:
+        """複数のシフトを1つのトランザクションで登録します。"""
+        return self._get_shard(user_id).add_shifts(user_id, shifts, is_upadate=is_upadate)
+
+    def get_wage_rules(self, user_id: int) -> dict[str, WageRule]:
+        """指定されたユーザーの勤務先ごとの割増賃金ルールを取得します。"""
+        return self._get_shard(user_id).get_wage_rules(user_id)
+
+    def set_wage_rule(self, user_id: int, rule: WageRule) -> int:
+        """勤務先の割増賃金ルールを保存し、その勤務先のシフトの金額を計算し直します。"""
+        return self._get_shard(user_id).set_wage_rule(user_id, rule)
+
+    def recompute_amounts(
+        self,
+        user_id: int,
+        place: str | None = None,
+        start_datetime: datetime | None = None,
+        *,
+        hourly_wage: int | None = None,
+    ) -> int:
+        """指定されたユーザーの有効なシフトの金額をまとめて計算し直します。"""
+        return self._get_shard(user_id).recompute_amounts(user_id, place, start_datetime, hourly_wage=hourly_wage)
+
+    def find_conflicts(
+        self,
+        user_id: int,
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> list[Shift]:
+        """指定されたユーザーの、指定期間と重なる有効なシフトのリストを開始日時順に取得します。"""
+        return self._get_shard(user_id).find_conflicts(user_id, start_datetime, end_datetime)
+
+    def delete_shift(
+        self,
+        id: int,
+    ) -> None:
+        """シフトを削除します。シフトIDの範囲から保存先のシャードを判定します。"""
+        index = (id >> SHARD_ID_BITS) - 1
+        shard = self.shards[index] if 0 <= index < len(self.shards) else self.directory
+        shard.delete_shift(id)
+
+    def get_shifts(
+        self,
+        user_id: int,
+        start_datetime: datetime | None = None,
+        end_datetime: datetime | None = None,
+    ) -> list[Shift]:
+        """指定されたユーザーに登録されているシフトのリストを取得します。"""
+        return self._get_shard(user_id).get_shifts(user_id, start_datetime, end_datetime)
+
+    def iter_shifts(
+        self,
+        user_id: int,
+        *,
+        batch_size: int = 1000,
+    ) -> Iterator[Shift]:
+        """指定されたユーザーのシフトを開始日時順に少しずつ取得します。"""
+        return self._get_shard(user_id).iter_shifts(user_id, batch_size=batch_size)
+
+    def get_amount(
+        self,
+        user_id: int,
+        start_datetime: datetime,
+        end_datetime: datetime,
+    ) -> int:
+        """指定されたユーザーの指定期間内の合計金額を取得します。"""
+        return self._get_shard(user_id).get_amount(user_id, start_datetime, end_datetime)
+
+    def get_next_shift(
+        self,
+        user_id: int,
+        start_datetime: datetime,
+    ) -> datetime | None:
+        """指定されたユーザーの次のシフトを取得します。"""
+        return self._get_shard(user_id).get_next_shift(user_id, start_datetime)
+
+    def get_shift_columns(self, user_id: int) -> dict[str, tuple]:
+        """指定されたユーザーの有効なシフトを、列名ごとの値のタプルとして取得します。"""
+        return self._get_shard(user_id).get_shift_columns(user_id)
+
+    def get_daily_amounts(
+        self,
+        user_id: int,
+        start_date: date,
+        end_date: date,
+    ) -> list[tuple[date, int]]:
+        """指定されたユーザーの、開始日から終了日の前日までの日ごとの合計金額を取得します。"""
+        return self._get_shard(user_id).get_daily_amounts(user_id, start_date, end_date)
+
+    def get_period_amounts(
+        self,
+        user_id: int,
+        today: date,
+        count: int,
+    ) -> list[tuple[date, date, int]]:
+        """指定されたユーザーの直近count期間の給料期間ごとの合計金額を取得します。"""
+        return self._get_shard(user_id).get_period_amounts(user_id, today, count)
+
+    def get_recurrences(self, user_id: int, active_on: date) -> list[dict]:
+        """指定されたユーザーの、最終日付が指定日以降の繰り返し規則のリストを取得します。"""
+        return self._get_shard(user_id).get_recurrences(user_id, active_on)
+
+    def get_data_version(self, user_id: int) -> int:
+        """指定されたユーザーのシフトのデータバージョンを取得します。"""
+        return self._get_shard(user_id).get_data_version(user_id)
+
+    def get_place_schedule(
+        self,
+        user_id: int,
+        place: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        *,
+        include_details: bool = False,
+    ) -> list[dict]:
+        """指定されたユーザーが登録している勤務先の、指定期間と重なる全ユーザーのシフトのリストを全シャードから取得します。"""
+        if place not in self.get_places(user_id):
+            return []
+        schedule = [shift for db in self._get_all() for shift in db._get_place_schedule(place, start_datetime, end_datetime)]
+        schedule.sort(key=lambda shift: (shift['start_datetime'], shift['id']))
+        return _hide_other_users(schedule, user_id, include_details)
+
+    def get_place_staffing(
+        self,
+        user_id: int,
+        place: str,
+        start_datetime: datetime,
+        end_datetime: datetime,
+        slot: timedelta,
+    ) -> list[StaffingSlot]:
+        """指定されたユーザーが登録している勤務先の時間帯ごとの勤務人数と人件費を、シャードごとに集計して合算します。"""
+        if place not in self.get_places(user_id):
+            return []
+
+        # ユーザーは1つのシャードにだけ保存されるため、シャードごとの人数をそのまま足せる
+        staffing = None
+        for db in self._get_all():
+            slots = db._get_place_staffing(place, start_datetime, end_datetime, slot)
+            if staffing is None:
+                staffing = slots
+                continue
+            for total, shard_slot in zip(staffing, slots):
+                total.staff_count += shard_slot.staff_count
+                total.labor_cost += shard_slot.labor_cost
+        return staffing
+
+    def _get_all(self) -> list[DBController]:
+        """ディレクトリと全シャードのコントローラのリストを取得します。"""
+        return [self.directory, *self.shards]
+
+    def _get_shard(self, user_id: int) -> DBController:
+        """ユーザーが割り当てられたシャードを取得します。割り当てがない場合はディレクトリを返します。"""
+        index = self._assignments.get(user_id)
+        if index is None:
+            # ほかのプロセスで追加・再配置されたユーザーは、ディレクトリの割り当てを読んで覚えておく
+            row = self.directory.conn.execute('''
+                SELECT shard FROM user_shards
+                WHERE user_id = :user_id
+            ''',
+            {'user_id': user_id}).fetchone()
+            if row is None:
+                return self.directory
+            index = row[0]
+            with self._lock:
+                self._assignments[user_id] = index
+        return self.shards[index]
+
+
+@dataclass
+class RebalanceReport:
+    """シャードの再配置の結果を表すクラス"""
+    moved_users: int = 0
+    moved_places: int = 0
+    moved_shifts: int = 0
+
+    def __str__(self) -> str:
+        return '\n'.join([
+            f'移動したユーザー: {self.moved_users:,}人',
+            f'移動した勤務先: {self.moved_places:,}件',
+            f'移動したシフト: {self.moved_shifts:,}件',
+        ])
+
+
+def rebalance(directory: str = DEFAULT_DATABASE, shards: list[str] | None = None) -> RebalanceReport:
+    """すべてのユーザーの勤務先とシフトを、割り当てるべきシャードへ移動します。
+
+    シャードを使う前のデータベースをディレクトリとして指定すると、既存のデータをシャードへ分割できます。
+    移動したシフトには移動先のシャードで新しいIDが振られます。シャードの数を変えた場合はアプリを停止した状態で実行してください。
+    """
+    db = ShardedDBController(directory, shards, cached=False)
+    report = RebalanceReport()
+
+    # シャードを減らした場合、なくなるシャードは既定のファイル名から開く
+    removed_shards = {}
+    for index in sorted(set(db._assignments.values())):
+        if index >= len(db.shards):
+            removed_shards[index] = DBController(get_shard_paths(directory, index + 1)[index])
+
+    user_ids = [row[0] for row in db.directory.conn.execute('SELECT id FROM users ORDER BY id')]
+    for user_id in user_ids:
+        index = get_shard_index(user_id, len(db.shards))
+        current = db._assignments.get(user_id)
+        if current is None:
+            source = db.directory
+        else:
+            source = removed_shards[current] if current in removed_shards else db.shards[current]
+        target = db.shards[index]
+        if source is target:
+            continue
+
+        places, shifts = _move_user(db.directory, source, target, user_id)
+        db.directory._write(_assign_shard, db.directory, user_id, index)
+        db._assignments[user_id] = index
+        # 割り当てを切り替えてから移動元のデータを削除する
+        source._write(_delete_user_data, source, user_id, source is not db.directory)
+
+        report.moved_users += 1
+        report.moved_places += places
+        report.moved_shifts += shifts
+
+    return report
+
+
+def _setup_directory(conn: sqlite3.Connection) -> None:
+    """ユーザーとシャードの対応を保存するテーブルを作成します。"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def _reserve_shift_ids(conn: sqlite3.Connection, index: int) -> None:
+    """シフトIDからシャードを判定できるよう、シャードごとに異なる範囲からIDを振らせます。"""
+    base = (index + 1) << SHARD_ID_BITS
+    conn.execute('''
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'shifts', :base
+        WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'shifts')
+    ''',
+    {'base': base})
+    conn.execute('''
+        UPDATE sqlite_sequence
+        SET seq = :base
+        WHERE name = 'shifts'
+        AND seq < :base
+    ''',
+    {'base': base})
+    conn.commit()
+
+
+def _copy_user(db: DBController, user: tuple) -> None:
+    """ユーザーをシャードへ複製します。"""
+    db.cur.execute(f'''
+        INSERT INTO users ({', '.join(USER_COLUMNS)})
+        VALUES ({', '.join('?' * len(USER_COLUMNS))})
+        ON CONFLICT (id) DO UPDATE SET
+            username = excluded.username,
+            password = excluded.password,
+            closing_day = excluded.closing_day,
+            goal_amount = excluded.goal_amount,
+            is_valid = excluded.is_valid
+    ''',
+    user)
+
+
+def _copy_user_settings(db: DBController, user: tuple) -> None:
+    """ユーザー情報の変更をシャードの複製に反映し、締め日が変わった場合はシフトの給料期間キーを計算し直します。"""
+    user_id = user[USER_COLUMNS.index('id')]
+    old_closing_day = db._get_closing_day(user_id)
+    _copy_user(db, user)
+    if old_closing_day != user[USER_COLUMNS.index('closing_day')]:
+        db._update_period_keys(user_id)
+
+
+def _assign_shard(db: DBController, user_id: int, index: int) -> None:
+    """ユーザーをシャードへ割り当てます。"""
+    db.cur.execute('''
+        INSERT INTO user_shards (user_id, shard)
+        VALUES (:user_id, :shard)
+        ON CONFLICT (user_id) DO UPDATE SET shard = excluded.shard
+    ''',
+    {'user_id': user_id, 'shard': index})
+
+
+def _delete_user_data(db: DBController, user_id: int, delete_user: bool) -> None:
+    """ユーザーの勤務先・シフト・繰り返し規則・割増賃金ルールを削除します。delete_userがTrueの場合はユーザーの複製も削除します。"""
+    db.cur.execute('DELETE FROM shifts WHERE user_id = :user_id', {'user_id': user_id})
+    db.cur.execute('DELETE FROM recurrences WHERE user_id = :user_id', {'user_id': user_id})
+    db.cur.execute('DELETE FROM wage_rules WHERE user_id = :user_id', {'user_id': user_id})
+    db.cur.execute('DELETE FROM places WHERE user_id = :user_id', {'user_id': user_id})
+    if delete_user:
+        db.cur.execute('DELETE FROM users WHERE id = :user_id', {'user_id': user_id})
+
+
+def _move_user(directory: DBController, source: DBController, target: DBController, user_id: int) -> tuple[int, int]:
+    """ユーザーの勤務先とシフトを移動先のシャードへ複製し、複製した勤務先とシフトの件数を返します。"""
+    user = directory.conn.execute(f'''
+        SELECT {', '.join(USER_COLUMNS)} FROM users
+        WHERE id = :user_id
+    ''',
+    {'user_id': user_id}).fetchone()
+    places = source.conn.execute('''
+        SELECT user_id, name, is_valid FROM places
+        WHERE user_id = :user_id
+        ORDER BY id
+    ''',
+    {'user_id': user_id}).fetchall()
+    shifts = source.conn.execute('''
+        SELECT user_id, place, title, start_datetime, end_datetime, break_time, hourly_wage, amount, period_key, is_valid FROM shifts
+        WHERE user_id = :user_id
+        ORDER BY id
+    ''',
+    {'user_id': user_id}).fetchall()
+    recurrences = source.conn.execute(f'''
+        SELECT {', '.join(RECURRENCE_COLUMNS)} FROM recurrences
+        WHERE user_id = :user_id
+        ORDER BY id
+    ''',
+    {'user_id': user_id}).fetchall()
+    wage_rules = source.conn.execute(f'''
+        SELECT user_id, {', '.join(WAGE_RULE_COLUMNS)} FROM wage_rules
+        WHERE user_id = :user_id
+    ''',
+    {'user_id': user_id}).fetchall()
+
+    def copy(db: DBController) -> None:
+        # 途中で中断した移動の残りがあれば消してから複製する
+        _delete_user_data(db, user_id, False)
+        _copy_user(db, tuple(user))
+        db.cur.executemany('''
+            INSERT INTO places (user_id, name, is_valid)
+            VALUES (?, ?, ?)
+        ''',
+        [tuple(row) for row in places])
+        db.cur.executemany('''
+            INSERT INTO shifts (
+                user_id,
+                place,
+                title,
+                start_datetime,
+                end_datetime,
+                break_time,
+                hourly_wage,
+                amount,
+                period_key,
+                is_valid
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        [tuple(row) for row in shifts])
+        db.cur.executemany(f'''
+            INSERT INTO recurrences ({', '.join(RECURRENCE_COLUMNS)})
+            VALUES ({', '.join('?' * len(RECURRENCE_COLUMNS))})
+        ''',
+        [tuple(row) for row in recurrences])
+        db.cur.executemany(f'''
+            INSERT INTO wage_rules (user_id, {', '.join(WAGE_RULE_COLUMNS)})
+            VALUES ({', '.join('?' * (len(WAGE_RULE_COLUMNS) + 1))})
+        ''',
+        [tuple(row) for row in wage_rules])
+
+    target._write(copy, target)
+    return len(places), len(shifts)
+
+
+def main() -> None:
+    """コマンドラインからrebalanceを実行します。"""
+    parser = argparse.ArgumentParser(description='ユーザーの勤務先とシフトを割り当てるべきシャードへ移動します。アプリを停止してから実行してください。')
+    parser.add_argument('--directory', default=DEFAULT_DATABASE, help='ユーザー情報を保存するデータベースファイルのパス')
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARD_COUNT, help='シャードの数')
+    args = parser.parse_args()
+
+    print(rebalance(args.directory, get_shard_paths(args.directory, args.shards)))
+
+
+if __name__ == '__main__':
+    main()
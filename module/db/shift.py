@@ -0,0 +1,38 @@
+from dataclasses import dataclass
+from datetime import datetime, time
+import sys
+
+from .epoch import from_epoch, seconds_to_time
+
+
+@dataclass(frozen=True, slots=True)
+class Shift:
+    """登録されているシフト1件を表すクラス。日時と休憩時間は整数秒で保持し、参照したときに変換します。"""
+    id: int
+    place: str
+    title: str
+    start_at: int  # 開始日時(整数秒)
+    end_at: int  # 終了日時(整数秒)
+    break_seconds: int  # 休憩時間(秒)
+    hourly_wage: int
+
+    @classmethod
+    def from_row(cls, row: tuple[int, str, str, int, int, int, int]) -> 'Shift':
+        """(ID, 勤務先, タイトル, 開始, 終了, 休憩, 時給)の行からシフトを作成します。"""
+        # 勤務先は同じ文字列が繰り返し現れるため、セッション間で共有する
+        return cls(row[0], sys.intern(row[1]), *row[2:])
+
+    @property
+    def start_datetime(self) -> datetime:
+        """開始日時を取得します。"""
+        return from_epoch(self.start_at)
+
+    @property
+    def end_datetime(self) -> datetime:
+        """終了日時を取得します。"""
+        return from_epoch(self.end_at)
+
+    @property
+    def break_time(self) -> time:
+        """休憩時間を取得します。"""
+        return seconds_to_time(self.break_seconds)
@@ -0,0 +1,114 @@
+from dataclasses import dataclass
+
+
+DAY_SECONDS = 86400  # 1日の秒数
+HOUR_SECONDS = 3600  # 1時間の秒数
+
+NIGHT_START = 22 * HOUR_SECONDS  # 深夜の開始時刻(22:00)
+NIGHT_END = 5 * HOUR_SECONDS  # 深夜の終了時刻(翌5:00)
+NIGHT_SECONDS_PER_DAY = DAY_SECONDS - NIGHT_START + NIGHT_END  # 1日あたりの深夜の秒数
+
+EPOCH_WEEKDAY = 3  # 1970-01-01の曜日(月曜日が0)
+
+WEEKDAY_LABELS = ('月', '火', '水', '木', '金', '土', '日')
+
+
+@dataclass(frozen=True)
+class WageRule:
+    """勤務先ごとの割増賃金のルールを表すクラス。割増率は時給に対する百分率です。"""
+    place: str
+    night_percent: int = 0  # 深夜(22:00〜5:00)の割増率
+    overtime_percent: int = 0  # 1回の勤務で超過時間を超えた分の割増率
+    overtime_after: int = 8 * HOUR_SECONDS  # 超過時間(秒)
+    holiday_percent: int = 0  # 休日の曜日に始まる勤務の割増率(超過分の割増とは重ねない)
+    holiday_weekdays: int = 0  # 休日の曜日(月曜日を1ビット目とするビットの組み合わせ)
+
+    def is_holiday(self, weekday: int) -> bool:
+        """指定された曜日(月曜日が0)が休日かどうかを判定します。"""
+        return bool(self.holiday_weekdays >> weekday & 1)
+
+
+def calc_rule_amount(
+    rule: WageRule | None,
+    start_at: int,
+    end_at: int,
+    break_seconds: int,
+    hourly_wage: int,
+) -> int:
+    """ルールに従って1回分のシフトの金額を計算します。ルールがない場合は時給×勤務時間です。"""
+    paid_seconds = end_at - start_at - break_seconds
+    if rule is None:
+        return round(paid_seconds / HOUR_SECONDS * hourly_wage)
+
+    # 休憩は深夜以外の時間に取ったものとみなす
+    night_seconds = max(min(_night_seconds_before(end_at) - _night_seconds_before(start_at), paid_seconds), 0)
+    if rule.is_holiday((start_at // DAY_SECONDS + EPOCH_WEEKDAY) % 7):
+        extra = paid_seconds * rule.holiday_percent
+    else:
+        extra = max(paid_seconds - rule.overtime_after, 0) * rule.overtime_percent
+    return round((paid_seconds * 100 + night_seconds * rule.night_percent + extra) / (HOUR_SECONDS * 100) * hourly_wage)
+
+
+def calc_rule_amounts(
+    rule: WageRule | None,
+    start_at,
+    end_at,
+    break_seconds,
+    hourly_wage,
+):
+    """ルールに従って複数のシフトの金額を配列でまとめて計算します。calc_rule_amountと同じ結果を返します。"""
+    import numpy as np
+
+    paid_seconds = end_at - start_at - break_seconds
+    if rule is None:
+        return np.rint(paid_seconds / HOUR_SECONDS * hourly_wage).astype(np.int64)
+
+    night_seconds = np.maximum(np.minimum(_night_seconds_before(end_at) - _night_seconds_before(start_at), paid_seconds), 0)
+    is_holiday = (rule.holiday_weekdays >> ((start_at // DAY_SECONDS + EPOCH_WEEKDAY) % 7)) & 1 == 1
+    extra = np.where(
+        is_holiday,
+        paid_seconds * rule.holiday_percent,
+        np.maximum(paid_seconds - rule.overtime_after, 0) * rule.overtime_percent,
+    )
+    return np.rint((paid_seconds * 100 + night_seconds * rule.night_percent + extra) / (HOUR_SECONDS * 100) * hourly_wage).astype(np.int64)
+
+
+def _night_seconds_before(at):
+    """1970-01-01 00:00:00から指定日時(整数秒または配列)までに含まれる深夜の秒数を取得します。"""
+    days, seconds = divmod(at, DAY_SECONDS)
+    # 当日の0:00〜5:00と22:00〜24:00のうち、指定時刻までの部分を足す
+    if isinstance(seconds, int):
+        return days * NIGHT_SECONDS_PER_DAY + min(seconds, NIGHT_END) + max(seconds - NIGHT_START, 0)
+    return days * NIGHT_SECONDS_PER_DAY + seconds.clip(max=NIGHT_END) + (seconds - NIGHT_START).clip(min=0)
+
+
+def calc_amount_changes(
+    rules: dict[str, WageRule],
+    rows: list[tuple[int, str, int, int, int, int, int]],
+    hourly_wage: int | None = None,
+) -> list[tuple[int, int, int]]:
+    """シフトの金額を勤務先ごとのルールでまとめて計算し直し、変わったシフトの(ID, 時給, 金額)を取得します。
+
+    rowsは(ID, 勤務先, 開始(整数秒), 終了(整数秒), 休憩(秒), 時給, 金額)のリストです。hourly_wageを指定した場合はその時給で計算します。
+    """
+    import numpy as np
+
+    if not rows:
+        return []
+
+    columns = list(zip(*rows))
+    places = np.array(columns[1], dtype=object)
+    ids, start_at, end_at, break_seconds, old_wages, old_amounts = (
+        np.fromiter(column, dtype=np.int64, count=len(rows)) for column in columns[:1] + columns[2:]
+    )
+    wages = np.full_like(old_wages, hourly_wage) if hourly_wage is not None else old_wages
+
+    # 勤務先ごとに1回ずつ配列で計算する
+    amounts = np.empty_like(old_amounts)
+    unique_places, inverse = np.unique(places, return_inverse=True)
+    for index, place in enumerate(unique_places):
+        mask = inverse == index
+        amounts[mask] = calc_rule_amounts(rules.get(place), start_at[mask], end_at[mask], break_seconds[mask], wages[mask])
+
+    changed = (amounts != old_amounts) | (wages != old_wages)
+    return list(zip(ids[changed].tolist(), wages[changed].tolist(), amounts[changed].tolist()))
@@ -0,0 +1,111 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from typing import Callable
+
+from .connection import ConnectionPool
+
+
+class WriteQueue:
+    """書き込み処理を1つの専用スレッドで順に実行し、まとめてコミットするクラス"""
+    def __init__(self, pool: ConnectionPool, *, max_batch: int = 64, max_delay: float = 0.002):
+        """書き込みスレッドを開始します。max_delayは後続の書き込みを待つ最大秒数です。"""
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.operations = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._closed = False
+        self.thread = threading.Thread(target=self._run, name='shift-db-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, operation: Callable, *args, **kwargs) -> Future:
+        """書き込み処理をキューに追加し、結果を受け取るFutureを返します。"""
+        if self._closed:
+            raise RuntimeError('書き込みキューは既に停止しています')
+        future = Future()
+        self._queue.put((future, operation, args, kwargs))
+        return future
+
+    def is_writer_thread(self) -> bool:
+        """現在のスレッドが書き込みスレッドかどうかを判定します。"""
+        return threading.current_thread() is self.thread
+
+    def close(self) -> None:
+        """キューに残っている書き込みを実行してから書き込みスレッドを停止します。"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self.thread.join()
+
+    def _run(self) -> None:
+        """キューから書き込み処理を取り出し、まとめて実行します。"""
+        conn = self.pool.connection()
+        # トランザクションをこのクラスで明示的に制御する
+        conn.isolation_level = None
+
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+
+                batch = [item]
+                stop = False
+                deadline = time.monotonic() + self.max_delay
+                while len(batch) < self.max_batch:
+                    timeout = deadline - time.monotonic()
+                    try:
+                        item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+
+                self._commit_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.isolation_level = ''
+
+    def _commit_batch(self, conn, batch: list[tuple]) -> None:
+        """書き込み処理を1つのトランザクションで実行します。失敗した処理のみセーブポイントまで戻します。"""
+        outcomes = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for future, operation, args, kwargs in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute('SAVEPOINT write_operation')
+                try:
+                    result = operation(*args, **kwargs)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_operation')
+                    conn.execute('RELEASE write_operation')
+                    outcomes.append((future, e, False))
+                else:
+                    conn.execute('RELEASE write_operation')
+                    outcomes.append((future, result, True))
+            conn.execute('COMMIT')
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            for future, *_ in batch:
+                if future.done():
+                    continue
+                if future.running() or future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.operations += len(outcomes)
+        for future, value, succeeded in outcomes:
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
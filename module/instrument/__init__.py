@@ -0,0 +1,2 @@
+from .metrics import get_instrumentation, span, Histogram, Instrumentation
+from .sql import instrument_controller, InstrumentedConnection, InstrumentedCursor
@@ -0,0 +1,147 @@
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Iterator
+
+
+logger = logging.getLogger(__name__)
+
+BUCKET_BOUNDS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf,
+)  # ヒストグラムの各区間の上限(ミリ秒)
+
+SLOW_QUERY_LOG_SIZE = 100  # 保持する低速クエリの件数
+
+
+class Histogram:
+    """実行時間(ミリ秒)の分布を固定区間で集計するクラス"""
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = math.inf
+        self.max_ms = 0.0
+        self.buckets = [0] * len(BUCKET_BOUNDS_MS)
+
+    def record(self, ms: float) -> None:
+        """実行時間を1件記録します。"""
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+        self.buckets[bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+
+    def percentile(self, q: float) -> float:
+        """q(0〜1)分位点の近似値を、該当する区間の上限として取得します。"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self) -> dict:
+        """集計結果を辞書として取得します。"""
+        return {
+            'count': self.count,
+            'total_ms': self.total_ms,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'min_ms': self.min_ms if self.count else 0.0,
+            'max_ms': self.max_ms,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': {
+                ('inf' if math.isinf(bound) else str(bound)): count
+                for bound, count in zip(BUCKET_BOUNDS_MS, self.buckets)
+                if count
+            },
+        }
+
+
+class Instrumentation:
+    """メソッド・SQL・ページ描画の実行時間と低速クエリを記録するクラス"""
+    def __init__(self, *, enabled: bool = False, slow_query_ms: float = 100.0):
+        """記録先を初期化します。enabledがFalseの場合は何も記録しません。"""
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self._histograms: dict[str, Histogram] = {}
+        self._slow_queries: deque[dict] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, ms: float) -> None:
+        """名前ごとのヒストグラムに実行時間を記録します。"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.record(ms)
+
+    def record_slow_query(self, sql: str, ms: float, plan: list[str]) -> None:
+        """しきい値を超えたSQLを実行計画とともに記録します。"""
+        entry = {
+            'sql': sql,
+            'ms': ms,
+            'plan': plan,
+            'at': time.time(),
+        }
+        with self._lock:
+            self._slow_queries.append(entry)
+        logger.warning('低速クエリ (%.1f ms): %s\n%s', ms, sql, '\n'.join(plan))
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        """withブロックの実行時間を記録します。"""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def snapshot(self) -> dict:
+        """記録内容を辞書として取得します。"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'slow_query_ms': self.slow_query_ms,
+                'histograms': {name: histogram.to_dict() for name, histogram in sorted(self._histograms.items())},
+                'slow_queries': list(self._slow_queries),
+            }
+
+    def dump_json(self) -> str:
+        """記録内容をJSON文字列として取得します。"""
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def reset(self) -> None:
+        """記録内容を消去します。"""
+        with self._lock:
+            self._histograms.clear()
+            self._slow_queries.clear()
+
+
+_instrumentation = Instrumentation(
+    enabled=os.environ.get('SHIFT_INSTRUMENT') == '1',
+    slow_query_ms=float(os.environ.get('SHIFT_SLOW_QUERY_MS', '100')),
+)
+
+
+def get_instrumentation() -> Instrumentation:
+    """プロセス全体で共有する計測器を取得します。環境変数SHIFT_INSTRUMENT=1で有効になります。"""
+    return _instrumentation
+
+
+def span(name: str):
+    """共有の計測器でwithブロックの実行時間を記録します。"""
+    return _instrumentation.span(name)
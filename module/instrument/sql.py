@@ -0,0 +1,89 @@
+from functools import wraps
+import inspect
+import re
+import sqlite3
+import time
+
+from .metrics import get_instrumentation
+
+
+SQL_KEY_LENGTH = 160  # ヒストグラムの名前に使うSQLの最大文字数
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """SQLの実行時間を記録し、低速なSQLの実行計画を取得するカーソルクラス"""
+    def execute(self, sql: str, parameters=(), /):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_sql(self.connection, sql, parameters, (time.perf_counter() - start) * 1000)
+
+    def executemany(self, sql: str, seq_of_parameters, /):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_sql(self.connection, sql, None, (time.perf_counter() - start) * 1000)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """InstrumentedCursorを使う接続クラス"""
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+def normalize_sql(sql: str) -> str:
+    """空白をまとめ、長いSQLを切り詰めます。"""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    return sql if len(sql) <= SQL_KEY_LENGTH else sql[:SQL_KEY_LENGTH] + '...'
+
+
+def instrument_controller(db: object, prefix: str = 'db') -> object:
+    """DBControllerの公開メソッドを、実行時間を記録するメソッドに置き換えます。"""
+    instrumentation = get_instrumentation()
+
+    for name, function in inspect.getmembers(type(db), inspect.isfunction):
+        if name.startswith('_'):
+            continue
+
+        def wrap(method, name=name):
+            @wraps(method)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    instrumentation.record(f'{prefix}.{name}', (time.perf_counter() - start) * 1000)
+            return wrapper
+
+        setattr(db, name, wrap(getattr(db, name)))
+
+    return db
+
+
+def _record_sql(conn: sqlite3.Connection, sql: str, parameters, ms: float) -> None:
+    """SQLの実行時間を記録し、しきい値を超えた場合は実行計画とともに記録します。"""
+    instrumentation = get_instrumentation()
+    key = normalize_sql(sql)
+    instrumentation.record(f'sql: {key}', ms)
+
+    if ms >= instrumentation.slow_query_ms:
+        # executemanyはパラメータが複数あるため実行計画を取得しない
+        plan = _explain(conn, sql, parameters) if parameters is not None else []
+        instrumentation.record_slow_query(key, ms, plan)
+
+
+def _explain(conn: sqlite3.Connection, sql: str, parameters) -> list[str]:
+    """SQLの実行計画を取得します。取得できない文の場合は空のリストを返します。"""
+    # 計測用ではない通常のカーソルで実行し、再帰的に記録されないようにする
+    cursor = sqlite3.Connection.cursor(conn, sqlite3.Cursor)
+    try:
+        rows = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters).fetchall()
+        return [row[-1] for row in rows]
+    except sqlite3.Error:
+        return []
+    finally:
+        cursor.close()
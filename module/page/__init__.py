@@ -1,6 +1,30 @@
-from .add_place import show_add_place_page
-from .create_acount import show_create_account_page
-from .home import show_home_page
-from .login import show_login_page
-from .setting import show_setting_page
-from .shift import show_shift_page
+from importlib import import_module
+from typing import Callable
+
+
+PAGES = {
+    'ホーム': ('.home', 'show_home_page'),
+    '勤務先追加': ('.add_place', 'show_add_place_page'),
+    'シフト': ('.shift', 'show_shift_page'),
+    '分析': ('.analytics', 'show_analytics_page'),
+    '職場': ('.workplace', 'show_workplace_page'),
+    '設定': ('.setting', 'show_setting_page'),
+    'ログイン': ('.login', 'show_login_page'),
+    'アカウント作成': ('.create_acount', 'show_create_account_page'),
+}  # メニュー名ごとのページのモジュールと関数名
+
+_PAGE_MODULES = {function_name: module_name for module_name, function_name in PAGES.values()}
+
+
+def get_page(name: str) -> Callable:
+    """メニュー名に対応するページ関数を取得します。ページのモジュールは最初に表示する時点で読み込みます。"""
+    module_name, function_name = PAGES[name]
+    return getattr(import_module(module_name, __name__), function_name)
+
+
+def __getattr__(name: str) -> Callable:
+    """show_*_pageを、最初に使われた時点でページのモジュールを読み込んで取得します。"""
+    module_name = _PAGE_MODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(import_module(module_name, __name__), name)
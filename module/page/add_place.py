@@ -1,6 +1,8 @@
+from datetime import date, datetime, time
+
 import streamlit as st
 
-from module.db import DBController
+from module.db import DBController, WageRule, WEEKDAY_LABELS
 
 
 def show_add_place_page(db: DBController) -> None:
@@ -18,3 +20,53 @@ def show_add_place_page(db: DBController) -> None:
                     st.success(f'勤務先{add_place}が登録されました')
                 else:
                     st.error(f'勤務先{add_place}は既に存在します')
+
+    places = db.get_places(st.session_state['user_id'])
+    if places:
+        _show_wage_rule_form(db, places)
+
+
+def _show_wage_rule_form(db: DBController, places: list[str]) -> None:
+    """勤務先ごとの割増賃金のルールと時給の変更のフォームを表示します。保存するとシフトの給料をまとめて計算し直します。"""
+    st.subheader('給料のルール')
+
+    place = st.selectbox('勤務先', places, key='wage_rule_place')
+    rule = db.get_wage_rules(st.session_state['user_id']).get(place, WageRule(place))
+
+    with st.form('wage_rule_form', border=False):
+        night_percent = st.number_input('深夜(22:00〜5:00)の割増率(%)', min_value=0, value=rule.night_percent, step=1, key='night_percent')
+        overtime_after = st.number_input('残業となる勤務時間(時間)', min_value=0.0, value=rule.overtime_after / 3600, step=0.5, key='overtime_after')
+        overtime_percent = st.number_input('残業の割増率(%)', min_value=0, value=rule.overtime_percent, step=1, key='overtime_percent')
+        holidays = st.multiselect(
+            '休日の曜日',
+            WEEKDAY_LABELS,
+            default=[label for weekday, label in enumerate(WEEKDAY_LABELS) if rule.is_holiday(weekday)],
+            key='holidays',
+        )
+        holiday_percent = st.number_input('休日の割増率(%)', min_value=0, value=rule.holiday_percent, step=1, key='holiday_percent')
+
+        if st.form_submit_button('保存', type='primary'):
+            count = db.set_wage_rule(st.session_state['user_id'], WageRule(
+                place=place,
+                night_percent=night_percent,
+                overtime_percent=overtime_percent,
+                overtime_after=round(overtime_after * 3600),
+                holiday_percent=holiday_percent,
+                holiday_weekdays=sum(1 << WEEKDAY_LABELS.index(label) for label in holidays),
+            ))
+            st.session_state['shifts'] = None
+            st.success(f'{place}のルールを保存し、{count}件のシフトの給料を計算し直しました')
+
+    with st.form('hourly_wage_form', border=False):
+        hourly_wage = st.number_input('新しい時給(円)', min_value=0, value=1000, step=1, key='new_hourly_wage')
+        start_date = st.date_input('適用する開始日', value=date.today(), key='hourly_wage_start_date')
+
+        if st.form_submit_button('時給を変更', type='primary'):
+            count = db.recompute_amounts(
+                st.session_state['user_id'],
+                place,
+                datetime.combine(start_date, time()),
+                hourly_wage=hourly_wage,
+            )
+            st.session_state['shifts'] = None
+            st.success(f'{place}の{start_date.strftime("%Y/%m/%d")}以降のシフト{count}件の時給を変更しました')
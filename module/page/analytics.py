@@ -0,0 +1,68 @@
+import altair as alt
+import streamlit as st
+
+from module.analytics import EarningsSummary, load_shift_arrays, summarize
+from module.db import DBController
+from module.instrument import span
+
+
+def show_analytics_page(db: DBController) -> None:
+    """分析ページを表示します。"""
+    user_id = st.session_state['user_id']
+    user = db.get_user(user_id)
+
+    with span('analytics.summary'):
+        summary = _get_summary(db, user_id, db.get_data_version(user_id), user['closing_day'])
+
+    st.subheader('分析')
+
+    if summary is None:
+        st.info('シフトが登録されていません')
+        return
+
+    total_column, hours_column, wage_column = st.columns(3)
+    total_column.metric('給料の合計', f'{summary.total_amount:,}円')
+    hours_column.metric('勤務時間の合計', f'{summary.total_hours:,.1f}時間')
+    wage_column.metric('実質時給の平均', f'{summary.effective_hourly_wage:,.0f}円')
+
+    st.write('勤務先ごとの給料')
+    st.bar_chart(summary.by_place['給料'])
+    st.dataframe(summary.by_place)
+
+    st.write('月ごとの給料')
+    st.bar_chart(summary.by_month['給料'])
+
+    st.write('給料期間ごとの給料')
+    st.bar_chart(summary.by_period['給料'])
+
+    st.write('曜日ごとの勤務時間')
+    # 曜日を名前順ではなく月曜日から並べる
+    st.altair_chart(
+        alt.Chart(summary.by_weekday.reset_index()).mark_bar().encode(
+            x=alt.X('曜日:O', sort=list(summary.by_weekday.index)),
+            y=alt.Y('勤務時間:Q'),
+        ),
+        use_container_width=True,
+    )
+
+    st.write('時間帯ごとの勤務時間')
+    heatmap = summary.heatmap.reset_index().melt(id_vars='曜日', var_name='時', value_name='勤務時間')
+    st.altair_chart(
+        alt.Chart(heatmap).mark_rect().encode(
+            x=alt.X('時:O'),
+            y=alt.Y('曜日:O', sort=list(summary.heatmap.index)),
+            color=alt.Color('勤務時間:Q'),
+            tooltip=['曜日', '時', alt.Tooltip('勤務時間:Q', format='.1f')],
+        ),
+        use_container_width=True,
+    )
+
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def _get_summary(_db: DBController, user_id: int, data_version: int, closing_day: int) -> EarningsSummary | None:
+    """シフトを集計します。シフトのデータバージョンと締め日が変わらない間はキャッシュした結果を返します。"""
+    # 締め日が変わると給料期間のキーも計算し直されるため、締め日もキャッシュのキーに含める
+    shifts = load_shift_arrays(_db, user_id)
+    if len(shifts) == 0:
+        return None
+    return summarize(shifts)
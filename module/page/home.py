@@ -1,14 +1,17 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, time
 
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
 import streamlit as st
 
-from module.db import DBController
+from module.analytics import IncomeForecast, forecast_income
+from module.chart import render_progress_chart, MATPLOTLIB, SVG
+from module.db import DBController, get_period_bounds, get_period_key
+from module.instrument import span
 
 
 LIMIT_AMOUNT = 1_030_000  # 限度額
 PIE_FONTPATH = './fonts/msgothic.ttc'  # 円グラフのフォントパス
+PIE_BACKEND = MATPLOTLIB  # 円グラフの描画方式(MATPLOTLIB または SVG)
+HISTORY_PERIODS = 6  # 表示する直近の給料期間の数
 
 
 def show_home_page(db: DBController) -> None:
@@ -16,15 +19,26 @@ def show_home_page(db: DBController) -> None:
     today = datetime.today()
 
     user = db.get_user(st.session_state['user_id'])
-    start_datetime, end_datetime = _get_date_period(today, user['closing_day'])
-    start_date_str = datetime.strftime(start_datetime, '%Y/%m/%d')
-    end_date_str = datetime.strftime(end_datetime, '%Y/%m/%d')
-
-    current_amount = db.get_amount(st.session_state['user_id'], start_datetime, today)
-    estimated_amount = db.get_amount(st.session_state['user_id'], start_datetime, end_datetime)
-    year_amount = db.get_amount(st.session_state['user_id'], datetime(today.year, 1, 1, 0, 0, 0), today)
-
-    next_shift = db.get_next_shift(st.session_state['user_id'], today)
+    start_date, end_date = get_period_bounds(get_period_key(today, user['closing_day']), user['closing_day'])
+    start_date_str = start_date.strftime('%Y/%m/%d')
+    end_date_str = end_date.strftime('%Y/%m/%d')
+
+    with span('home.db'):
+        current_amount = db.get_amount(st.session_state['user_id'], datetime.combine(start_date, time()), today)
+        # 直近の給料期間の合計を1回の集計で取得し、最後の期間(今回の期間)の合計を見込み額とする
+        period_amounts = db.get_period_amounts(st.session_state['user_id'], today.date(), HISTORY_PERIODS)
+        estimated_amount = period_amounts[-1][2]
+        year_amount = db.get_amount(st.session_state['user_id'], datetime(today.year, 1, 1, 0, 0, 0), today)
+
+        next_shift = db.get_next_shift(st.session_state['user_id'], today)
+
+    with span('home.forecast'):
+        forecast = _get_forecast(
+            db,
+            st.session_state['user_id'],
+            db.get_data_version(st.session_state['user_id']),
+            today.replace(minute=0, second=0, microsecond=0),
+        )
 
     st.subheader('ホーム')
 
@@ -39,6 +53,7 @@ def show_home_page(db: DBController) -> None:
         start_date_str,
         end_date_str,
         PIE_FONTPATH,
+        PIE_BACKEND,
     )
 
     st.markdown(
@@ -46,6 +61,10 @@ def show_home_page(db: DBController) -> None:
         unsafe_allow_html=True
     )
 
+    _display_forecast(forecast)
+
+    _display_period_history(period_amounts)
+
     if next_shift is None:
         st.markdown(
             '<div style="text-align: center; font-size: 28px; font-weight: bold;">次回の出勤予定なし</div>',
@@ -58,36 +77,38 @@ def show_home_page(db: DBController) -> None:
         )
 
 
-def _get_date_period(today: datetime, closing_day: int) -> tuple[datetime, datetime]:
-    """指定された日付と締め日を基に、開始日と終了日を取得します。"""
-    this_month_limit_date = _get_valid_date_for_month(today.year, today.month, closing_day)
+@st.cache_data(max_entries=256, show_spinner=False)
+def _get_forecast(_db: DBController, user_id: int, data_version: int, now: datetime) -> IncomeForecast:
+    """年末までの給料の見込みを取得します。データバージョン(シフト・繰り返し規則・割増賃金ルール)と時刻(1時間単位)が変わらない間はキャッシュした結果を返します。"""
+    return forecast_income(_db, user_id, now)
 
-    if today > this_month_limit_date:
-        start_date = this_month_limit_date + timedelta(days=1)
-        end_date = _get_valid_date_for_month(
-            today.year if today.month != 12 else today.year + 1,
-            today.month + 1 if today.month != 12 else 1,
-            closing_day,
-        ).replace(hour=23, minute=59, second=59)
-    else:
-        start_date = _get_valid_date_for_month(
-            today.year if today.month != 1 else today.year - 1,
-            today.month - 1 if today.month != 1 else 12,
-            closing_day,
-        ) + timedelta(days=1)
-        end_date = this_month_limit_date.replace(hour=23, minute=59, second=59)
 
-    return start_date, end_date
+def _display_forecast(forecast: IncomeForecast) -> None:
+    """年末までの給料の見込みと、各上限を超える見込みの日を表示します。"""
+    st.markdown(
+        f'<div style="text-align: center; font-size: 20px; font-weight: bold;">{forecast.year}年の見込み {forecast.total_amount:,}円</div>',
+        unsafe_allow_html=True
+    )
+    st.caption(
+        f'現在まで {forecast.actual_amount:,}円 / 登録済みの予定 {forecast.scheduled_amount:,}円 / '
+        f'繰り返しが年末まで続いた場合 {forecast.projected_amount:,}円'
+    )
 
+    for limit_forecast in forecast.limits:
+        if limit_forecast.crossing_date is None:
+            st.write(f'{limit_forecast.limit.name}：超えない見込み')
+        elif limit_forecast.is_projected:
+            st.write(f"{limit_forecast.limit.name}：繰り返しが続くと{limit_forecast.crossing_date.strftime('%Y/%m/%d')}に超える見込み")
+        else:
+            st.write(f"{limit_forecast.limit.name}：{limit_forecast.crossing_date.strftime('%Y/%m/%d')}に超える見込み")
 
-def _get_valid_date_for_month(year: int, month: int, closing_day: int) -> datetime:
-    """指定された年、月、および締め日から有効な日付を取得します。"""
-    day = closing_day
-    while True:
-        try:
-            return datetime(year=year, month=month, day=day)
-        except ValueError:
-            day -= 1
+
+def _display_period_history(period_amounts: list[tuple[date, date, int]]) -> None:
+    """直近の給料期間ごとの給料を表示します。"""
+    st.write('給料期間ごとの給料')
+    st.bar_chart(
+        {'給料': {end_date.strftime('%Y/%m/%d締め'): amount for _, end_date, amount in period_amounts}},
+    )
 
 
 def _display_pie_chart(
@@ -97,26 +118,21 @@ def _display_pie_chart(
     start_date: str,
     end_date: str,
     pie_fontpath: str,
+    pie_backend: str,
 ) -> None:
     """円グラフを表示します。"""
-    achievement_rate = (current_amount / goal_amount) * 100
-
-    achievement_rate = 100 if achievement_rate > 100 else achievement_rate
-
-    sizes = [achievement_rate, 100 - achievement_rate]
-    colors = ['#52b338', '#e2e9d9']
-    wedge = {'width' : 0.1}
-
-    plt.pie(sizes, colors=colors, wedgeprops=wedge, startangle=90, counterclock=False)
-
-    fontpath = pie_fontpath
-    font_prop = fm.FontProperties(fname=fontpath)
-
-    plt.text(0, 0.5, f'{start_date} - {end_date}', fontproperties=font_prop, horizontalalignment='center', verticalalignment='center', fontsize=10)
-    plt.text(0, 0.35, f'目標金額 {goal_amount:,}円', fontproperties=font_prop, horizontalalignment='center', verticalalignment='center', fontsize=10)
-    plt.text(0, 0.15, '今日までの給料', fontproperties=font_prop, horizontalalignment='center', verticalalignment='center', fontsize=10)
-    plt.text(0, -0.05, f'{current_amount:,}円', fontproperties=font_prop, horizontalalignment='center', verticalalignment='center', fontsize=20)
-    plt.text(0, -0.3, '見込み額', fontproperties=font_prop, horizontalalignment='center', verticalalignment='center', fontsize=10)
-    plt.text(0, -0.5, f'{estimated_amount:,}円', fontproperties=font_prop, horizontalalignment='center', verticalalignment='center', fontsize=20)
+    with span('home.chart'):
+        chart = render_progress_chart(
+            current_amount,
+            estimated_amount,
+            goal_amount,
+            start_date,
+            end_date,
+            backend=pie_backend,
+            fontpath=pie_fontpath,
+        )
 
-    st.pyplot(plt)
+    if pie_backend == SVG:
+        st.markdown(chart, unsafe_allow_html=True)
+    else:
+        st.image(chart, use_container_width=True)
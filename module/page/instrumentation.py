@@ -0,0 +1,58 @@
+import os
+
+import streamlit as st
+
+from module.instrument import get_instrumentation
+
+
+ADMIN_USER_IDS = frozenset(
+    int(user_id) for user_id in os.environ.get('SHIFT_ADMIN_USER_IDS', '').split(',') if user_id.strip()
+)  # 管理者のユーザーID(計測結果と、職場ページの他のユーザーの給料・人件費を閲覧できる)
+
+
+def is_admin() -> bool:
+    """ログイン中のユーザーが管理者かどうかを判定します。"""
+    # ユーザー名は誰でも登録・変更できるため、変わらないユーザーIDで判定する
+    return st.session_state.get('user_id') in ADMIN_USER_IDS
+
+
+def show_instrumentation_panel() -> None:
+    """サイドバーに計測結果を表示します。"""
+    instrumentation = get_instrumentation()
+    if not instrumentation.enabled:
+        return
+
+    snapshot = instrumentation.snapshot()
+
+    with st.sidebar.expander('計測結果'):
+        st.dataframe(
+            [
+                {
+                    '名前': name,
+                    '回数': histogram['count'],
+                    '平均(ms)': round(histogram['mean_ms'], 2),
+                    'p50(ms)': histogram['p50_ms'],
+                    'p95(ms)': histogram['p95_ms'],
+                    'p99(ms)': histogram['p99_ms'],
+                    '最大(ms)': round(histogram['max_ms'], 2),
+                }
+                for name, histogram in snapshot['histograms'].items()
+            ],
+            hide_index=True,
+        )
+
+        st.write(f"低速クエリ({snapshot['slow_query_ms']:g} ms以上)")
+        for query in reversed(snapshot['slow_queries']):
+            st.code(f"{query['ms']:.1f} ms\n{query['sql']}\n" + '\n'.join(query['plan']), language='sql')
+
+        st.download_button(
+            'JSONでダウンロード',
+            data=instrumentation.dump_json(),
+            file_name='instrumentation.json',
+            mime='application/json',
+            key='instrumentation_download_btn',
+        )
+
+        if st.button('リセット', key='instrumentation_reset_btn'):
+            instrumentation.reset()
+            st.rerun()
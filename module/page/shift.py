@@ -1,32 +1,51 @@
 from datetime import datetime, time, timedelta
+import io
 
 import streamlit as st
 import streamlit_calendar as st_calendar
 
-from module.db import DBController
+from module.db import DBController, Recurrence, Shift, DAILY, WEEKLY, BIWEEKLY, MONTHLY_NTH_WEEKDAY
+from module.instrument import span
+from module.store import ShiftEventStore
+from module.transfer import export_shifts, get_format, import_shifts, read_shifts, CSV, FORMATS
+
+
+REPEAT_OPTIONS = {
+    'なし': None,
+    '毎日': DAILY,
+    '毎週': WEEKLY,
+    '隔週': BIWEEKLY,
+    '毎月(同じ週の曜日)': MONTHLY_NTH_WEEKDAY,
+}  # 繰り返し登録の選択肢
+
+PREFETCH_MARGIN = timedelta(weeks=2)  # カレンダーの表示範囲の前後に先読みする期間
 
 
 def show_shift_page(db: DBController) -> None:
     """シフトページを表示します。"""
     if st.session_state['shifts'] is None:
-        st.session_state['shifts'] = db.get_shifts(st.session_state['user_id'])
+        st.session_state['shifts'] = ShiftEventStore(st.session_state['user_id'])
+    store = st.session_state['shifts']
 
-    events = []
-    for shift in st.session_state['shifts']:
-        events.append({
-            'id': shift['id'],
-            'title': shift['title'],
-            'start': datetime.strftime(shift['start_datetime'], '%Y-%m-%dT%H:%M:%S'),
-            'end': datetime.strftime(shift['end_datetime'], '%Y-%m-%dT%H:%M:%S'),
-        })
+    calendar_date = st.session_state.get('shift_calendar_date', datetime.today().strftime('%Y-%m-%d'))
+    # カレンダーから表示範囲が届くまでは、最初に表示する月を読み込む
+    visible_start, visible_end = st.session_state.get('shift_visible_range') or _get_month_range(datetime.fromisoformat(calendar_date))
+    with span('shift.load'):
+        store.load(db, visible_start - PREFETCH_MARGIN, visible_end + PREFETCH_MARGIN)
 
     st.subheader('シフト')
 
-    if st.button('追加', type='primary', key='add_shift_btn'):
+    add_column, import_column, export_column = st.columns(3)
+    if add_column.button('追加', type='primary', key='add_shift_btn'):
         _show_add_form(db)
+    if import_column.button('取り込み', key='import_shift_btn'):
+        _show_import_form(db)
+    if export_column.button('書き出し', key='export_shift_btn'):
+        _show_export_form(db)
 
     options = {
         'initialView': 'dayGridMonth',
+        'initialDate': calendar_date,
         'titleFormat': {
             'year': 'numeric',
             'month': '2-digit',
@@ -36,13 +55,43 @@ def show_shift_page(db: DBController) -> None:
         'height': 'auto',
     }
 
-    calender_event = st_calendar.calendar(events=events, options=options)
+    with span('shift.calendar'):
+        # カレンダーは最初に渡したイベントしか表示しないため、イベントが変わったらキーを変えて作り直す
+        calender_event = st_calendar.calendar(
+            events=store.events(),
+            options=options,
+            callbacks=['eventsSet', 'eventClick'],
+            key=f'shift_calendar_{store.version}',
+        )
 
     if calender_event:
-        if calender_event['callback'] == 'eventClick':
+        if calender_event['callback'] == 'eventsSet':
+            # streamlit-calendar 1.3.1はdatesSetを送らないため、eventsSetに含まれる表示範囲を使う
+            view = calender_event['eventsSet'].get('view')
+            if view is not None:
+                visible_range = (_parse_calendar_datetime(view['activeStart']), _parse_calendar_datetime(view['activeEnd']))
+                if visible_range != st.session_state.get('shift_visible_range'):
+                    st.session_state['shift_visible_range'] = visible_range
+                    st.session_state['shift_calendar_date'] = _parse_calendar_datetime(view['currentStart']).strftime('%Y-%m-%d')
+                    st.rerun()
+        elif calender_event['callback'] == 'eventClick':
             selected_shift_id = int(calender_event['eventClick']['event']['id'])
-            selected_shift = [shift for shift in st.session_state['shifts'] if shift['id'] == selected_shift_id][0]
-            _show_detail(selected_shift, db)
+            selected_shift = store.get(selected_shift_id)
+            if selected_shift is not None:
+                _show_detail(selected_shift, db)
+
+
+def _get_month_range(today: datetime) -> tuple[datetime, datetime]:
+    """指定された日付を含む月の開始日時と、翌月の開始日時を取得します。"""
+    start = datetime(today.year, today.month, 1)
+    end = datetime(today.year + 1, 1, 1) if today.month == 12 else datetime(today.year, today.month + 1, 1)
+    return start, end
+
+
+def _parse_calendar_datetime(value: str) -> datetime:
+    """カレンダーから渡されたISO形式(UTC)の日時を、ローカル時刻のタイムゾーンなしの日時に変換します。"""
+    # toISOString()はUTCで返すため、そのまま日付を取り出すと日本時間の0:00が前日になる
+    return datetime.fromisoformat(value).astimezone().replace(tzinfo=None)
 
 
 @st.dialog('シフト追加')
@@ -51,7 +100,8 @@ def _show_add_form(db: DBController):
     places = db.get_places(st.session_state['user_id'])
 
     if places:
-        is_repeat = st.checkbox('週次登録', key='is_repeat')
+        repeat = st.selectbox('繰り返し', options=list(REPEAT_OPTIONS), key='repeat')
+        repeat_freq = REPEAT_OPTIONS[repeat]
 
         with st.form('add_shift_form', border=False):
             shift_place = st.selectbox('勤務先を選択してください', options=places, key='shift_place')
@@ -61,8 +111,8 @@ def _show_add_form(db: DBController):
             shift_end_date = st.date_input('終了日付を入力してください', value=datetime.today(), key='shift_end_date')
             shift_end_time = st.time_input('終了時刻を入力してください', value=time(17, 0), key='shift_end_time', step=300)
 
-            if is_repeat:
-                repeat_end_date = st.date_input('最終日付(週次)を入力してください', value=datetime.today(), key='repeat_end_date')
+            if repeat_freq is not None:
+                repeat_end_date = st.date_input('最終日付(繰り返し)を入力してください', value=datetime.today(), key='repeat_end_date')
 
             shift_break_time = st.time_input('休憩時間を入力してください', value=time(0, 0), key='shift_break_time', step=300)
             shift_hourly_wage = st.number_input('時給(円)を入力してください', value=1000, key='shift_hourly_wage', step=1)
@@ -77,28 +127,22 @@ def _show_add_form(db: DBController):
                     if shift_start_datetime >= shift_end_datetime:
                         st.error('開始日時は終了日時よりも早く設定してください')
                     else:
-                        if is_repeat:
+                        if repeat_freq is not None:
                             if shift_start_date > repeat_end_date:
-                                st.error('開始日時は最終日付(週次)よりも早く設定してください')
+                                st.error('開始日時は最終日付(繰り返し)よりも早く設定してください')
                             else:
-                                while shift_start_date <= repeat_end_date:
-                                    if db.add_shift(
-                                        st.session_state['user_id'],
-                                        shift_place,
-                                        shift_title,
-                                        shift_start_datetime,
-                                        shift_end_datetime,
-                                        shift_break_time,
-                                        shift_hourly_wage,
-                                        is_upadate=True,
-                                    ):
-                                        shift_start_date += timedelta(days=7)
-                                        shift_end_date += timedelta(days=7)
-                                        shift_start_datetime = datetime.combine(shift_start_date, shift_start_time)
-                                        shift_end_datetime = datetime.combine(shift_end_date, shift_end_time)
-                                else:
-                                    st.session_state['shifts'] = None
-                                    st.rerun()
+                                results = db.add_shifts_bulk(
+                                    st.session_state['user_id'],
+                                    shift_place,
+                                    shift_title,
+                                    shift_start_datetime,
+                                    shift_end_datetime,
+                                    shift_break_time,
+                                    shift_hourly_wage,
+                                    Recurrence(repeat_freq, repeat_end_date),
+                                )
+                                _refresh_shifts(db, results[0].start_datetime, results[-1].end_datetime)
+                                st.rerun()
                         else:
                             if db.add_shift(
                                 st.session_state['user_id'],
@@ -109,7 +153,7 @@ def _show_add_form(db: DBController):
                                 shift_break_time,
                                 shift_hourly_wage,
                             ):
-                                st.session_state['shifts'] = None
+                                _refresh_shifts(db, shift_start_datetime, shift_end_datetime)
                                 st.rerun()
                             else:
                                 st.error('その時間はシフトが既に存在します')
@@ -118,16 +162,69 @@ def _show_add_form(db: DBController):
 
 
 @st.dialog('シフト詳細')
-def _show_detail(shift: dict, db: DBController):
+def _show_detail(shift: Shift, db: DBController):
     """シフト詳細ダイアログを表示します。"""
-    st.write(f"勤務先：{shift['place']}")
-    st.write(f"タイトル：{shift['title']}")
-    st.write(f"開始日時：{datetime.strftime(shift['start_datetime'], '%Y/%m/%d %H:%M')}")
-    st.write(f"終了日時：{datetime.strftime(shift['end_datetime'], '%Y/%m/%d %H:%M')}")
-    st.write(f"休憩時間：{time.strftime(shift['break_time'], '%H:%M')}")
-    st.write(f"時給(円)：{shift['hourly_wage']}")
+    st.write(f'勤務先：{shift.place}')
+    st.write(f'タイトル：{shift.title}')
+    st.write(f"開始日時：{datetime.strftime(shift.start_datetime, '%Y/%m/%d %H:%M')}")
+    st.write(f"終了日時：{datetime.strftime(shift.end_datetime, '%Y/%m/%d %H:%M')}")
+    st.write(f"休憩時間：{time.strftime(shift.break_time, '%H:%M')}")
+    st.write(f'時給(円)：{shift.hourly_wage}')
 
     if st.button('削除', type='primary', key='delete_shift_btn'):
-        db.delete_shift(shift['id'])
-        st.session_state['shifts'] = None
+        db.delete_shift(shift.id)
+        if st.session_state['shifts'] is not None:
+            st.session_state['shifts'].remove(shift.id)
         st.rerun()
+
+
+@st.dialog('シフト取り込み')
+def _show_import_form(db: DBController):
+    """CSV・iCalendarファイルからシフトを取り込むダイアログを表示します。"""
+    with st.form('import_shift_form', border=False):
+        import_file = st.file_uploader('ファイルを選択してください(.csvまたは.ics)', type=list(FORMATS), key='import_file')
+        import_hourly_wage = st.number_input('時給がない予定の時給(円)', value=1000, key='import_hourly_wage', step=1)
+        import_is_update = st.checkbox('重なる既存のシフトを置き換える', key='import_is_update')
+
+        if st.form_submit_button('取り込む', type='primary'):
+            if import_file is None:
+                st.error('ファイルが選択されていません')
+            else:
+                # アップロードされたファイルを1行ずつ読み込み、全体を文字列に変換しない
+                lines = io.TextIOWrapper(import_file, encoding='utf-8-sig', newline='')
+                records = read_shifts(lines, get_format(import_file.name), default_hourly_wage=import_hourly_wage)
+                report = import_shifts(db, st.session_state['user_id'], records, is_upadate=import_is_update)
+
+                # 取り込んだ期間が広いため、表示中のシフトはすべて読み込み直す
+                st.session_state['shifts'] = None
+                st.success(f'{report.inserted + report.replaced}件のシフトを取り込みました')
+                st.text(str(report))
+
+
+@st.dialog('シフト書き出し')
+def _show_export_form(db: DBController):
+    """シフトをCSV・iCalendarファイルとして書き出すダイアログを表示します。"""
+    export_format = st.radio('形式', options=FORMATS, format_func=lambda format: 'CSV' if format == CSV else 'iCalendar', key='export_format')
+
+    # 書き出しは全件を読むため、ボタンが押されたときだけ作成し、シフトが変わるまで使い回す
+    user_id = st.session_state['user_id']
+    export_key = (user_id, export_format, db.get_data_version(user_id))
+    if st.button('ファイルを作成', key='export_prepare_btn'):
+        st.session_state['export_file'] = (export_key, ''.join(export_shifts(db, user_id, export_format)))
+
+    export_file = st.session_state.get('export_file')
+    if export_file is not None and export_file[0] == export_key:
+        st.download_button(
+            'ダウンロード',
+            data=export_file[1],
+            file_name=f'shifts.{export_format}',
+            mime='text/csv' if export_format == CSV else 'text/calendar',
+            type='primary',
+            key='export_download_btn',
+        )
+
+
+def _refresh_shifts(db: DBController, start_datetime: datetime, end_datetime: datetime) -> None:
+    """追加したシフトの期間だけを再取得し、表示中のシフトに反映します。"""
+    if st.session_state['shifts'] is not None:
+        st.session_state['shifts'].refresh_range(db, start_datetime, end_datetime)
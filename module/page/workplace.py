@@ -0,0 +1,75 @@
+from datetime import date, datetime, time, timedelta
+
+import streamlit as st
+
+from module.db import DBController
+from module.instrument import span
+from module.page.instrumentation import is_admin
+
+
+SLOT_OPTIONS = {
+    '30分': timedelta(minutes=30),
+    '1時間': timedelta(hours=1),
+    '3時間': timedelta(hours=3),
+}  # 時間帯の長さの選択肢
+
+
+def show_workplace_page(db: DBController) -> None:
+    """自分が登録している勤務先の全員のシフトと、時間帯ごとの勤務人数を表示する職場ページを表示します。
+
+    他のユーザーのユーザー名と給料、および人件費は管理者にだけ表示します。
+    """
+    st.subheader('職場')
+
+    user_id = st.session_state['user_id']
+    place_names = db.get_places(user_id)
+    if not place_names:
+        st.info('勤務先が登録されていません')
+        return
+    show_details = is_admin()
+
+    place_column, date_column, days_column, slot_column = st.columns(4)
+    place = place_column.selectbox('勤務先', place_names, key='workplace_place')
+    start_date = date_column.date_input('開始日', value=date.today(), key='workplace_start_date')
+    days = days_column.number_input('日数', min_value=1, max_value=31, value=7, step=1, key='workplace_days')
+    slot_name = slot_column.selectbox('時間帯', list(SLOT_OPTIONS), index=1, key='workplace_slot')
+
+    start_datetime = datetime.combine(start_date, time())
+    end_datetime = start_datetime + timedelta(days=days)
+
+    with span('workplace.db'):
+        staffing = db.get_place_staffing(user_id, place, start_datetime, end_datetime, SLOT_OPTIONS[slot_name])
+        schedule = db.get_place_schedule(user_id, place, start_datetime, end_datetime, include_details=show_details)
+
+    staff_column, peak_column, cost_column = st.columns(3)
+    staff_column.metric('勤務する人数', f"{len({shift['user_id'] for shift in schedule})}人")
+    peak_column.metric('最大の同時勤務人数', f'{max(slot.staff_count for slot in staffing)}人')
+    if show_details:
+        cost_column.metric('期間内の人件費', f'{sum(slot.labor_cost for slot in staffing):,}円')
+
+    labels = [slot.start_datetime.strftime('%m/%d %H:%M') for slot in staffing]
+
+    st.write('時間帯ごとの勤務人数')
+    st.bar_chart({'勤務人数': dict(zip(labels, (slot.staff_count for slot in staffing)))})
+
+    if show_details:
+        st.write('時間帯ごとの人件費')
+        st.line_chart({'人件費': dict(zip(labels, (slot.labor_cost for slot in staffing)))})
+
+    st.write('シフト一覧')
+    if not schedule:
+        st.info('期間内のシフトはありません')
+        return
+    st.dataframe(
+        [
+            {
+                'ユーザー名': shift['username'] if shift['username'] is not None else '(非公開)',
+                '開始日時': shift['start_datetime'].strftime('%Y/%m/%d %H:%M'),
+                '終了日時': shift['end_datetime'].strftime('%Y/%m/%d %H:%M'),
+                '給料': shift['amount'],
+            }
+            for shift in schedule
+        ],
+        hide_index=True,
+        use_container_width=True,
+    )
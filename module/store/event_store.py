@@ -0,0 +1,97 @@
+from datetime import datetime
+import itertools
+
+from module.db import DBController, Shift
+
+
+EVENT_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'  # カレンダーに渡す日時の形式
+
+_versions = itertools.count(1)  # イベントストア全体で重複しないバージョン番号
+
+
+class ShiftEventStore:
+    """ユーザーのシフトをIDで保持し、カレンダー用のイベントを変換済みで保持するクラス"""
+    def __init__(self, user_id: int):
+        """空のイベントストアを作成します。"""
+        self.user_id = user_id
+        self.window: tuple[datetime, datetime] | None = None
+        self._shifts: dict[int, Shift] = {}
+        self._events: dict[int, dict] = {}
+        self._event_list: list[dict] | None = None
+        self.version = next(_versions)  # 保持しているイベントが変わるたびに更新する
+
+    def __len__(self) -> int:
+        return len(self._shifts)
+
+    def get(self, shift_id: int) -> Shift | None:
+        """指定されたIDのシフトを取得します。"""
+        return self._shifts.get(shift_id)
+
+    def events(self) -> list[dict]:
+        """カレンダーに渡すイベントのリストを取得します。変更がなければ前回のリストを返します。"""
+        if self._event_list is None:
+            self._event_list = list(self._events.values())
+        return self._event_list
+
+    def load(self, db: DBController, start_datetime: datetime, end_datetime: datetime) -> None:
+        """指定期間のシフトを読み込みます。読み込み済みの期間は再取得しません。"""
+        if self.window is not None:
+            loaded_start, loaded_end = self.window
+            if loaded_start <= start_datetime and end_datetime <= loaded_end:
+                return
+
+            if start_datetime <= loaded_end and loaded_start <= end_datetime:
+                # 読み込み済みの期間と重なる場合は、不足している前後の期間のみ取得する
+                for missing_start, missing_end in ((start_datetime, loaded_start), (loaded_end, end_datetime)):
+                    if missing_start < missing_end:
+                        self._put_all(db.get_shifts(self.user_id, missing_start, missing_end))
+                self.window = (min(start_datetime, loaded_start), max(end_datetime, loaded_end))
+                return
+
+            self._clear()
+
+        self._put_all(db.get_shifts(self.user_id, start_datetime, end_datetime))
+        self.window = (start_datetime, end_datetime)
+
+    def refresh_range(self, db: DBController, start_datetime: datetime, end_datetime: datetime) -> None:
+        """指定期間と重なるシフトだけを再取得し、追加・置き換えを反映します。"""
+        shifts = db.get_shifts(self.user_id, start_datetime, end_datetime)
+        shift_ids = {shift.id for shift in shifts}
+
+        # 期間内にあったが再取得結果にないシフトは、置き換えにより無効化されたもの
+        for shift_id, shift in list(self._shifts.items()):
+            if shift_id not in shift_ids and shift.start_datetime < end_datetime and shift.end_datetime > start_datetime:
+                self.remove(shift_id)
+
+        self._put_all(shifts)
+
+    def remove(self, shift_id: int) -> None:
+        """指定されたIDのシフトを削除します。"""
+        if self._shifts.pop(shift_id, None) is not None:
+            del self._events[shift_id]
+            self._changed()
+
+    def _put_all(self, shifts: list[Shift]) -> None:
+        """シフトを追加し、イベントに変換して保持します。"""
+        for shift in shifts:
+            self._shifts[shift.id] = shift
+            self._events[shift.id] = {
+                'id': shift.id,
+                'title': shift.title,
+                'start': datetime.strftime(shift.start_datetime, EVENT_DATETIME_FORMAT),
+                'end': datetime.strftime(shift.end_datetime, EVENT_DATETIME_FORMAT),
+            }
+        if shifts:
+            self._changed()
+
+    def _clear(self) -> None:
+        """保持しているシフトをすべて削除します。"""
+        self.window = None
+        self._shifts.clear()
+        self._events.clear()
+        self._changed()
+
+    def _changed(self) -> None:
+        """イベントのリストを作り直すようにし、バージョンを更新します。"""
+        self._event_list = None
+        self.version = next(_versions)
@@ -0,0 +1,2 @@
+from .records import InvalidRow
+from .transfer import ImportReport, export_shifts, get_format, import_shifts, read_shifts, CSV, ICS, FORMATS
\ No newline at end of file
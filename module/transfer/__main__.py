@@ -0,0 +1,4 @@
+from .transfer import main
+
+
+main()
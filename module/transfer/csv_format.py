@@ -0,0 +1,63 @@
+import csv
+import io
+from typing import Iterable, Iterator
+
+from module.db import Shift, ShiftRecord
+
+from .records import InvalidRow, parse_break_time, parse_datetime, validate_record
+
+
+CSV_COLUMNS = ('place', 'title', 'start', 'end', 'break', 'hourly_wage')  # CSVの列名
+
+CSV_DATETIME_FORMAT = '%Y-%m-%d %H:%M'  # 書き出す日時の形式
+
+
+def read_csv(lines: Iterable[str]) -> Iterator[ShiftRecord | InvalidRow]:
+    """CSVを1行ずつ読み込み、シフトまたは取り込めなかった行を返します。"""
+    reader = csv.DictReader(lines)
+    missing = [column for column in CSV_COLUMNS if column != 'break' and column not in (reader.fieldnames or ())]
+    if missing:
+        yield InvalidRow(1, f"列がありません: {', '.join(missing)}")
+        return
+
+    for row in reader:
+        try:
+            record = ShiftRecord(
+                place=row['place'].strip(),
+                title=row['title'].strip(),
+                start_datetime=parse_datetime(row['start']),
+                end_datetime=parse_datetime(row['end']),
+                break_time=parse_break_time(row.get('break') or ''),
+                hourly_wage=int(row['hourly_wage']),
+            )
+        except (AttributeError, TypeError, ValueError) as e:
+            yield InvalidRow(reader.line_num, f'値を読み取れません: {e}')
+            continue
+
+        message = validate_record(record)
+        yield record if message is None else InvalidRow(reader.line_num, message)
+
+
+def write_csv(shifts: Iterable[Shift]) -> Iterator[str]:
+    """シフトをCSVの1行ずつの文字列として返します。"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+
+    def flush() -> str:
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for shift in shifts:
+        writer.writerow((
+            shift.place,
+            shift.title,
+            shift.start_datetime.strftime(CSV_DATETIME_FORMAT),
+            shift.end_datetime.strftime(CSV_DATETIME_FORMAT),
+            shift.break_time.strftime('%H:%M'),
+            shift.hourly_wage,
+        ))
+        yield flush()
@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta, timezone
+import re
+from typing import Iterable, Iterator
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from module.db import Shift, ShiftRecord
+
+from .records import InvalidRow, parse_break_time, validate_record
+
+
+ICS_DATETIME_FORMAT = '%Y%m%dT%H%M%S'  # iCalendarの日時の形式
+
+ICS_LINE_OCTETS = 75  # 折り返す1行の最大バイト数
+
+PRODUCT_ID = '-//shift-manager//JA'
+
+_DURATION = re.compile(r'^P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+def read_ics(
+    lines: Iterable[str],
+    *,
+    default_hourly_wage: int = 0,
+    default_place: str = '',
+) -> Iterator[ShiftRecord | InvalidRow]:
+    """iCalendarを1予定ずつ読み込み、シフトまたは取り込めなかった予定を返します。
+
+    勤務先はLOCATION、タイトルはSUMMARYから取得します。休憩時間と時給は書き出し時に付けた独自の項目があれば使います。
+    """
+    event = None
+    event_line = 0
+    for line_number, line in _unfold(lines):
+        name, params, value = _parse_line(line)
+        if name == 'BEGIN' and value == 'VEVENT':
+            event = {}
+            event_line = line_number
+        elif name == 'END' and value == 'VEVENT':
+            if event is not None:
+                yield _to_record(event, event_line, default_hourly_wage, default_place)
+            event = None
+        elif event is not None:
+            event[name] = (params, value)
+
+
+def write_ics(shifts: Iterable[Shift]) -> Iterator[str]:
+    """シフトをiCalendarの1予定ずつの文字列として返します。"""
+    stamp = datetime.now(timezone.utc).strftime(ICS_DATETIME_FORMAT) + 'Z'
+
+    yield _format_lines((
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODUCT_ID}',
+        'CALSCALE:GREGORIAN',
+    ))
+    for shift in shifts:
+        yield _format_lines((
+            'BEGIN:VEVENT',
+            f'UID:shift-{shift.id}@shift-manager',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{shift.start_datetime.strftime(ICS_DATETIME_FORMAT)}',
+            f'DTEND:{shift.end_datetime.strftime(ICS_DATETIME_FORMAT)}',
+            f'SUMMARY:{_escape(shift.title)}',
+            f'LOCATION:{_escape(shift.place)}',
+            f"X-SHIFT-BREAK:{shift.break_time.strftime('%H:%M')}",
+            f'X-SHIFT-HOURLY-WAGE:{shift.hourly_wage}',
+            'END:VEVENT',
+        ))
+    yield _format_lines(('END:VCALENDAR',))
+
+
+def _unfold(lines: Iterable[str]) -> Iterator[tuple[int, str]]:
+    """折り返された行を連結し、(開始行番号, 行)を返します。"""
+    current = None
+    current_line = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current_line, current
+        current = line
+        current_line = line_number
+    if current:
+        yield current_line, current
+
+
+def _parse_line(line: str) -> tuple[str, dict[str, str], str]:
+    """1行を(名前, パラメータ, 値)に分割します。"""
+    in_quote = False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quote = not in_quote
+        elif char == ':' and not in_quote:
+            head, value = line[:index], line[index + 1:]
+            break
+    else:
+        return line.upper(), {}, ''
+
+    name, *param_items = head.split(';')
+    params = {}
+    for item in param_items:
+        key, _, param_value = item.partition('=')
+        params[key.upper()] = param_value.strip('"')
+    return name.upper(), params, value
+
+
+def _to_record(
+    event: dict[str, tuple[dict[str, str], str]],
+    line: int,
+    default_hourly_wage: int,
+    default_place: str,
+) -> ShiftRecord | InvalidRow:
+    """予定の項目からシフトを作成します。"""
+    if 'DTSTART' not in event:
+        return InvalidRow(line, '開始日時がありません')
+    if event.get('STATUS', ({}, ''))[1].upper() == 'CANCELLED':
+        return InvalidRow(line, 'キャンセルされた予定です')
+    if event['DTSTART'][0].get('VALUE') == 'DATE':
+        return InvalidRow(line, '終日の予定は取り込めません')
+
+    try:
+        start_datetime = _parse_datetime(*event['DTSTART'])
+        if 'DTEND' in event:
+            end_datetime = _parse_datetime(*event['DTEND'])
+        elif 'DURATION' in event:
+            end_datetime = start_datetime + _parse_duration(event['DURATION'][1])
+        else:
+            return InvalidRow(line, '終了日時がありません')
+
+        break_time = parse_break_time(event.get('X-SHIFT-BREAK', ({}, ''))[1])
+        hourly_wage = int(event['X-SHIFT-HOURLY-WAGE'][1]) if 'X-SHIFT-HOURLY-WAGE' in event else default_hourly_wage
+    except ValueError as e:
+        return InvalidRow(line, f'値を読み取れません: {e}')
+
+    record = ShiftRecord(
+        place=_unescape(event.get('LOCATION', ({}, ''))[1]).strip() or default_place,
+        title=_unescape(event.get('SUMMARY', ({}, ''))[1]).strip(),
+        start_datetime=start_datetime,
+        end_datetime=end_datetime,
+        break_time=break_time,
+        hourly_wage=hourly_wage,
+    )
+    message = validate_record(record)
+    return record if message is None else InvalidRow(line, message)
+
+
+def _parse_datetime(params: dict[str, str], value: str) -> datetime:
+    """日時をタイムゾーンなしの現地時刻に変換します。"""
+    if value.endswith('Z'):
+        value_datetime = datetime.strptime(value[:-1], ICS_DATETIME_FORMAT).replace(tzinfo=timezone.utc)
+    else:
+        value_datetime = datetime.strptime(value, ICS_DATETIME_FORMAT)
+        try:
+            if 'TZID' in params:
+                value_datetime = value_datetime.replace(tzinfo=ZoneInfo(params['TZID']))
+        except (ValueError, ZoneInfoNotFoundError):
+            # 不明なタイムゾーンは現地時刻として扱う
+            pass
+
+    if value_datetime.tzinfo is not None:
+        value_datetime = value_datetime.astimezone().replace(tzinfo=None)
+    return value_datetime
+
+
+def _parse_duration(value: str) -> timedelta:
+    """'PT8H30M'形式の期間を変換します。"""
+    match = _DURATION.match(value)
+    if match is None:
+        raise ValueError(f'期間の形式が正しくありません: {value}')
+    weeks, days, hours, minutes, seconds = (int(group or 0) for group in match.groups())
+    return timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def _escape(value: str) -> str:
+    """テキストの特殊文字をエスケープします。"""
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _unescape(value: str) -> str:
+    """エスケープされたテキストを元に戻します。"""
+    return re.sub(r'\\([\\;,nN])', lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _format_lines(lines: Iterable[str]) -> str:
+    """各行を75バイトごとに折り返し、CRLFで連結します。"""
+    folded = []
+    for line in lines:
+        if len(line.encode('utf-8')) <= ICS_LINE_OCTETS:
+            folded.append(line)
+            continue
+
+        chunk = ''
+        size = 0
+        for char in line:
+            char_size = len(char.encode('utf-8'))
+            if size + char_size > ICS_LINE_OCTETS:
+                folded.append(chunk)
+                chunk = ' '
+                size = 1
+            chunk += char
+            size += char_size
+        folded.append(chunk)
+    return ''.join(f'{line}\r\n' for line in folded)
@@ -0,0 +1,44 @@
+from dataclasses import dataclass
+from datetime import datetime, time
+
+from module.db import ShiftRecord
+
+
+@dataclass
+class InvalidRow:
+    """取り込めなかった行を表すクラス"""
+    line: int
+    message: str
+
+
+def validate_record(record: ShiftRecord) -> str | None:
+    """取り込むシフトの内容を検証し、問題があればその内容を返します。"""
+    if not record.place:
+        return '勤務先がありません'
+    if not record.title:
+        return 'タイトルがありません'
+    if record.start_datetime >= record.end_datetime:
+        return '開始日時が終了日時以降です'
+    if record.hourly_wage < 0:
+        return '時給が負の値です'
+
+    break_seconds = record.break_time.hour * 3600 + record.break_time.minute * 60 + record.break_time.second
+    if break_seconds >= (record.end_datetime - record.start_datetime).total_seconds():
+        return '休憩時間が勤務時間以上です'
+    return None
+
+
+def parse_break_time(value: str) -> time:
+    """休憩時間を'HH:MM'形式または分数から変換します。"""
+    value = value.strip()
+    if not value:
+        return time(0, 0)
+    if value.isdigit():
+        minutes = int(value)
+        return time(minutes // 60, minutes % 60)
+    return time.fromisoformat(value)
+
+
+def parse_datetime(value: str) -> datetime:
+    """日時を'YYYY-MM-DD HH:MM'形式または'YYYY/MM/DD HH:MM'形式から変換します。"""
+    return datetime.fromisoformat(value.strip().replace('/', '-'))
@@ -0,0 +1,179 @@
+import argparse
+from dataclasses import dataclass, field
+import os
+import sys
+from typing import Iterable, Iterator
+
+from module.db import DBController, ShiftRecord, get_db_controller, INSERTED, REPLACED, SKIPPED
+from module.db.db_controller import DEFAULT_DATABASE
+
+from .csv_format import read_csv, write_csv
+from .ics_format import read_ics, write_ics
+from .records import InvalidRow
+
+
+CSV = 'csv'
+ICS = 'ics'
+FORMATS = (CSV, ICS)
+
+DEFAULT_CHUNK_SIZE = 500  # 1つのトランザクションで登録するシフトの件数
+
+MAX_ERRORS = 100  # 結果に残す取り込めなかった行の件数
+
+
+@dataclass
+class ImportReport:
+    """シフトの取り込み結果を表すクラス"""
+    inserted: int = 0
+    replaced: int = 0
+    skipped: int = 0
+    invalid: int = 0
+    created_places: list[str] = field(default_factory=list)
+    errors: list[str] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str) -> None:
+        """取り込めなかった行を記録します。"""
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f'{line}行目: {message}')
+
+    def __str__(self) -> str:
+        lines = [
+            f'追加: {self.inserted:,}件',
+            f'置き換え: {self.replaced:,}件',
+            f'重複のため未登録: {self.skipped:,}件',
+            f'取り込めなかった行: {self.invalid:,}件',
+        ]
+        if self.created_places:
+            lines.append(f"追加した勤務先: {', '.join(self.created_places)}")
+        lines.extend(self.errors)
+        return '\n'.join(lines)
+
+
+def get_format(filename: str) -> str:
+    """ファイル名の拡張子から形式を判定します。"""
+    extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    if extension not in FORMATS:
+        raise ValueError(f'対応していない形式です: {filename}')
+    return extension
+
+
+def read_shifts(
+    lines: Iterable[str],
+    format: str,
+    *,
+    default_hourly_wage: int = 0,
+    default_place: str = '',
+) -> Iterator[ShiftRecord | InvalidRow]:
+    """指定された形式のファイルを1件ずつ読み込みます。"""
+    if format == CSV:
+        return read_csv(lines)
+    if format == ICS:
+        return read_ics(lines, default_hourly_wage=default_hourly_wage, default_place=default_place)
+    raise ValueError(f'対応していない形式です: {format}')
+
+
+def import_shifts(
+    db: DBController,
+    user_id: int,
+    records: Iterable[ShiftRecord | InvalidRow],
+    *,
+    is_upadate: bool = False,
+    create_places: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> ImportReport:
+    """シフトを一定件数ごとに、勤務先と既存のシフトとの重なりをまとめて確認し、1つのトランザクションで登録します。
+
+    既存のシフトと重なるシフトは、is_upadateがTrueの場合は既存のシフトを置き換え、Falseの場合は登録しません。
+    create_placesがTrueの場合は未登録の勤務先を追加し、Falseの場合はその行を取り込みません。
+    """
+    report = ImportReport()
+    places = set(db.get_places(user_id))
+    chunk: list[ShiftRecord] = []
+
+    def flush() -> None:
+        for place in sorted({record.place for record in chunk} - places):
+            if not create_places:
+                if len(report.errors) < MAX_ERRORS:
+                    report.errors.append(f'勤務先{place}が登録されていません')
+                continue
+            db.add_place(user_id, place)
+            places.add(place)
+            report.created_places.append(place)
+
+        shifts = [record for record in chunk if record.place in places]
+        report.invalid += len(chunk) - len(shifts)
+        for result in db.add_shifts(user_id, shifts, is_upadate=is_upadate):
+            if result.status == INSERTED:
+                report.inserted += 1
+            elif result.status == REPLACED:
+                report.replaced += 1
+            elif result.status == SKIPPED:
+                report.skipped += 1
+        chunk.clear()
+
+    for record in records:
+        if isinstance(record, InvalidRow):
+            report.add_error(record.line, record.message)
+            continue
+
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            flush()
+
+    if chunk:
+        flush()
+
+    return report
+
+
+def export_shifts(db: DBController, user_id: int, format: str) -> Iterator[str]:
+    """ユーザーのシフトを指定された形式で少しずつ書き出します。"""
+    shifts = db.iter_shifts(user_id)
+    if format == CSV:
+        return write_csv(shifts)
+    if format == ICS:
+        return write_ics(shifts)
+    raise ValueError(f'対応していない形式です: {format}')
+
+
+def main() -> None:
+    """コマンドラインからシフトの取り込み・書き出しを行います。"""
+    parser = argparse.ArgumentParser(description='シフトをCSV・iCalendar形式で取り込み・書き出しします。')
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='データベースファイルのパス')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='ファイルからシフトを取り込みます')
+    import_parser.add_argument('path', help='取り込むファイルのパス(.csvまたは.ics)')
+    import_parser.add_argument('--user-id', type=int, required=True, help='取り込み先のユーザーID')
+    import_parser.add_argument('--format', choices=FORMATS, default=None, help='ファイルの形式(省略時は拡張子から判定)')
+    import_parser.add_argument('--replace', action='store_true', help='重なる既存のシフトを置き換える')
+    import_parser.add_argument('--hourly-wage', type=int, default=0, help='時給がない予定に使う時給(iCalendarのみ)')
+    import_parser.add_argument('--place', default='', help='勤務先がない予定に使う勤務先(iCalendarのみ)')
+    import_parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='1つのトランザクションで登録する件数')
+
+    export_parser = subparsers.add_parser('export', help='シフトをファイルへ書き出します')
+    export_parser.add_argument('--user-id', type=int, required=True, help='書き出すユーザーID')
+    export_parser.add_argument('--format', choices=FORMATS, default=None, help='ファイルの形式(省略時は拡張子から判定)')
+    export_parser.add_argument('--output', '-o', default=None, help='書き出し先のパス(省略時は標準出力)')
+
+    args = parser.parse_args()
+    db = get_db_controller(args.database, cached=False)
+
+    if args.command == 'import':
+        format = args.format or get_format(args.path)
+        with open(args.path, encoding='utf-8-sig', newline='') as f:
+            records = read_shifts(f, format, default_hourly_wage=args.hourly_wage, default_place=args.place)
+            report = import_shifts(db, args.user_id, records, is_upadate=args.replace, chunk_size=args.chunk_size)
+        print(report)
+    else:
+        if args.output is None:
+            sys.stdout.writelines(export_shifts(db, args.user_id, args.format or CSV))
+        else:
+            format = args.format or get_format(args.output)
+            with open(args.output, 'w', encoding='utf-8', newline='') as f:
+                f.writelines(export_shifts(db, args.user_id, format))
+
+
+if __name__ == '__main__':
+    main()
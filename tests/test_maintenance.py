@@ -0,0 +1,34 @@
+import sqlite3
+
+from benchmarks.datagen import DatasetSpec, generate
+from module.db.maintenance import compact
+
+
+def _get_pragma(database: str, name: str) -> int:
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute(f'PRAGMA {name}').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_compact_releases_free_pages(tmp_path):
+    database = str(tmp_path / 'shift.db')
+    generate(database, DatasetSpec(users=5, shifts_per_user=500))
+
+    # 初回は全体をVACUUMして増分VACUUMを有効にする
+    report = compact(database, archive_database=str(tmp_path / 'archive.db'))
+    assert report.archived_shifts > 0
+    assert _get_pragma(database, 'auto_vacuum') == 2
+    assert _get_pragma(database, 'freelist_count') == 0
+
+    # 2回目以降は増分VACUUMで空きページを解放する
+    conn = sqlite3.connect(database)
+    conn.execute('UPDATE shifts SET is_valid = 0 WHERE user_id <= 3')
+    conn.commit()
+    conn.close()
+
+    report = compact(database, archive_database=str(tmp_path / 'archive.db'))
+    assert report.archived_shifts > 0
+    assert report.reclaimed_bytes > 0
+    assert _get_pragma(database, 'freelist_count') == 0
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from benchmarks.datagen import DatasetSpec, generate
+
+
+START = datetime(2020, 1, 1)
+END = datetime(2020, 2, 1)
+
+
+def test_place_schedule_hides_other_users(tmp_path):
+    db = generate(str(tmp_path / 'shift.db'), DatasetSpec(users=4, shifts_per_user=100))
+    place = db.get_places(1)[0]
+
+    details = db.get_place_schedule(1, place, START, END, include_details=True)
+    schedule = db.get_place_schedule(1, place, START, END)
+    assert len(details) == len(schedule) > 0
+
+    other_user_ids = {shift['user_id'] for shift in details} - {1}
+    assert other_user_ids
+    for detail, shift in zip(details, schedule):
+        if detail['user_id'] == 1:
+            assert shift == detail
+        else:
+            assert shift['user_id'] not in other_user_ids
+            assert shift['username'] is None
+            assert shift['amount'] is None
+
+    # ラベルは同じユーザーのシフト同士で一致し、ユーザーの数は変わらない
+    labels = {}
+    for detail, shift in zip(details, schedule):
+        assert labels.setdefault(detail['user_id'], shift['user_id']) == shift['user_id']
+    assert len(set(labels.values())) == len(labels)
+
+
+def test_place_schedule_requires_registered_place(tmp_path):
+    db = generate(str(tmp_path / 'shift.db'), DatasetSpec(users=2, shifts_per_user=10))
+    assert db.get_place_schedule(1, '登録していない勤務先', START, END) == []